@@ -0,0 +1,181 @@
+'''Module with an exact search for the best mapping between two DRSs (-search exact)
+   Does a depth-first branch-and-bound over the candidate mappings of compute_pool, starting from the mapping found
+   by hill-climbing, and prunes each branch that can not get more matching clauses than the best mapping so far'''
+
+
+class DRS_bound:
+	'''Keeps track of which clause matches are still possible, given the produced variables we already decided on.
+	   A clause match is dead if one of its node pairs can not be in the mapping anymore: the produced variable was
+	   mapped to another gold variable, or the gold variable is already used. Each produced clause and each gold clause
+	   can only match once, so the number of matching clauses can never be higher than the minimum of the number of
+	   produced and gold clauses that still have a clause match that is alive'''
+	def __init__(self, search):
+		self.search = search
+		self.pool = search.pool
+		self.num_vars = self.pool.num_vars
+		self.dead = [0] * len(self.pool.match_pairs)
+		self.prod_alive = [0] * len(self.pool.prod_used)
+		self.gold_alive = [0] * len(self.pool.gold_used)
+		for idx, pairs in enumerate(self.pool.match_pairs):
+			# Matches that need a variable to map to two variables can never be satisfied
+			if len(set(p // self.num_vars for p in pairs)) != len(pairs) or len(set(p % self.num_vars for p in pairs)) != len(pairs):
+				self.dead[idx] = 1
+			else:
+				self.prod_alive[self.pool.match_prod[idx]] += 1
+				self.gold_alive[self.pool.match_gold[idx]] += 1
+		# Node pairs per produced and gold variable that are part of a clause match, the others we can ignore
+		self.prod_pairs = [[] for _ in search.candidates]
+		self.gold_pairs = [[] for _ in range(self.num_vars)]
+		for pair_idx in sorted(set(p for pairs in self.pool.match_pairs for p in pairs)):
+			self.prod_pairs[pair_idx // self.num_vars].append(pair_idx)
+			self.gold_pairs[pair_idx % self.num_vars].append(pair_idx)
+		self.alive = set(idx for idx, dead in enumerate(self.dead) if not dead)
+		self.num_prod_alive = len([x for x in self.prod_alive if x])
+		self.num_gold_alive = len([x for x in self.gold_alive if x])
+
+	def set_order(self, order):
+		'''Save for each clause match the node pair of the variable that is decided last, given the variable order'''
+		position = [0] * len(order)
+		for pos, i in enumerate(order):
+			position[i] = pos
+		self.match_last = []
+		for pairs in self.pool.match_pairs:
+			last = max(pairs, key=lambda p: position[p // self.num_vars])
+			self.match_last.append((position[last // self.num_vars], last))
+		# A produced clause matches at most once within a group, so we count the different (group, produced clause) keys
+		self.match_key = [(group, prod_idx) for group, prod_idx in zip(self.pool.match_group, self.pool.match_prod)]
+
+	def bound(self, depth=None):
+		'''Upper bound on the number of matching clauses for all mappings in the current branch. If we know the
+		   depth in the search tree, we also use that each undecided variable can only map to a single gold variable:
+		   the clause matches that are completed by that variable can only come from one of its node pairs'''
+		bound = min(self.num_prod_alive, self.num_gold_alive)
+		if depth is None:
+			return bound
+		decided, undecided = set(), {}
+		for idx in self.alive:
+			pos, pair_idx = self.match_last[idx]
+			if pos < depth:
+				decided.add(self.match_key[idx])
+			else:
+				undecided.setdefault(pos, {}).setdefault(pair_idx, set()).add(self.match_key[idx])
+		# Keys that already match do not count again for the undecided variables
+		return min(bound, len(decided) + sum(max(len(keys - decided) for keys in pairs.values()) for pairs in undecided.values()))
+
+	def update_alive(self, idx, change):
+		'''Clause match idx became alive (change = 1) or dead (change = -1)'''
+		prod_idx, gold_idx = self.pool.match_prod[idx], self.pool.match_gold[idx]
+		self.prod_alive[prod_idx] += change
+		self.gold_alive[gold_idx] += change
+		if change == 1:
+			self.alive.add(idx)
+		else:
+			self.alive.discard(idx)
+		# The number of clauses that are alive only changes if a clause gets its first or loses its last match
+		if self.prod_alive[prod_idx] == (change == 1):
+			self.num_prod_alive += change
+		if self.gold_alive[gold_idx] == (change == 1):
+			self.num_gold_alive += change
+
+	def kill_pair(self, pair_idx, change):
+		'''Mark the clause matches of a node pair as dead (change = 1) or undo that (change = -1)'''
+		pool = self.pool
+		for idx in pool.pair_matches[pool.pair_match_start[pair_idx]:pool.pair_match_start[pair_idx + 1]]:
+			self.dead[idx] += change
+			if self.dead[idx] == (change == 1):
+				self.update_alive(idx, -change)
+
+	def decide(self, i, m, change):
+		'''Decide that produced variable i maps to m (-1 for no mapping): all other node pairs of i and all other node
+		   pairs with m become impossible. With change = -1 we undo this decision'''
+		pair_idx = i * self.num_vars + m
+		for other in self.prod_pairs[i]:
+			if other != pair_idx:
+				self.kill_pair(other, change)
+		if m != -1:
+			for other in self.gold_pairs[m]:
+				if other != pair_idx:
+					self.kill_pair(other, change)
+
+
+def get_variable_order(search):
+	'''Decide on the variable that is in the most clause matches first, ties broken by fewest candidates. After that,
+	   we prefer variables that complete the most clause matches, so that the bound gets tight early in the search'''
+	num_vars = search.num_vars
+	num_prod_vars = len(search.candidates)
+	match_vars = [set(p // num_vars for p in pairs) for pairs in search.pool.match_pairs]
+	var_matches = [[] for _ in range(num_prod_vars)]
+	for idx, prod_vars in enumerate(match_vars):
+		for i in prod_vars:
+			var_matches[i].append(idx)
+	open_vars = [len(prod_vars) for prod_vars in match_vars]
+	order, done = [], [False] * num_prod_vars
+	for _ in range(num_prod_vars):
+		i = min([i for i in range(num_prod_vars) if not done[i]], key=lambda i: (
+				-len([idx for idx in var_matches[i] if open_vars[idx] == 1]),
+				-len([idx for idx in var_matches[i] if open_vars[idx] < len(match_vars[idx])]),
+				-len(var_matches[i]), len(search.candidates[i]), i))
+		order.append(i)
+		done[i] = True
+		for idx in var_matches[i]:
+			open_vars[idx] -= 1
+	return order
+
+
+def branch_and_bound(search, best_mapping, best_match_num, max_nodes=0, deadline=None):
+	"""
+	Find the mapping with the highest number of matching clauses with a depth-first branch-and-bound search
+	Arguments:
+		search: DRS_search object of the DRS pair
+		best_mapping: best mapping we already found (e.g. by hill-climbing), used to prune and to order the branches
+		best_match_num: number of matching clauses of best_mapping
+		max_nodes: stop the search after visiting this many nodes (0 means no maximum)
+		deadline: Search_deadline of the time budget of the DRS pair, we stop the search when it passed (None means no budget)
+	Returns:
+		best_mapping: mapping with the highest number of matching clauses we found
+		best_match_num: the number of matching clauses of that mapping
+		optimal: whether we searched the full tree, i.e. best_mapping is guaranteed to be optimal
+		nodes: number of nodes in the search tree we visited
+	"""
+	pool = search.pool
+	num_vars = pool.num_vars
+	bounder = DRS_bound(search)
+	search.set_mapping([-1] * len(search.candidates))
+	order = get_variable_order(search)
+	bounder.set_order(order)
+	# Try the value of the best mapping first, then the candidates that are in the most clause matches, no mapping last
+	pair_count = lambda i, m: pool.pair_match_start[i * num_vars + m + 1] - pool.pair_match_start[i * num_vars + m]
+	values = []
+	for i in range(len(search.candidates)):
+		cands = sorted(search.candidates[i], key=lambda m: (m != best_mapping[i], -pair_count(i, m), m))
+		values.append(cands + [-1] if best_mapping[i] != -1 else [-1] + cands)
+	best = [list(best_mapping), best_match_num, 0, False]
+
+	def expand(depth):
+		best[2] += 1
+		# Checking the time for every node is too expensive, so we check every 64 nodes
+		if deadline is not None and best[2] % 64 == 0 and deadline.check():
+			best[3] = True
+		# Mapping more variables never loses matching clauses, so each partial mapping is also a valid mapping
+		if search.match_num > best[1]:
+			best[0], best[1] = search.mapping[:], search.match_num
+		if depth == len(order):
+			return
+		i = order[depth]
+		for m in values[i]:
+			if (max_nodes and best[2] >= max_nodes) or best[3]:
+				return
+			if m != -1 and search.inverse[m] != -1:
+				continue
+			bounder.decide(i, m, 1)
+			if bounder.bound() > best[1] and bounder.bound(depth + 1) > best[1]:
+				if m != -1:
+					search.set_pair(i, m)
+				expand(depth + 1)
+				if m != -1:
+					search.unset_pair(i, m)
+			bounder.decide(i, m, -1)
+
+	if bounder.bound() > best_match_num:
+		expand(0)
+	return best[0], best[1], (not max_nodes or best[2] < max_nodes) and not best[3], best[2]
@@ -0,0 +1,84 @@
+'''Module with the parser for files with clausal forms (DRSs in clause format), shared by counter.py,
+   clf_referee.py and contrast_clfs.py. Clausal forms are separated by empty lines, % starts a comment.
+   Each clausal form is parsed to a Clf object with the clauses as tuples of interned strings, the original lines,
+   the alignment comment of each clause and, if the comments contain them, the raw text and the sentence ID'''
+
+import io
+import re
+
+try:
+	from sys import intern
+except ImportError:
+	# Python 2 can only intern byte strings, so use a dictionary of symbols instead
+	symbols = {}
+	intern = lambda symbol: symbols.setdefault(symbol, symbol)
+
+SENT_ID = re.compile(r'% Sentence: (\d+)')
+RAW_SENT = re.compile(r'% Raw sent: (.+)')
+
+
+class Clf:
+	'''A single clausal form as read from a file
+	   clauses    : list of clauses, each clause is a tuple of interned strings, e.g. ('b1', 'REF', 'x1')
+	   original   : the original lines of the clauses
+	   alignments : the comment after each clause, usually the aligned tokens, e.g. 'Tom [0...3]'
+	   raw        : the raw text from a "% Raw sent:" comment, or else the last %%% comment before the clauses
+	   sent_id    : the ID from a "% Sentence:" comment
+	   num        : the number of the clausal form in the file (starting at 1)'''
+	def __init__(self, clauses, original, alignments, raw=None, sent_id=None, num=None):
+		self.clauses = clauses
+		self.original = original
+		self.alignments = alignments
+		self.raw = raw
+		self.sent_id = sent_id
+		self.num = num
+
+
+def parse_block(lines, num=None):
+	'''Parse the lines of a single clausal form (without the newlines) to a Clf object'''
+	clauses, original, alignments = [], [], []
+	raw, sent_id, last_raw = None, None, None
+	for line in lines:
+		stripped = line.strip()
+		if not stripped:
+			continue
+		if stripped.startswith('%'):
+			match_sent, match_raw = SENT_ID.match(stripped), RAW_SENT.match(stripped)
+			if match_sent:
+				sent_id = int(match_sent.group(1))
+			elif match_raw:
+				raw = match_raw.group(1)
+			elif stripped.startswith('%%%') and not clauses:
+				last_raw = stripped[3:].strip()
+			continue
+		clause, _, alignment = line.partition(' %')
+		clauses.append(tuple(intern(item) for item in clause.split()))
+		original.append(line)
+		alignments.append(alignment.strip())
+	return Clf(clauses, original, alignments, raw if raw is not None else last_raw, sent_id, num)
+
+
+def read_clfs(file_name):
+	'''Generator that reads a file line by line and yields a Clf object for each clausal form'''
+	num, cur_lines, has_clause = 0, [], False
+	with io.open(file_name, 'r', encoding='utf-8') as in_f:
+		for line in in_f:
+			line = line.rstrip('\n')
+			if not line.strip():
+				if has_clause:  # newline, so the clausal form is finished
+					num += 1
+					yield parse_block(cur_lines, num)
+					cur_lines, has_clause = [], False
+				# Comments without clauses (e.g. the sentence ID) belong to the next clausal form
+			else:
+				cur_lines.append(line)
+				has_clause = has_clause or not line.strip().startswith('%')
+	if has_clause:  # no newline at the end, still add the clausal form
+		yield parse_block(cur_lines, num + 1)
+
+
+def read_indexed_clfs(drs_file, nums):
+	'''Generator that yields a Clf object for the clausal forms with numbers nums (starting at 0) of a DRS_file'''
+	for num in nums:
+		yield parse_block(drs_file.get_lines(num), num + 1)
+
@@ -16,6 +16,8 @@ import argparse
 import re
 import yaml
 from collections import Counter
+from clf_parser import read_clfs, read_indexed_clfs
+from drs_index import DRS_file
 
 
 #################################
@@ -35,10 +37,30 @@ def parse_arguments():
         help='If added, this contains a file with all allowed roles\
               otherwise a simple signature is used that\
               mainly recognizes operators based on their formatting')
+    parser.add_argument(
+    '-ids', '--drs_ids', nargs='+', type=int, default=[],
+        help='Only validate the clausal forms with these numbers (starting at 1),\
+              read directly from the file with its offset index')
     args = parser.parse_args()
+    if args.drs_ids:
+        check_drs_ids(parser, args)
     return args
 
 
+def check_drs_ids(parser, args):
+    '''Check that the clausal forms of -ids exist in the file'''
+    if any(num < 1 for num in args.drs_ids):
+        parser.error('Clausal form numbers for -ids start at 1')
+    drs_file = DRS_file(args.src)
+    try:
+        num_clfs = len(drs_file)
+    finally:
+        drs_file.close()
+    if max(args.drs_ids) > num_clfs:
+        parser.error('Clausal form number {} of -ids does not exist, {} contains {} clausal forms'.format(
+            max(args.drs_ids), args.src, num_clfs))
+
+
 #################################
 def check_clf(clf, signature, v=0):
     '''checks well-formedness of a clausal form
@@ -202,45 +224,33 @@ def operator_type_default(op, args, v=0):
 
 #################################
 #################################
-def file_to_clfs(filepath, v=0):
+def file_to_clfs(filepath, v=0, ids=None):
     '''reads a file with raw text and clausal forms inside it and
-       returns a list of clausal forms and a list of raws.
+       returns a list of clausal forms, a list of raws and a list of their
+       numbers in the file (starting at 1).
        Each clausal form is a list of clauses/tuples.
        An empty line is a separator of clausal forms
+       If ids are given, only the clausal forms with those numbers (starting at 1)
+       are read, directly from the file with its offset index
     '''
+    if ids:
+        drs_file = DRS_file(filepath)
+        try:
+            parsed = list(read_indexed_clfs(drs_file, [i - 1 for i in ids]))
+        finally:
+            drs_file.close()
+    else:
+        parsed = list(read_clfs(filepath))
     list_of_clf = []
     list_of_raw = []
-    clf = []
-    with codecs.open(filepath, 'r', encoding='UTF-8') as f:
-        pre_line = '' # saves previous line
-        for i, line in enumerate(f):
-            # when the line is a comment ignore,
-            # but if its previous line contains a raw text, then save it
-            if line.startswith("%"):
-                # save the last line starting with %%%, it can be a raw text
-                if line.startswith("%%%"):
-                    pre_line = line
-                continue
-            if not line.strip(): # clf separator
-                if clf: # add only non-empty clf
-                    list_of_clf.append(clf)
-                    list_of_raw.append(pre_line[3:].strip())
-                    assert len(list_of_clf) == len(list_of_raw),\
-                        "Number of clfs ({}) and raws ({}) do not match: {} vs {}".format(
-                            len(list_of_clf), len(list_of_raw),
-                            list_of_raw[-1], pr_clf(list_of_clf[-1]))
-                    clf = []
-                continue
-            # remove % comments if any
-            line = line.split(' %', 1)[0].strip()
-            if v >= 5: print("/{}/".format(line))
-            clause = tuple(line.split(' '))
-            if len(clause) > 1: #remove lines that are comments and started with whitespace
-                clf.append(clause)
-    if clf: # add last clf
-        list_of_clf.append(clf)
-        list_of_raw.append(pre_line[3:].strip())
-    return (list_of_clf, list_of_raw)
+    list_of_num = []
+    for clf in parsed:
+        if v >= 5:
+            for clause in clf.clauses: print("/{}/".format(' '.join(clause)))
+        list_of_clf.append(clf.clauses)
+        list_of_raw.append(clf.raw or '')
+        list_of_num.append(clf.num)
+    return (list_of_clf, list_of_raw, list_of_num)
 
 #################################
 def report_error(message, v=0):
@@ -635,7 +645,7 @@ if __name__ == '__main__':
     args = parse_arguments()
 
     # read clausal forms and raw from the file
-    (clfs, raws) = file_to_clfs(args.src, v=args.v)
+    (clfs, raws, nums) = file_to_clfs(args.src, v=args.v, ids=args.drs_ids)
     assert len(clfs) == len(raws),\
         'clfs ({}) and raws ({}) do not match'.format(len(clfs), len(raws))
     total = len(clfs)
@@ -652,9 +662,9 @@ if __name__ == '__main__':
     op_type_counter = Counter() # counts operator types. Used for clf stats
 
     # clfs = [ clf for clf in clfs if len(clf) > 30 ]  # ignore long CLFs for debugging purpose
-    for (i, clf) in enumerate(clfs, start=1):
-        counter_prog(i, v=args.v)
-        if args.v >= 2 and raws: print(' "{}"'.format(raws[i-1]))
+    for (num, clf, raw) in zip(nums, clfs, raws):
+        counter_prog(num, v=args.v)
+        if args.v >= 2 and raws: print(' "{}"'.format(raw))
         try:
             (box_dict, subs, _, op_types) = check_clf(clf, signature, v=args.v)
             op_type_counter.update(op_types)
@@ -666,7 +676,7 @@ if __name__ == '__main__':
                 error_counter.update([str(e)])
             print(e)
             if args.v >= 1:
-                if raws: print(' "{}"'.format(raws[i-1]))
+                if raws: print(' "{}"'.format(raw))
                 print("In the CLF:\n{}".format(pr_clf(clf)))
     if args.v>=1: print("Done")
     error_total = sum(error_counter.values())
@@ -13,6 +13,7 @@ contact: Lasha.Abzianidze@gmail.com
 
 from __future__ import unicode_literals
 from clf_referee import check_clf, get_signature, pr_clf, clf_typing
+from clf_parser import read_clfs
 import codecs
 import argparse
 import re
@@ -55,60 +56,16 @@ def file_to_clf_dict(filepath, v=0):
        % starts comments.
     '''
     clf_dict = dict()
-    clf = []
-    count = 0 # for files that doesn't have explicit sentence IDs
-    pos_raw = '' # possible raw text that is expected to start with %%%
-    with codecs.open(filepath, 'r', encoding='UTF-8') as f:
-        for line in f:
-            line = line.strip()
-            # when the line is a commnet. Comments sometimes may include sentence ID and raw text 
-            if line.startswith("%"):
-                m_sen = re.match('% Sentence: (\d+)', line)
-                if m_sen:
-                    clf_id = int(m_sen.group(1))
-                    continue
-                m_raw = re.match('% Raw sent: (.+)', line)
-                if m_raw:
-                    raw = m_raw.group(1) 
-                if line.startswith("%%%"): pos_raw = line # save possibly raw text for possible later usage
-                continue
-            # when empty line is met -- a clf seperator
-            if not line.strip():
-                if clf: # if non-empty clf
-                    try: raw
-                    except NameError, UnboundLocalError: raw = None
-                    try: clf_id
-                    except NameError, UnboundLocalError: clf_id = count
-                    #print clf_id, type(clf_id)
-                    clf_dict[clf_id] = (raw, clf)
-                    clf = []
-                    del clf_id, raw 
-                    count += 1
-                continue
+    for (count, parsed) in enumerate(read_clfs(filepath)):
+        clf = []
+        for (clause, line) in zip(parsed.clauses, parsed.original):
             # an empty CLFs, system couldnt produce CLF
             if line.find('WARNING: empty') != -1:
-                clf.append(tuple('No CLF was generated'.split()))
-                continue
-            # detect non-explicitly mentioned raw text as the last %%% comment
-            if pos_raw.startswith("%%% ") and not clf and 'raw' not in locals(): # avoid rewriting 'Raw sent'
-                raw = pos_raw[4:].strip()
-            if line.startswith("%%%"): pos_raw = line # save possibly raw text for possible later usage  
-            # processing a clause
-            # remove % comments if any
-            clause = line.split(' %', 1)[0].strip()
-            if v >= 5: print "/{}/".format(clause)
-            clause = tuple(clause.split(' '))
+                clause = tuple('No CLF was generated'.split())
+            if v >= 5: print "/{}/".format(' '.join(clause))
             clf.append(clause)
-    if clf: # add last clf
-        try: raw
-        except NameError, UnboundLocalError: raw = None
-        try: clf_id
-        except NameError, UnboundLocalError: clf_id = count
-        clf_dict[clf_id] = (raw, clf)
-    #if v >= 0:
-    #    for clf in list_of_clf:
-    #        pr_clf(clf)
-    #        print
+        clf_id = parsed.sent_id if parsed.sent_id is not None else count
+        clf_dict[clf_id] = (parsed.raw, clf)
     return clf_dict 
 
 
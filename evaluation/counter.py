@@ -10,14 +10,42 @@ single line, with DRSs separated by a newline. Lines starting with '%' are ignor
 
 Command line options:
 
--f1   : First file with DRS clauses, usually produced file
+-f1   : First file with DRS clauses, usually produced file. With multiple files, each of them is evaluated against -f2
+		and we print a table with the scores of each file
+-sys  : File with systems to evaluate against -f2 (one per line, optionally 'name<TAB>file'), can be combined with -f1
 -f2   : Second file with DRS clauses, usually gold file
+		Both files can also be pre-parsed files in the binary format of drs_corpus.py, which saves parsing and validating them
 -r    : Number of restarts used (default 20)
 -p    : Number of parallel threads to use (default 1)
--mem  : Memory limit per parallel thread (default 1G)
+-restart_parallel: Number of processes for the restarts of a single large DRS pair (default 1), the result is the same as with a
+		single process. It forks this process, so it can not be combined with -p
+-restart_parallel_min: Only spread the restarts of DRS pairs with at least this estimated search cost (default 100000, the largest
+		sentences of the PMB are below 5000)
+-mem  : Memory budget for saved mapping scores per parallel thread (default 1G), least recently used scores are removed first
+-keep_max: Maximum number of preprocessed DRSs and of candidate pools we keep per process for -runs, -restart_budget, multiple systems
+		and the scoring API (default 10000, 0 means no maximum), least recently used ones are removed first
 -s    : What kind of smart initial mapping we use:
 	  -no    No smart mappings
 	  -conc  Smart mapping based on matching concepts (their match is likely to be in the optimal mapping)
+-engine: Engine for computing the hill-climbing gains: python (default) or numpy (faster for large DRSs, same results)
+-seed : Seed for the random restarts (default no seed). The search of each DRS pair is seeded with the seed, the run and the number of the pair,
+		so the results are the same for any number of processes (-p)
+-cache: SQLite file that saves the search results per DRS pair, so that re-evaluating only searches the pairs that changed
+-cache_max: Maximum number of search results of DRS pairs we keep in memory (default 50000, 0 means no maximum), older results are
+		read back from the -cache file
+-search: Search method for the best mapping: hill (hill-climbing with restarts, default), exact (branch-and-bound, always finds the optimal mapping),
+		anneal (simulated annealing before the hill-climbing of each restart) or tabu (tabu search before the hill-climbing of each restart)
+-anneal_start, -anneal_end, -anneal_steps: Cooling schedule of -search anneal: temperature of the first and the last step and the number of steps
+		(default 0.5, 0.05 and 200 steps per variable of the produced DRS)
+-tabu_tenure, -tabu_iters: Number of iterations a node pair stays tabu and number of iterations without a better mapping before -search tabu stops
+-exact_max_vars: Use hill-climbing instead of -search exact for produced DRSs with more variables than this (default 50, 0 means no maximum)
+-exact_max_nodes: Stop the -search exact branch-and-bound after this many nodes and continue with hill-climbing (default 10000, 0 means no maximum)
+-max_time: Time budget in seconds for the search of each DRS pair (default 0, no budget). If it is used up we keep the best mapping so far
+		and count the DRS pair as budget-limited, instead of skipping large DRSs with -m
+-patience: Stop the restarts of a DRS pair after this many restarts in a row did not find a better mapping (default 0, do all restarts)
+-patience_seen: Stop the restarts of a DRS pair after this many restarts in a row ended in a local optimum we already found (default 0, do all restarts)
+-restart_budget: Total number of restarts for all DRS pairs together. Each pair first gets -r restarts (use a small -r), the restarts that
+		are left go to the DRS pairs that are furthest from their upper bound, usually the large DRSs (default 0, -r restarts per pair)
 -runs : Number of runs to average over, if you want a more reliable result (there is randomness involved in the initial restarts)
 -prin : Print more specific output, such as individual (average) F-scores for the smart initial mappings, and the matching and non-matching clauses
 -sig  : Number of significant digits to output (default 4)
@@ -37,6 +65,8 @@ Command line options:
 -dc   : Change all concepts to a default concept
 -ill  : What to do with ill-formed DRSs. Throw an error (default), input dummy/SPAR DRS or try to output a score anyway (unofficial!)
 -coda : For the CodaLab usage. Given a 'name', the script creates 'name.txt' and 'name.html' files
+-ids  : Only score the DRSs with these numbers (starting at 1), they are read directly from the files with a byte-offset index
+-index_dir: Directory in which we save the byte-offset indexes of -ids, so that they are only built once per file (default: not saved)
 """
 
 import os
@@ -48,6 +78,12 @@ import sys
 import multiprocessing
 from multiprocessing import Pool
 import json #reading in dict
+from collections import Counter, OrderedDict
+from itertools import chain, islice
+try:
+	from itertools import zip_longest
+except ImportError:
+	from itertools import izip_longest as zip_longest
 
 try:
 	import cPickle as pickle
@@ -63,8 +99,6 @@ try:
 except:
 	pass
 
-import psutil  # for memory usage
-
 # Imports for the hillclimbing algorithm
 from hill_climbing import *
 # Imports for format checking
@@ -74,25 +108,71 @@ from clf_referee import get_signature
 from html_results import coda_html
 # Import utils
 from utils_counter import *
+from score_cache import Score_cache
+from drs_index import DRS_file
+from drs_corpus import DRS_corpus, is_corpus_file
+from clf_parser import intern, parse_block, read_clfs
 
 
-def build_arg_parser():
-	parser = argparse.ArgumentParser(description="Counter calculator -- arguments")
+def create_arg_parser(description="Counter calculator -- arguments", with_files=True):
+	'''Parser with the options of Counter, without the file arguments (-f1, -f2, -sys) if with_files is False'''
+	parser = argparse.ArgumentParser(description=description)
 	# Main arguments
-	parser.add_argument('-f1', required=True, type=str,
-						help='First file with DRS clauses, DRSs need to be separated by blank line')
-	parser.add_argument('-f2', required=True, type=str,
-						help='Second file with DRS clauses, DRSs need to be separated by blank line')
+	if with_files:
+		parser.add_argument('-f1', nargs='+', default=[],
+							help='First file with DRS clauses, DRSs need to be separated by blank line. If we add multiple files, each of them is evaluated against -f2')
+		parser.add_argument('-sys', '--systems_file', default='',
+							help='File with systems to evaluate against -f2, one per line: a file with DRS clauses, optionally preceded by a name and a tab')
+		parser.add_argument('-f2', required=True, type=str,
+							help='Second file with DRS clauses, DRSs need to be separated by blank line')
 
 	# Optimization (memory, speed, restarts, initial mappings)
 	parser.add_argument('-r', '--restarts', type=int,
 						default=20, help='Restart number (default: 20)')
 	parser.add_argument('-p', '--parallel', type=int, default=1,
 						help='Number of parallel threads we use (default 1)')
+	parser.add_argument('-restart_parallel', type=int, default=1,
+						help='Number of processes for the random restarts of a single large DRS pair, the result is the same as with a single process. Useful for large documents, can not be combined with -p (default 1)')
+	parser.add_argument('-restart_parallel_min', type=int, default=100000,
+						help='Only use -restart_parallel for DRS pairs with at least this estimated search cost: the number of clauses times the number of node pairs (default 100000)')
 	parser.add_argument('-mem', '--mem_limit', type=int, default=1000,
-						help='Memory limit in MBs (default 1000 -> 1G). Note that this is per parallel thread! If you use -par 4, each thread gets 1000 MB with default settings.')
+						help='Memory budget in MBs for saving the scores of mappings we already did (default 1000 -> 1G). If the budget is exceeded, the least recently used scores are removed. Note that this is per parallel thread!')
+	parser.add_argument('-keep_max', type=int, default=10000,
+						help='Maximum number of preprocessed DRSs and of candidate pools we keep per process, to reuse them in other runs, for the restart budget, for other systems or in the scoring API. If there are more, the least recently used ones are removed (default 10000, 0 means no maximum)')
 	parser.add_argument('-s', '--smart', default='conc', action='store', choices=[
 						'no', 'conc'], help='What kind of smart mapping do we use (default concepts)')
+	parser.add_argument('-engine', default='python', choices=['python', 'numpy'],
+						help='Engine for computing the gains in the hill-climbing. NumPy is faster for DRSs with a lot of variables, results are the same (default python)')
+	parser.add_argument('-seed', type=int, default=None,
+						help='Seed for the random restarts, so that runs can be reproduced. The search of each DRS pair gets its own seed, based on this seed, the run and the number of the pair, so the results are the same for any -p (default no seed)')
+	parser.add_argument('-cache', default='',
+						help='SQLite file in which we save the search results of DRS pairs, so that pairs we scored before (with the same options) do not have to be searched again (default no cache)')
+	parser.add_argument('-cache_max', type=int, default=50000,
+						help='Maximum number of search results of DRS pairs we keep in memory, the least recently used ones are removed first. With -cache they are read back from the SQLite file (default 50000, 0 means no maximum)')
+	parser.add_argument('-search', default='hill', choices=['hill', 'exact', 'anneal', 'tabu'],
+						help='Search for the best mapping with hill-climbing and restarts, or exact with branch-and-bound. Exact search finds the optimal mapping and is deterministic, but can be slow for large DRSs. Anneal and tabu do simulated annealing or tabu search before the hill-climbing of each restart, so that fewer restarts are needed for large DRSs (default hill)')
+	parser.add_argument('-anneal_start', type=float, default=0.5,
+						help='For -search anneal: temperature of the first step, a step that loses a matching clause is done with probability exp(-1 / temperature) (default 0.5)')
+	parser.add_argument('-anneal_end', type=float, default=0.05,
+						help='For -search anneal: temperature of the last step, the temperature cools down geometrically (default 0.05)')
+	parser.add_argument('-anneal_steps', type=int, default=0,
+						help='For -search anneal: number of steps per restart (default 0 means 200 steps per variable of the produced DRS)')
+	parser.add_argument('-tabu_tenure', type=int, default=10,
+						help='For -search tabu: number of iterations in which a produced variable can not get back its old gold variable (default 10)')
+	parser.add_argument('-tabu_iters', type=int, default=20,
+						help='For -search tabu: stop after this many iterations without a better mapping (default 20)')
+	parser.add_argument('-exact_max_vars', type=int, default=50,
+						help='For -search exact: fall back to hill-climbing for produced DRSs with more variables than this (default 50, 0 means no maximum)')
+	parser.add_argument('-exact_max_nodes', type=int, default=10000,
+						help='For -search exact: if the branch-and-bound visited this many nodes, keep its best mapping and continue with hill-climbing (default 10000, 0 means no maximum)')
+	parser.add_argument('-max_time', type=float, default=0,
+						help='Time budget in seconds for the search of a single DRS pair. If it is used up, we take the best mapping found so far and report the pair as budget-limited (default 0 means no budget)')
+	parser.add_argument('-patience', type=int, default=0,
+						help='Stop the restarts for a DRS pair after this many restarts in a row did not find a better mapping (default 0 means we always do all restarts)')
+	parser.add_argument('-patience_seen', type=int, default=0,
+						help='Stop the restarts for a DRS pair after this many restarts in a row ended in a local optimum we already found (default 0 means we always do all restarts)')
+	parser.add_argument('-restart_budget', type=int, default=0,
+						help='Total number of restarts for all DRS pairs. Each pair first gets -r restarts, the rest goes to the pairs whose matching clauses are furthest from their upper bound (default 0 means -r restarts for each pair)')
 
 	# Output settings (often not necessary to add or change), for example printing specific stats to a file, or to the screen
 	parser.add_argument('-prin', action='store_true',
@@ -137,19 +217,40 @@ def build_arg_parser():
 						help='Add a default concept + sense for all concept clauses (exclude effect of getting concepts correct)')
 	parser.add_argument('-ic', '--include_ref', action='store_true',
 						help='Include REF clauses when matching -- will inflate the scores')
+	parser.add_argument('-ids', '--drs_ids', nargs='+', type=int, default=[],
+						help='Only score the DRSs with these numbers (starting at 1), read directly from the files with their offset index')
+	parser.add_argument('-index_dir', default='',
+						help='Directory in which we save the offset indexes of the files for -ids, so that they are only built once per file (default: the indexes are not saved)')
+	return parser
+
+
+def build_arg_parser():
+	parser = create_arg_parser()
 	args = parser.parse_args()
+	# Only the scoring API keeps the gold DRSs of a single run (see counter_api.py)
+	args.keep_gold = False
+
+	# Get the systems we evaluate, -f1 is the file of the first one
+	args.systems = [(file_name, file_name) for file_name in args.f1]
+	if args.systems_file:
+		args.systems += read_systems_file(args.systems_file)
+	if not args.systems:
+		raise ValueError("Specify a file with -f1 or -sys")
+	args.f1 = args.systems[0][1]
 
 	# Check if files exist
-	if not os.path.exists(args.f1):
-		raise ValueError("File for -f1 does not exist")
+	for _, file_name in args.systems:
+		if not os.path.exists(file_name):
+			raise ValueError("File for -f1 does not exist: {0}".format(file_name))
 	if not os.path.exists(args.f2):
 		raise ValueError("File for -f2 does not exist")
 
 	# Check if combination of arguments is valid
 	if args.ms and args.runs > 1:
 		raise NotImplementedError("Not implemented to average over individual scores, only use -ms when doing a single run")
-	if args.restarts < 1:
-		raise ValueError('Number of restarts must be larger than 0')
+	check_search_options(args)
+	if args.restart_budget and (args.ms or args.stats):
+		raise NotImplementedError('-restart_budget does not work with -ms and -st, since they use the results of the first restarts')
 
 	if args.ms and args.parallel > 1:
 		print('WARNING: using -ms and -p > 1 messes up printing to screen - not recommended')
@@ -162,99 +263,195 @@ def build_arg_parser():
 		print ('WARNING: ill-formed DRSs are given a score as if they were valid -- results in unofficial F-scores')
 		time.sleep(3)
 
+	if args.cache and args.runs > 1:
+		raise ValueError('Using -cache with -runs > 1 makes no sense, all runs would get the same result')
+
 	if args.runs > 1 and args.prin:
 		print('WARNING: we do not print specific information (-prin) for runs > 1, only final averages')
 		time.sleep(5)
 
 	if args.partial:
 		raise NotImplementedError('Partial matching currently does not work')
+	if len(args.systems) > 1 and (args.baseline or args.ms or args.ms_file or args.stats or args.codalab or args.detailed_stats):
+		raise NotImplementedError('Evaluating multiple systems only prints a table with their scores, it does not work with -b, -ms, -ms_file, -st, -coda or -ds')
+	if args.drs_ids:
+		check_drs_ids(parser, args)
 	return args
 
 
-def remove_refs(clause_list, original_clauses):
-	'''Remove unneccessary/redundant b REF x clauses, only keep them if x never occurs again in the same box'''
+def check_drs_ids(parser, args):
+	'''Check that the DRSs of -ids exist in -f2 and in the -f1 files (not for the single DRS of -b)'''
+	if any(num < 1 for num in args.drs_ids):
+		parser.error('DRS numbers for -ids start at 1')
+	signature = get_signature(args.sig_file)
+	for file_name in [args.f2] + ([] if args.baseline else [file_name for _, file_name in args.systems]):
+		drs_file = open_drs_file(file_name, signature, args.index_dir)
+		num_drss = len(drs_file)
+		drs_file.close()
+		if max(args.drs_ids) > num_drss:
+			parser.error('DRS number {0} of -ids does not exist, {1} contains {2} DRSs'.format(max(args.drs_ids), file_name, num_drss))
+
+
+def check_search_options(args):
+	'''Check the options of the search for the best mapping, also used by the scoring API'''
+	if args.restarts < 1:
+		raise ValueError('Number of restarts must be larger than 0')
+	if args.max_time < 0:
+		raise ValueError('Time budget for -max_time can not be negative')
+	if args.patience < 0 or args.patience_seen < 0:
+		raise ValueError('Number of restarts for -patience and -patience_seen can not be negative')
+	if args.restart_budget < 0:
+		raise ValueError('Number of restarts for -restart_budget can not be negative')
+	if args.keep_max < 0 or args.cache_max < 0:
+		raise ValueError('Maximum number of items for -keep_max and -cache_max can not be negative')
+	if args.restart_parallel < 1:
+		raise ValueError('Number of processes for -restart_parallel must be larger than 0')
+	if args.restart_parallel > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+		raise NotImplementedError('-restart_parallel shares the candidate pool with forked processes, which is not possible on this platform')
+	if args.restart_parallel > 1 and args.parallel > 1:
+		raise NotImplementedError('-restart_parallel forks this process, which is not safe while it has the worker pool of -p, use only one of them')
+	if not 0 < args.anneal_end <= args.anneal_start or args.anneal_steps < 0 or args.tabu_tenure < 0 or args.tabu_iters < 1:
+		raise ValueError('Invalid options for -search anneal or tabu: need 0 < -anneal_end <= -anneal_start, -anneal_steps >= 0, -tabu_tenure >= 0 and -tabu_iters >= 1')
+
+
+def read_systems_file(file_name):
+	'''Read the systems of a -sys file as (name, file) tuples. Empty lines and lines starting with # are skipped,
+	   relative paths are relative to the directory of the -sys file'''
+	systems = []
+	with codecs.open(file_name, 'r', encoding='utf-8') as in_f:
+		for line in in_f:
+			if not line.strip() or line.strip().startswith('#'):
+				continue
+			name, _, sys_file = line.rstrip('\n').rpartition('\t')
+			sys_file = os.path.join(os.path.dirname(file_name), sys_file.strip())
+			systems.append((name.strip() or sys_file, sys_file))
+	return systems
+
+
+def normalize_clauses(clauses, original, inv_boxes, include_ref):
+	'''Normalize the clauses of a single DRS in one pass: invert -Of relations, reorder inv_boxes if they contain a
+	   constant between quotes and remove unneccessary/redundant b REF x clauses, unless we want to include them'''
 	final_clauses, final_original = [], []
-	for tup_idx, tup_set in enumerate(clause_list):
-		cur_tup = []
-		cur_orig = []
-		for idx, spl_tup in enumerate(tup_set):
-			if spl_tup[1] == 'REF':
-				if not var_occurs(tup_set, spl_tup[2], spl_tup[0], idx):  # only add if the variable does not occur afterwards
-					cur_tup.append(spl_tup)
-					cur_orig.append(original_clauses[tup_idx][idx])
-			else:
-				cur_tup.append(spl_tup)
-				cur_orig.append(original_clauses[tup_idx][idx])
-		final_clauses.append(cur_tup)
-		final_original.append(cur_orig)
+	for idx, clause in enumerate(clauses):
+		# Only keep a REF clause if the variable does not occur again in the same box
+		if not include_ref and clause[1] == 'REF' and var_occurs(clauses, clause[2], clause[0], idx):
+			continue
+		if len(clause) == 4 and is_role(clause[1]) and clause[1].endswith('Of') and len(clause[1]) > 2:
+			# Switch clauses and remove the -Of
+			clause[2], clause[3] = clause[3], clause[2]
+			clause[1] = clause[1][:-2]
+		elif clause[1] in inv_boxes and len(clause) == 4 and between_quotes(clause[2]) and not between_quotes(clause[3]):
+			# b1 NEQ x1 x2 is equal to b1 NEQ x2 x1
+			# If one of the two arguments is between quotes, rewrite them in such a way
+			# that it can always match
+			# For example rewrite b1 NEQ "speaker" x1 to b1 NEQ x1 "speaker"
+			# If there are two variables or two items between quotes, do nothing
+			clause[2], clause[3] = clause[3], clause[2]
+		final_clauses.append(clause)
+		final_original.append(original[idx])
 	return final_clauses, final_original
 
 
-def get_clauses(file_name, signature, ill_type):
-	'''Function that returns a list of DRSs (that consists of clauses)'''
-	clause_list, original_clauses, cur_orig, cur_clauses = [], [], [], []
-
-	with open(file_name, 'r') as in_f:
-		input_lines = in_f.read().split('\n')
-		for idx, line in enumerate(input_lines):
-			if line.strip().startswith('%'):
-				pass  # skip comments
-			elif not line.strip():
-				if cur_clauses:  # newline, so DRS is finished, add to list. Ignore double/clause newlines
-					# First check if the DRS is valid, will error if invalid
-					try:
-						check_clf([tuple(c) for c in cur_clauses], signature, v=False)
-						clause_list.append(cur_clauses)
-						original_clauses.append(cur_orig)
-					except Exception as e:
-						if ill_type == 'error':
-							raise ValueError(e)
-						elif ill_type == 'dummy':
-							# FIXME: uncomment
-							print('WARNING: DRS {0} is ill-formed and replaced by a dummy DRS'.format(len(clause_list) +1))
-							clause_list.append(dummy_drs())
-							original_clauses.append([" ".join(x) for x in dummy_drs()])
-						elif ill_type == 'spar':
-							print('WARNING: DRS {0} is ill-formed and replaced by the SPAR DRS'.format(len(clause_list) +1))
-							clause_list.append(spar_drs())
-							original_clauses.append([" ".join(x) for x in spar_drs()])
-						elif ill_type == 'score':
-							print('WARNING: DRS {0} is ill-formed, but try to give a score anyway - might still error later'.format(len(clause_list) +1))
-
-							clause_list.append(cur_clauses)
-							original_clauses.append(cur_orig)
-				cur_clauses = []
-				cur_orig = []
-			else:
-				cur_clauses.append(line.split(' %', 1)[0].strip().split()) #remove comments
-				cur_orig.append(line)
+def warn_ill_drs(message, warn):
+	'''Print the warning about an ill-formed DRS if warn is True, or add it to warn if it is a list, so that the
+	   warnings of a file can be printed together (see print_warnings)'''
+	if isinstance(warn, list):
+		warn.append(message)
+	elif warn:
+		print(message)
+
+
+def print_warnings(warnings):
+	'''Print the warnings that were collected while reading a file and empty the list'''
+	for message in warnings:
+		print(message)
+	del warnings[:]
+
+
+def check_ill_drs(error, num_drs, ill_type, warn=True):
+	'''Decide what to do with ill-formed DRS number num_drs (starting at 1), given the error of check_clf
+	   Returns the clauses of the dummy or SPAR DRS that replaces it, or None if we still try to score it
+	   warn is True (print a warning), False (no warning) or a list to which we add the warning'''
+	if ill_type == 'error':
+		raise ValueError(error)
+	elif ill_type == 'dummy':
+		# FIXME: uncomment
+		warn_ill_drs('WARNING: DRS {0} is ill-formed and replaced by a dummy DRS'.format(num_drs), warn)
+		return dummy_drs()
+	elif ill_type == 'spar':
+		warn_ill_drs('WARNING: DRS {0} is ill-formed and replaced by the SPAR DRS'.format(num_drs), warn)
+		return spar_drs()
+	elif ill_type == 'score':
+		warn_ill_drs('WARNING: DRS {0} is ill-formed, but try to give a score anyway - might still error later'.format(num_drs), warn)
+	return None
+
+
+def parse_drs(clf, signature, ill_type, include_ref, inv_boxes, warn=True):
+	'''Return the normalized clauses and the original clauses of a DRS, given as a Clf object of clf_parser
+	   First check if the DRS is valid, what we do if it is invalid depends on ill_type'''
+	cur_clauses, cur_orig = [list(clause) for clause in clf.clauses], clf.original
+	try:
+		check_clf(clf.clauses, signature, v=False)
+	except Exception as e:
+		replacement = check_ill_drs(e, clf.num, ill_type, warn)
+		if replacement is not None:
+			cur_clauses, cur_orig = replacement, [" ".join(x) for x in replacement]
+	return normalize_clauses(cur_clauses, cur_orig, inv_boxes, include_ref)
+
+
+def load_drs(corpus, num, ill_type, include_ref, inv_boxes, warn=True):
+	'''Return the normalized clauses and the original clauses of DRS num (starting at 0) of a binary DRS_corpus,
+	   in which the DRSs are already validated and normalized'''
+	clauses, original, redundant, error = corpus.get(num)
+	if error is not None:
+		replacement = check_ill_drs(error, num + 1, ill_type, warn)
+		if replacement is not None:
+			return normalize_clauses(replacement, [" ".join(x) for x in replacement], inv_boxes, include_ref)
+	keep = [include_ref or not is_redundant for is_redundant in redundant]
+	return [list(clause) for clause, k in zip(clauses, keep) if k], [line for line, k in zip(original, keep) if k]
+
+
+def open_drs_file(file_name, signature, index_dir=''):
+	'''Open a file for random access to its DRSs: a DRS_corpus for files in the binary format, otherwise a DRS_file
+	   with its offset index, which is saved in index_dir if we give one (see drs_index.load_index)'''
+	return DRS_corpus(file_name, signature) if is_corpus_file(file_name) else DRS_file(file_name, index_dir)
+
+
+def read_drs(drs_file, num, signature, ill_type, include_ref, inv_boxes, warn=True):
+	'''Return the normalized clauses and the original clauses of DRS num (starting at 0) of a DRS_file or DRS_corpus'''
+	if isinstance(drs_file, DRS_corpus):
+		return load_drs(drs_file, num, ill_type, include_ref, inv_boxes, warn)
+	return parse_drs(parse_block(drs_file.get_lines(num), num + 1), signature, ill_type, include_ref, inv_boxes, warn)
+
+
+def read_clauses(file_name, signature, ill_type, include_ref=False, warn=True):
+	'''Generator that reads a file line by line and yields the normalized clauses and the original clauses of one DRS at a time
+	   The warnings about ill-formed DRSs are printed, or added to warn if it is a list (see check_ill_drs)'''
+	if is_corpus_file(file_name):
+		corpus = DRS_corpus(file_name, signature)
+		for clauses_orig in read_indexed_clauses(corpus, range(len(corpus)), signature, ill_type, include_ref, warn):
+			yield clauses_orig
+		return
+	inv_boxes = DRS(signature).inv_boxes
+	for clf in read_clfs(file_name):
+		yield parse_drs(clf, signature, ill_type, include_ref, inv_boxes, warn)
 
-	if cur_clauses:  # no newline at the end, still add the DRS
-		clause_list.append(cur_clauses)
-		original_clauses.append(cur_orig)
 
-	# Invert -of relations and reorder inv_boxes if they contain a constant between quotes
+def read_indexed_clauses(drs_file, nums, signature, ill_type, include_ref=False, warn=True):
+	'''Generator that yields the normalized clauses and the original clauses of the DRSs with numbers nums (starting at 0)
+	   of a DRS_file or DRS_corpus, which are read directly from the memory-mapped file'''
 	inv_boxes = DRS(signature).inv_boxes
-	for drs in clause_list:
-		for clause in drs:
-			if len(clause) == 4 and is_role(clause[1]) and clause[1].endswith('Of') and len(clause[1]) > 2:
-				# Switch clauses and remove the -Of
-				clause[2], clause[3] = clause[3], clause[2]
-				clause[1] = clause[1][:-2]
-			elif clause[1] in inv_boxes and len(clause) == 4 and between_quotes(clause[2]) and not between_quotes(clause[3]):
-				# b1 NEQ x1 x2 is equal to b1 NEQ x2 x1
-				# If one of the two arguments is between quotes, rewrite them in such a way
-				# that it can always match
-				# For example rewrite b1 NEQ "speaker" x1 to b1 NEQ x1 "speaker"
-				# If there are two variables or two items between quotes, do nothing
-				clause[2], clause[3] = clause[3], clause[2]
-
-	# If we want to include REF clauses we are done now
-	if args.include_ref:
-		return clause_list, original_clauses
-	else: #else remove redundant REF clauses
-		final_clauses, final_original = remove_refs(clause_list, original_clauses)
-		return final_clauses, final_original
+	for num in nums:
+		yield read_drs(drs_file, num, signature, ill_type, include_ref, inv_boxes, warn)
+
+
+def get_clauses(file_name, signature, ill_type, include_ref=False):
+	'''Function that returns a list of DRSs (that consists of clauses) and a list of their original clauses'''
+	clause_list, original_clauses = [], []
+	for clauses, original in read_clauses(file_name, signature, ill_type, include_ref):
+		clause_list.append(clauses)
+		original_clauses.append(original)
+	return clause_list, original_clauses
 
 
 def var_occurs(clauses, var, box, idx):
@@ -266,8 +463,23 @@ def var_occurs(clauses, var, box, idx):
 	return False
 
 
+# Rewritten concepts per (concept, sense), only valid for the sense dictionary they were looked up in
+concept_cache = {'sense_dict': None, 'rewrites': {}}
+
+
 def rewrite_concept(concept, sense, en_sense_dict):
-	'''Rewrite concepts to their WordNet 3.0 synset IDs'''
+	'''Rewrite concepts to their WordNet 3.0 synset IDs. The same concepts occur in many DRSs, so we keep the
+	   results per (concept, sense) for as long as we use the same sense dictionary'''
+	if concept_cache['sense_dict'] is not en_sense_dict:
+		concept_cache['sense_dict'], concept_cache['rewrites'] = en_sense_dict, {}
+	key = (concept, sense)
+	if key not in concept_cache['rewrites']:
+		concept_cache['rewrites'][key] = lookup_concept(concept, sense, en_sense_dict)
+	return concept_cache['rewrites'][key]
+
+
+def lookup_concept(concept, sense, en_sense_dict):
+	'''Look up the synset ID of a concept in the sense dictionary, see rewrite_concept'''
 	fixed_sense = sense.replace('"', '') #replace quotes
 	dict_key = concept + '.' + fixed_sense
 	if dict_key not in en_sense_dict: #not in WordNet, return original values
@@ -275,8 +487,8 @@ def rewrite_concept(concept, sense, en_sense_dict):
 	else:
 		conc_sense = en_sense_dict[dict_key]
 		# Now divide back again in concept + sense with quotes
-		new_concept = ".".join(conc_sense.split('.')[0:-2])
-		new_sense = '"' + ".".join(conc_sense.split('.')[-2:]) + '"'
+		new_concept = intern(".".join(conc_sense.split('.')[0:-2]))
+		new_sense = intern('"' + ".".join(conc_sense.split('.')[-2:]) + '"')
 		if dict_key == conc_sense: #nothing normalized after all
 			return new_concept, new_sense, []
 		else:
@@ -414,20 +626,58 @@ def get_mappings(clause_pairs, prod_drs, gold_drs, prec, rec, significant):
 	return print_match, print_no_match, match_division, idv_dict
 
 
-def get_matching_clauses(arg_list):
-	'''Function that gets matching clauses (easier to parallelize)'''
+# DRS objects and candidate pools of DRS pairs that we keep in this process, see get_drs and get_best_match
+preprocessed = {'drss': LRU_cache(), 'pools': LRU_cache()}
+
+
+def set_keep_max(max_size):
+	'''Set the maximum number of DRS objects and of candidate pools that we keep in this process (-keep_max)'''
+	preprocessed['drss'].max_size = preprocessed['pools'].max_size = max_size
+
+
+def keep_gold(args):
+	'''Whether we keep the gold DRSs after using them, because we need them again for other runs or systems,
+	   or for other calls of the scoring API'''
+	return args.runs > 1 or len(args.systems) > 1 or args.restart_budget > 0 or args.keep_gold
+
+
+def get_drs(clauses, prefix, file_name, original, en_sense_dict, signature, args, keep=False):
+	'''Create the DRS object of a list of clauses. If keep is True we save it, so that the next time we get the same
+	   clauses we do not have to preprocess them again'''
+	key = (prefix, args.default_concept, args.default_sense, args.default_role, tuple(tuple(clause) for clause in clauses))
+	if key in preprocessed['drss']:
+		drs = preprocessed['drss'][key]
+	else:
+		drs = DRS(signature)
+		drs.prefix = prefix
+		drs.get_specific_clauses(clauses, en_sense_dict, args)
+		if keep:
+			preprocessed['drss'][key] = drs
+	# The same clauses can come from different lines (e.g. other comments), so always set these
+	drs.file_name, drs.original_clauses = file_name, original
+	return drs
+
+
+def get_pair_rng(args, *keys):
+	'''Random number generator for the search of a single DRS pair. With -seed it is seeded with the seed and the keys
+	   (the run and the number of the pair), so that the result of a pair does not depend on the order in which the
+	   pairs are searched, or on the worker that searches it. Without -seed we use the random module'''
+	if args.seed is None:
+		return random
+	return random.Random(' '.join(str(key) for key in (args.seed,) + keys))
+
+
+def get_matching_clauses(arg_list, rng=random):
+	'''Function that gets matching clauses (easier to parallelize), rng is the random number generator of the search'''
 	start_time = time.time()
 	# Unpack arguments to make things easier
-	prod_t, gold_t, args, single, original_prod, original_gold, en_sense_dict, signature = arg_list
-	# Create DRS objects
-	prod_drs, gold_drs = DRS(signature), DRS(signature)
-	prod_drs.prefix, gold_drs.prefix = 'a', 'b' # Prefixes are used to create standardized variable-names
-	prod_drs.file_name, gold_drs.file_name = args.f1, args.f2
-	prod_drs.original_clauses, gold_drs.original_clauses = original_prod, original_gold
-
-	# Get the specific clauses here
-	prod_drs.get_specific_clauses(prod_t, en_sense_dict, args)
-	gold_drs.get_specific_clauses(gold_t, en_sense_dict, args)
+	prod_t, gold_t, args, single, original_prod, original_gold, en_sense_dict, signature, cached = arg_list
+	# Create DRS objects, prefixes are used to create standardized variable-names
+	# With multiple runs or a restart budget we keep the DRSs and their candidate pools, the baseline DRS is only
+	# preprocessed once anyway and the gold DRSs are also kept if we evaluate multiple systems
+	keep = args.runs > 1 or args.restart_budget > 0
+	prod_drs = get_drs(prod_t, 'a', args.f1, original_prod, en_sense_dict, signature, args, keep or args.baseline)
+	gold_drs = get_drs(gold_t, 'b', args.f2, original_gold, en_sense_dict, signature, args, keep_gold(args))
 
 	if single and (args.max_clauses > 0 and ((prod_drs.total_clauses > args.max_clauses) or (gold_drs.total_clauses > args.max_clauses))):
 		print('Skip calculation of DRS, more clauses than max of {0}'.format(args.max_clauses))
@@ -436,8 +686,18 @@ def get_matching_clauses(arg_list):
 	if args.stats: #only do stats
 		return [0, prod_drs.total_clauses, gold_drs.total_clauses, [], 0, 0, 0, len(prod_drs.var_map)]  # only care about clauses and var count, skip calculations
 	else:
-		# Do the hill-climbing for the matching here
-		(best_mapping, best_match_num, found_idx, smart_fscores, clause_pairs) = get_best_match(prod_drs, gold_drs, args, single)
+		# Do the hill-climbing for the matching here, unless we already have the result in the cache
+		if cached and cached['prod_clauses'] == prod_drs.total_clauses and cached['gold_clauses'] == gold_drs.total_clauses:
+			best_mapping, best_match_num, found_idx, smart_fscores = cached['mapping'], cached['match_num'], cached['found_idx'], cached['smart_fscores']
+			clause_pairs = dict(((gold_idx, prod_idx), 1) for gold_idx, prod_idx in cached['clause_pairs'])
+			search_stats = [0, 0, 0, 0, cached.get('budget_limited', 0), cached.get('restarts', 0), cached.get('early_stop', 0),
+							cached.get('upper_bound', best_match_num)]
+		else:
+			(best_mapping, best_match_num, found_idx, smart_fscores, clause_pairs, search_stats) = get_best_match(prod_drs, gold_drs, args, single, preprocessed['pools'] if keep else None,
+																													 get_restart_workers(prod_t, gold_t, args), rng)
+		search_result = {'mapping': best_mapping, 'match_num': best_match_num, 'found_idx': found_idx, 'smart_fscores': smart_fscores,
+						'clause_pairs': sorted(clause_pairs), 'prod_clauses': prod_drs.total_clauses, 'gold_clauses': gold_drs.total_clauses,
+						'budget_limited': search_stats[4], 'restarts': search_stats[5], 'early_stop': search_stats[6], 'upper_bound': search_stats[7]}
 		(precision, recall, best_f_score) = compute_f(best_match_num, prod_drs.total_clauses, gold_drs.total_clauses, args.significant, False)
 
 
@@ -463,9 +723,9 @@ def get_matching_clauses(arg_list):
 		prod_clause_division = [prod_drs.num_operators, prod_drs.num_roles, prod_drs.num_concepts, get_num_concepts(prod_drs.concepts, 'n'), get_num_concepts(prod_drs.concepts, 'v'), get_num_concepts(prod_drs.concepts, 'a'), get_num_concepts(prod_drs.concepts, 'r'), get_num_concepts(prod_drs.concepts, 'v') + get_num_concepts(prod_drs.concepts, 'a')]
 		gold_clause_division = [gold_drs.num_operators, gold_drs.num_roles, gold_drs.num_concepts, get_num_concepts(gold_drs.concepts, 'n'), get_num_concepts(gold_drs.concepts, 'v'), get_num_concepts(gold_drs.concepts, 'a'), get_num_concepts(gold_drs.concepts, 'r'), get_num_concepts(gold_drs.concepts, 'v') + get_num_concepts(gold_drs.concepts, 'a')]
 		if args.ms and not single:
-			print_results([[best_match_num, prod_drs.total_clauses, gold_drs.total_clauses, smart_fscores, found_idx, match_division, prod_clause_division, gold_clause_division, len(prod_drs.var_map), idv_dict]],
+			print_results([[best_match_num, prod_drs.total_clauses, gold_drs.total_clauses, smart_fscores, found_idx, match_division, prod_clause_division, gold_clause_division, len(prod_drs.var_map), idv_dict, search_stats]],
 				False, start_time, single, args)
-		return [best_match_num, prod_drs.total_clauses, gold_drs.total_clauses, smart_fscores, found_idx, match_division, prod_clause_division, gold_clause_division, len(prod_drs.var_map), idv_dict]
+		return [best_match_num, prod_drs.total_clauses, gold_drs.total_clauses, smart_fscores, found_idx, match_division, prod_clause_division, gold_clause_division, len(prod_drs.var_map), idv_dict, search_stats, search_result]
 
 
 def print_results(res_list, no_print, start_time, single, args):
@@ -507,6 +767,13 @@ def print_results(res_list, no_print, start_time, single, args):
 		print("Precision: {0}".format(round(precision, args.significant)))
 		print("Recall   : {0}".format(round(recall, args.significant)))
 		print("F-score  : {0}".format(round(best_f_score, args.significant)))
+		if args.max_time > 0:
+			print('\nDRS pairs that used up the time budget of {0} sec: {1} (their best mapping so far is used)'.format(
+				args.max_time, sum(x[10][4] for x in res_list)))
+		if args.patience > 0 or args.patience_seen > 0:
+			print_stop_points([x[10] for x in res_list], args.restarts)
+		if args.restart_budget > 0:
+			print('\nRestart budget: {0} restarts done of {1}'.format(sum(x[10][5] for x in res_list), args.restart_budget))
 
 		# Print specific output here
 		if args.prin:
@@ -517,6 +784,11 @@ def print_results(res_list, no_print, start_time, single, args):
 				smart_conc = compute_f(sum([y[0] for y in [x[3] for x in res_list]]), total_test_num, total_gold_num, args.significant, True)
 				print('Smart F-score concepts: {0}\n'.format(smart_conc))
 
+			# Hits and evictions of the memo of mapping scores, and the DRS pairs that were the same up to variable renaming
+			search_stats = [sum(x[10][idx] for x in res_list) for idx in range(4)]
+			print('Mapping memo: {0} hits, {1} misses, {2} evictions'.format(*search_stats))
+			print('Isomorphic DRS pairs (no search needed): {0}\n'.format(search_stats[3]))
+
 			# For a single DRS we can print some more information
 			if single:
 				print('\n## Restarts and processing time ##\n')
@@ -536,6 +808,19 @@ def print_results(res_list, no_print, start_time, single, args):
 	return [precision, recall, best_f_score]
 
 
+def print_stop_points(search_stats, restarts):
+	'''Print the distribution of the number of restarts we did for the DRS pairs that we searched with restarts,
+	   to check how often early stopping (-patience, -patience_seen) kicked in'''
+	stop_points = [stats[5] for stats in search_stats if stats[5] > 0]
+	if not stop_points:
+		return
+	print('\nEarly stopping: {0} of {1} DRS pairs with restarts stopped before -r {2}'.format(
+		sum(stats[6] for stats in search_stats), len(stop_points), restarts))
+	print('Restarts per DRS pair: min {0}, median {1}, mean {2}, max {3}'.format(
+		min(stop_points), median(stop_points), round(float(sum(stop_points)) / len(stop_points), 2), max(stop_points)))
+	print('Restarts (DRS pairs): {0}'.format(', '.join('{0} ({1})'.format(num, count) for num, count in sorted(Counter(stop_points).items()))))
+
+
 def check_input(clauses_prod_list, original_prod, original_gold, clauses_gold_list, baseline, f1, max_clauses, single):
 	'''Check if the input is valid -- or fill baseline if that is asked'''
 	if baseline:  # if we try a baseline DRS, we have to fill a list of this baseline
@@ -560,8 +845,43 @@ def check_input(clauses_prod_list, original_prod, original_gold, clauses_gold_li
 	return original_prod, clauses_prod_list
 
 
+def stream_pairs(prod_drss, gold_drss, max_clauses, single, warnings=()):
+	'''Generator version of check_input (without baseline): yield the DRS pairs as soon as they are read. We only know
+	   the number of DRSs when we are at the end of both files, so we check and print them there, which is still
+	   before the results are printed. The same goes for the lists of warnings about ill-formed DRSs of each file'''
+	num_prod, num_gold, num_skipped = 0, 0, 0
+	for prod, gold in zip_longest(prod_drss, gold_drss):
+		num_prod += prod is not None
+		num_gold += gold is not None
+		if prod is not None and gold is not None:
+			num_skipped += max_clauses > 0 and (len(prod[0]) > max_clauses or len(gold[0]) > max_clauses)
+			yield prod[0], gold[0], prod[1], gold[1]
+	for file_warnings in warnings:
+		print_warnings(file_warnings)
+	if num_prod != num_gold:
+		print("Number of DRSs not equal, {0} vs {1}, exiting...".format(num_prod, num_gold))
+		sys.exit(0)
+	elif num_prod == 0 and num_gold == 0:
+		print("Both DRSs empty, exiting...")
+		sys.exit(0)
+	elif not single:
+		print('Comparing {0} DRSs...\n'.format(num_gold))
+
+	# Print number of DRSs we skip due to the -max_clauses parameter
+	if max_clauses > 0 and not single:
+		print('Skipping {0} DRSs due to their length exceeding {1} (--max_clauses)\n'.format(num_skipped, max_clauses))
+
+
 class DRS:
-	'''Main DRS class with methods to process and rewrite the clauses'''
+	'''Main DRS class with methods to process and rewrite the clauses
+	   Variables are renamed to prefix + number (e.g. a0, a1), var_index maps these names back to their number'''
+
+	__slots__ = ['op_boxes', 'inv_boxes', 'op_two_vars', 'op_two_vars_idx', 'op_two_vars_abs1', 'op_two_vars_abs_idx1',
+				 'op_two_vars_abs2', 'op_two_vars_abs_idx2', 'op_three_vars', 'op_three_vars_idx', 'roles_two_abs',
+				 'roles_two_abs_idx', 'roles_abs1', 'roles_abs_idx1', 'roles_abs2', 'roles_abs_idx2', 'roles', 'roles_idx',
+				 'concepts', 'concepts_idx', 'clauses_seen', 'var_ids', 'var_names', 'var_index', 'type_vars', 'var_map',
+				 'rewritten_concepts', 'added_var_map', 'prefix', 'file_name', 'original_clauses', 'num_operators',
+				 'num_roles', 'num_concepts', 'total_clauses', 'clause_labels', 'canonical_form']
 
 	def __init__(self, signature):
 		# List of operators who's variables are also boxes, e.g. b0 NOT b1
@@ -578,29 +898,40 @@ class DRS:
 		self.roles_abs2, self.roles_abs_idx2 = [], []
 		self.roles, self.roles_idx = [], []
 		self.concepts, self.concepts_idx = [], []
+		# The (list, clause) combinations we already added, to skip duplicate clauses
+		self.clauses_seen = set()
 
 		# Lists and dicts to keep track of the variable information and rewritten concepts
-		self.vars_seen = []
+		self.var_ids = {}    # original variable -> number
+		self.var_names = []  # number -> new variable name
+		self.var_index = {}  # new variable name -> number
 		self.type_vars = {}
 		self.var_map = {}
 		self.rewritten_concepts = []
 		self.added_var_map = False
+		# Computed when we need them for the first time
+		self.clause_labels = None
+		self.canonical_form = None
 
 	def rename_var(self, var, var_type, args):
 		'''Function that renames the variables in a standardized way'''
-		if var in self.vars_seen:
-			new_var = self.prefix + str(self.vars_seen.index(var))
-		else:
-			new_var = self.prefix + str(len(self.vars_seen))
-			self.type_vars[new_var] = var_type
-			self.vars_seen.append(var)
+		if var in self.var_ids:
+			return self.var_names[self.var_ids[var]]
+		num = len(self.var_names)
+		new_var = intern(self.prefix + str(num))
+		self.var_ids[var] = num
+		self.var_names.append(new_var)
+		self.var_index[new_var] = num
+		self.type_vars[new_var] = var_type
 		self.var_map[new_var] = var
 		return new_var
 
 
 	def add_if_not_exists(self, list1, list2, to_add, to_add2):
 		'''Add something to two list of lists if it is not there yet in the first one'''
-		if to_add not in list1:
+		key = (id(list1), to_add)
+		if key not in self.clauses_seen:
+			self.clauses_seen.add(key)
 			list1.append(to_add)
 			list2.append(to_add2)
 
@@ -709,6 +1040,71 @@ class DRS:
 		self.total_clauses = self.num_operators + self.num_roles + self.num_concepts
 
 
+	def get_clause_lists(self):
+		'''Get the lists of the specific clauses, in the order of the clause indices used in the matching'''
+		return [self.op_two_vars, self.op_two_vars_abs1, self.op_two_vars_abs2, self.op_three_vars, self.roles_two_abs,
+				self.roles_abs1, self.roles_abs2, self.roles, self.concepts]
+
+
+	def rename_clause(self, clause, names):
+		'''Rename the variables of a clause with the names dict, the second item is never a variable but might look like
+		   one (e.g. concept a1). For operators like b1 NEQ x1 x2 the order of the last two variables does not matter'''
+		new_clause = tuple(names[item] if idx != 1 and item in names else item for idx, item in enumerate(clause))
+		if len(clause) == 4 and clause[1] in self.inv_boxes and clause[2] in names and clause[3] in names and \
+		   self.type_vars[clause[2]] == self.type_vars[clause[3]] and new_clause[3] < new_clause[2]:
+			new_clause = new_clause[:2] + (new_clause[3], new_clause[2])
+		return new_clause
+
+
+	def get_clause_labels(self):
+		'''Get the multiset of clause labels: the clauses with each variable replaced by its type, e.g. b0 REF x1 -> b REF x
+		   Two clauses can only match if they have the same label, which gives us a cheap upper bound on the number of matches'''
+		if self.clause_labels is None:
+			self.clause_labels = Counter()
+			for list_idx, clause_list in enumerate(self.get_clause_lists()):
+				for clause in clause_list:
+					self.clause_labels[(list_idx,) + self.rename_clause(clause, self.type_vars)] += 1
+		return self.clause_labels
+
+
+	def get_canonical_form(self):
+		'''Rename the variables in a way that does not depend on their names or the order of the clauses, so that DRSs
+		   that are the same up to variable renaming get the same canonical clauses. We start with the variable types and
+		   refine them with the clauses the variables occur in, until the number of different variables is stable
+		   Returns the canonical clauses (in the order of the clause indices), their hash and the new variable names'''
+		if self.canonical_form is None:
+			self.canonical_form = self.compute_canonical_form()
+		return self.canonical_form
+
+
+	def compute_canonical_form(self):
+		'''Compute the canonical form of the DRS, see get_canonical_form'''
+		clauses = [(list_idx, clause) for list_idx, clause_list in enumerate(self.get_clause_lists()) for clause in clause_list]
+		types = sorted(set(self.type_vars.values()))
+		colours = dict((var, types.index(var_type)) for var, var_type in self.type_vars.items())
+		num_colours = len(types)
+		while True:
+			signatures = dict((var, []) for var in colours)
+			for list_idx, clause in clauses:
+				renamed = (list_idx,) + self.rename_clause(clause, colours)
+				# For operators like NEQ the last two variables are interchangeable
+				symmetric = len(clause) == 4 and clause[1] in self.inv_boxes and clause[2] in colours and clause[3] in colours
+				for idx, item in enumerate(clause):
+					if idx != 1 and item in signatures:
+						signatures[item].append((2 if symmetric and idx == 3 else idx, renamed))
+			refined = dict((var, (colours[var], tuple(sorted(signatures[var])))) for var in colours)
+			ranking = dict((colour, rank) for rank, colour in enumerate(sorted(set(refined.values()))))
+			colours = dict((var, ranking[refined[var]]) for var in refined)
+			if len(ranking) == num_colours:
+				break
+			num_colours = len(ranking)
+		# Variables that are still the same are ordered by their original name
+		order = sorted(colours, key=lambda var: (colours[var], self.var_index[var]))
+		names = dict((var, self.type_vars[var] + str(rank)) for rank, var in enumerate(order))
+		canonical_clauses = [(list_idx,) + self.rename_clause(clause, names) for list_idx, clause in clauses]
+		return canonical_clauses, hash(tuple(sorted(canonical_clauses))), names
+
+
 def save_detailed_stats(all_dicts, args):
 	'''Print detailed statistics to the screen, if args.detailed_stats > 0'''
 	final_dict, f_dict = merge_dicts(all_dicts, args) #first merge all dictionaries in a single dict and also create dict with F-scores
@@ -749,6 +1145,254 @@ def save_stats(all_clauses, all_vars, stat_file):
 	pickle.dump(dump_lists, open(stat_file, 'w'))
 
 
+# State that is the same for all DRS pairs, set once per worker process by init_worker
+worker_state = {}
+
+
+def init_worker(args, single):
+	'''Initializer of the worker processes: load the WordNet dict and the signature only once per worker,
+	   so that the tasks only have to contain the DRS pair itself'''
+	from wordnet_dict_en import en_sense_dict
+	worker_state['args'], worker_state['single'] = args, single
+	worker_state['en_sense_dict'] = en_sense_dict
+	worker_state['signature'] = get_signature(args.sig_file)
+	set_keep_max(args.keep_max)
+
+
+def get_matching_clauses_worker(chunk):
+	'''Get the matching clauses of a chunk of compact pairs (idx, (prod_t, gold_t, original_prod, original_gold, cached,
+	   restarts, seed_keys)) in a worker, return them together with their index so that we can put them back in input
+	   order. The main process already parsed and validated the DRSs, so the worker only does the search. restarts is the
+	   number of extra restarts for -restart_budget, or None. seed_keys are the keys of the random number generator of
+	   the pair (see get_pair_rng), so that the result does not depend on the worker that searches the pair'''
+	args = worker_state['args']
+	results = []
+	for idx, (prod_t, gold_t, original_prod, original_gold, cached, restarts, seed_keys) in chunk:
+		pair_args = get_budget_args(args, restarts) if restarts else args
+		results.append((idx, get_matching_clauses([prod_t, gold_t, pair_args, worker_state['single'], original_prod,
+								original_gold, worker_state['en_sense_dict'], worker_state['signature'], cached], get_pair_rng(args, *seed_keys))))
+	return results
+
+
+def get_pair_cost(prod_t, gold_t):
+	'''Cheap estimate of the time the search of a DRS pair takes: the number of clauses times the number of node pairs
+	   of variables of the same type (box or discourse variable), which is the maximum size of the candidate sets'''
+	num_vars = []
+	for clauses in [prod_t, gold_t]:
+		boxes = set(clause[0] for clause in clauses)
+		variables = set(item for clause in clauses for item in clause[2:] if not between_quotes(item))
+		num_vars.append((len(boxes), len(variables - boxes)))
+	return (len(prod_t) + len(gold_t)) * (num_vars[0][0] * num_vars[1][0] + num_vars[0][1] * num_vars[1][1])
+
+
+def get_restart_workers(prod_t, gold_t, args):
+	'''Number of processes for the restarts of a DRS pair: -restart_parallel for pairs with a search cost of at least
+	   -restart_parallel_min, otherwise 1'''
+	if args.restart_parallel > 1 and get_pair_cost(prod_t, gold_t) >= args.restart_parallel_min:
+		return args.restart_parallel
+	return 1
+
+
+def get_chunks(tasks, costs, parallel):
+	'''Split the tasks, sorted on decreasing cost, in chunks of about the same cost. Expensive pairs get a chunk of their
+	   own, so that they are started first and are not waiting behind other pairs, while cheap pairs are sent in bulk'''
+	max_cost = float(sum(costs)) / (parallel * 16)
+	chunks, cur_chunk, cur_cost = [], [], 0
+	for task, cost in zip(tasks, costs):
+		if cur_chunk and cur_cost + cost > max_cost:
+			chunks.append(cur_chunk)
+			cur_chunk, cur_cost = [], 0
+		cur_chunk.append(task)
+		cur_cost += cost
+	if cur_chunk:
+		chunks.append(cur_chunk)
+	return chunks
+
+
+def process_pairs(arg_list, score_cache, args, pool=None, run=0):
+	'''Get the matching clauses for all DRS pairs, in parallel if we have a pool. DRS pairs that are in the score cache,
+	   or that we already did in this run, get the saved search result instead of doing the search again.
+	   Without a pool, arg_list can also be a generator, the pairs are then matched as soon as they are read.
+	   With -seed, the search of each pair is seeded with the seed, the number of the run and the number of the pair'''
+	def save_result(arguments, key, result):
+		if arguments[-1] is not None:
+			score_cache.hits += 1
+		elif result != 'skip' and len(result) > 11:
+			score_cache.add(key, result[11])
+		return result
+
+	def search_pairs(indices):
+		# Dispatch the most expensive pairs first, so that no large DRS is left running at the end while the other workers are idle
+		indices = sorted(indices, key=lambda idx: (-costs[idx], idx))
+		# Only send the parts of the arguments that differ per DRS pair to the workers
+		tasks = [(idx, (arg_list[idx][0], arg_list[idx][1], arg_list[idx][4], arg_list[idx][5], arg_list[idx][8], None, (run, idx))) for idx in indices]
+		chunks = get_chunks(tasks, [costs[idx] for idx in indices], args.parallel)
+		results = {}
+		for chunk_results in pool.imap_unordered(get_matching_clauses_worker, chunks):
+			results.update(chunk_results)
+		return [results[idx] for idx in sorted(indices)]
+
+	if pool is None:  # no need for parallelization for p=1
+		all_results = []
+		for idx, arguments in enumerate(arg_list):
+			key = score_cache.key(arguments[0], arguments[1])
+			arguments[-1] = score_cache.get(key)
+			all_results.append(save_result(arguments, key, get_matching_clauses(arguments, get_pair_rng(args, run, idx))))
+		if args.restart_budget > 0:
+			spend_restart_budget(arg_list, all_results, score_cache, args, run=run)
+		return all_results
+
+	# First search the first occurrence of the pairs that are not in the cache, then do the others
+	cache_keys = [score_cache.key(arguments[0], arguments[1]) for arguments in arg_list]
+	costs = [get_pair_cost(arguments[0], arguments[1]) for arguments in arg_list]
+	all_results = [None] * len(arg_list)
+	first_idx = {}
+	for idx, key in enumerate(cache_keys):
+		arg_list[idx][-1] = score_cache.get(key)
+		first_idx.setdefault(key, idx)
+	todo = [idx for idx in range(len(arg_list)) if arg_list[idx][-1] is None and first_idx[cache_keys[idx]] == idx]
+	for idx, result in zip(todo, search_pairs(todo)):
+		all_results[idx] = save_result(arg_list[idx], cache_keys[idx], result)
+	rest = [idx for idx in range(len(arg_list)) if all_results[idx] is None]
+	for idx in rest:
+		arg_list[idx][-1] = score_cache.get(cache_keys[idx])
+	for idx, result in zip(rest, search_pairs(rest)):
+		all_results[idx] = save_result(arg_list[idx], cache_keys[idx], result)
+	if args.restart_budget > 0:
+		spend_restart_budget(arg_list, all_results, score_cache, args, pool, run)
+	return all_results
+
+
+def get_budget_args(args, restarts):
+	'''Options for the extra restarts of a DRS pair with -restart_budget: only random restarts, without exact search,
+	   since the smart mapping and the exact search would give the same mapping as in the first pass'''
+	budget_args = argparse.Namespace(**vars(args))
+	budget_args.restarts, budget_args.smart, budget_args.prin = restarts, 'no', False
+	if args.search == 'exact':
+		budget_args.search = 'hill'
+	return budget_args
+
+
+def merge_restart_results(result, extra_result):
+	'''Keep the best mapping of the restarts we already did for a DRS pair and of its extra restarts'''
+	search_stats = result[10][:]
+	search_stats[5] += extra_result[10][5]
+	if extra_result[0] > result[0]:
+		merged = extra_result[:]
+		# The smart F-scores are of the first pass and the best mapping is found at a restart after the first pass
+		merged[3], merged[4] = result[3], result[10][5] + extra_result[4]
+		merged[11] = dict(extra_result[11], smart_fscores=result[11]['smart_fscores'], found_idx=merged[4])
+	else:
+		merged = result[:]
+		merged[11] = dict(result[11])
+	merged[10] = search_stats
+	merged[11]['restarts'] = search_stats[5]
+	return merged
+
+
+def spend_restart_budget(arg_list, all_results, score_cache, args, pool=None, run=0):
+	'''Spend the restarts of -restart_budget that are left after the first pass over the DRS pairs. In each round, the
+	   DRS pairs whose number of matching clauses is furthest from their upper bound get -r extra random restarts each,
+	   until the budget is used up or all pairs reached their upper bound. The upper bound is not always reachable, so
+	   pairs for which extra restarts did not find a better mapping move down the list, but get twice as many restarts
+	   the next time. Restarts that a pair did not need go back to the budget. Updates all_results and the score cache
+	   With -seed, the extra restarts of a pair are seeded with the number of the round as well'''
+	if 'skip' in all_results:
+		return
+	left = args.restart_budget - sum(result[10][5] for result in all_results)
+	failed = [0] * len(all_results)
+	budget_round = 0
+	while left > 0:
+		budget_round += 1
+		gaps = [(float(result[10][7] - result[0]) / (1 + failed[idx]), idx) for idx, result in enumerate(all_results)]
+		todo = [idx for gap, idx in sorted(gaps, key=lambda gap_idx: (-gap_idx[0], gap_idx[1])) if gap > 0]
+		if not todo:
+			break
+		extra = OrderedDict()
+		for idx in todo:
+			if left <= 0:
+				break
+			extra[idx] = min(args.restarts * 2 ** failed[idx], left)
+			left -= extra[idx]
+		if pool is None:
+			results = [get_matching_clauses(arg_list[idx][:2] + [get_budget_args(args, restarts)] + arg_list[idx][3:8] + [None],
+											get_pair_rng(args, run, idx, budget_round)) for idx, restarts in extra.items()]
+		else:
+			indices = list(extra)
+			costs = [get_pair_cost(arg_list[idx][0], arg_list[idx][1]) for idx in indices]
+			tasks = [(idx, (arg_list[idx][0], arg_list[idx][1], arg_list[idx][4], arg_list[idx][5], None, extra[idx], (run, idx, budget_round)))
+					 for idx in indices]
+			chunk_results = {}
+			for chunk in pool.imap_unordered(get_matching_clauses_worker, get_chunks(tasks, costs, args.parallel)):
+				chunk_results.update(chunk)
+			results = [chunk_results[idx] for idx in indices]
+		for (idx, restarts), result in zip(extra.items(), results):
+			# Each pair costs at least one restart, so that we always finish
+			left += restarts - max(result[10][5], 1)
+			if result[0] <= all_results[idx][0]:
+				failed[idx] += 1
+			all_results[idx] = merge_restart_results(all_results[idx], result)
+			score_cache.replace(score_cache.key(arg_list[idx][0], arg_list[idx][1]), all_results[idx][11])
+
+
+def read_system(file_name, gold_nums, signature, args, warn=True):
+	'''Return a generator of the DRSs of a system (-f1), with -ids only the DRSs with numbers gold_nums'''
+	if args.drs_ids and not args.baseline:
+		return read_indexed_clauses(open_drs_file(file_name, signature, args.index_dir), gold_nums, signature, args.ill, args.include_ref, warn)
+	return read_clauses(file_name, signature, args.ill, args.include_ref, warn)
+
+
+def get_pairs(prod_drss, gold, single, args):
+	'''Read all DRSs of a system and check if they are valid, return the DRS pairs'''
+	global ill_drs_ids
+	clauses_gold_list, original_gold = [x[0] for x in gold], [x[1] for x in gold]
+	prod = list(prod_drss)
+	clauses_prod_list, original_prod = [x[0] for x in prod], [x[1] for x in prod]
+
+	# Count ill-DRSs in the system output
+	if args.codalab and args.ill == 'dummy':
+		ill_drs_ids = [ i for (i, x) in enumerate(clauses_prod_list, start=1) if len(x) < 3
+						and	next( (cl for cl in x if len(cl) > 1 and cl[1].startswith('alwayswrong')), False ) ]
+
+	# Check if correct input (number of instances, baseline, etc)
+	original_prod, clauses_prod_list = check_input(clauses_prod_list, original_prod, original_gold, clauses_gold_list, args.baseline, args.f1, args.max_clauses, single)
+	return list(zip(clauses_prod_list, clauses_gold_list, original_prod, original_gold))
+
+
+def evaluate_systems(gold, gold_nums, single, en_sense_dict, signature, args):
+	'''Evaluate all systems of args.systems against the same gold DRSs and print a table with their scores
+	   The gold DRSs, the workers and the score cache of each run are shared, so identical DRS pairs of different
+	   systems (e.g. checkpoints of the same parser) are only searched once per run'''
+	start = time.time()
+	pool = multiprocessing.Pool(args.parallel, initializer=init_worker, initargs=(args, single)) if args.parallel > 1 else None
+	score_caches = [Score_cache(args, signature, args.cache) for _ in range(args.runs)]
+	table = [['System', 'DRSs', 'Clauses prod', 'Clauses gold', 'Matching', 'Precision', 'Recall', 'F-score']]
+	for name, file_name in args.systems:
+		print('Evaluating {0}'.format(name))
+		sys_args = argparse.Namespace(**vars(args))
+		sys_args.f1 = file_name
+		pairs = get_pairs(read_system(file_name, gold_nums, signature, sys_args), gold, single, sys_args)
+		matches, scores = [], []
+		for run, score_cache in enumerate(score_caches):
+			arg_list = [[prod_t, gold_t, sys_args, single, orig_prod, orig_gold, en_sense_dict, signature, None] for prod_t, gold_t, orig_prod, orig_gold in pairs]
+			all_results = process_pairs(arg_list, score_cache, sys_args, pool, run)
+			matches.append(sum(x[0] for x in all_results))
+			scores.append(print_results(all_results, True, start, single, sys_args))
+		# The number of matching clauses and the scores are averages if we do multiple runs
+		match = matches[0] if args.runs == 1 else round(float(sum(matches)) / args.runs, args.significant)
+		table.append([name, len(pairs), sum(x[1] for x in all_results), sum(x[2] for x in all_results), match] +
+					 [round(float(sum(score[idx] for score in scores)) / args.runs, args.significant) for idx in range(3)])
+	for score_cache in score_caches:
+		score_cache.close()
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+	for print_line in create_tab_list(table, '\n## Results per system ##\n', '\t'):
+		print(print_line)
+	print('\nTotal processing time: {0} sec'.format(round(time.time() - start, args.significant)))
+
+
 def main(args):
 	'''Main function of counter score calculation'''
 	start = time.time()
@@ -758,37 +1402,59 @@ def main(args):
 	from wordnet_dict_en import en_sense_dict
 	signature = get_signature(args.sig_file) # Get signature
 	res = []
-
-	# Get all the clauses and check if they are valid
-	clauses_gold_list, original_gold = get_clauses(args.f2, signature, args.ill)
-	clauses_prod_list, original_prod = get_clauses(args.f1, signature, args.ill)
-
-	# Count ill-DRSs in the system output
-	global ill_drs_ids
-	if args.codalab and args.ill == 'dummy':
-		ill_drs_ids = [ i for (i, x) in enumerate(clauses_prod_list, start=1) if len(x) < 3
-						and	next( (cl for cl in x if len(cl) > 1 and cl[1].startswith('alwayswrong')), False ) ]
+	set_keep_max(args.keep_max)
+
+	# Read the DRSs one at a time, we only have to peek at the first two gold DRSs to know if we do a single DRS
+	# With -ids we only read the DRSs we want to score, directly from the files by using their offset index
+	# The warnings about ill-formed DRSs are collected, so that we print them per file (gold first), also if we stream
+	gold_warnings, prod_warnings = [], []
+	gold_nums = [num - 1 for num in args.drs_ids]
+	if args.drs_ids:
+		gold_drss = read_indexed_clauses(open_drs_file(args.f2, signature, args.index_dir), gold_nums, signature, args.ill, args.include_ref, gold_warnings)
+	else:
+		gold_drss = read_clauses(args.f2, signature, args.ill, args.include_ref, gold_warnings)
+	first_gold = list(islice(gold_drss, 2))
+	single = True if len(first_gold) == 1 else False  # true if we are doing a single DRS
+	gold_drss = chain(first_gold, gold_drss)
+
+	# For multiple systems the gold DRSs are read and preprocessed only once, and we print a table of the results
+	if len(args.systems) > 1:
+		gold = list(gold_drss)
+		print_warnings(gold_warnings)
+		evaluate_systems(gold, gold_nums, single, en_sense_dict, signature, args)
+		return
+	prod_drss = read_system(args.f1, gold_nums, signature, args, prod_warnings)
 
 	# Don't print the results each time if we do multiple runs
 	no_print = True if args.runs > 1 else False
-	single = True if len(clauses_gold_list) == 1 else False  # true if we are doing a single DRS
 
-	# Check if correct input (number of instances, baseline, etc)
-	original_prod, clauses_prod_list = check_input(clauses_prod_list, original_prod, original_gold, clauses_gold_list, args.baseline, args.f1, args.max_clauses, single)
+	# If we only go over the DRS pairs once, we can match them as soon as they are read
+	# Otherwise we need all of them first, to check the input, to schedule them on the workers or to use them in each run
+	# With -ms we also need them first, so that the number of DRSs is still printed before the individual scores
+	if args.runs == 1 and args.parallel == 1 and not args.baseline and not args.ms and not args.restart_budget and not (args.codalab and args.ill == 'dummy'):
+		pairs = stream_pairs(prod_drss, gold_drss, args.max_clauses, single, [gold_warnings, prod_warnings])
+	else:
+		gold = list(gold_drss)
+		print_warnings(gold_warnings)
+		prod = list(prod_drss)
+		print_warnings(prod_warnings)
+		pairs = get_pairs(prod, gold, single, args)
+
+	# The workers load the WordNet dict and signature once, and we use the same pool for all runs
+	pool = multiprocessing.Pool(args.parallel, initializer=init_worker, initargs=(args, single)) if args.parallel > 1 else None
 
 	# Processing clauses
-	for _ in range(args.runs):  # for experiments we want to more runs so we can average later
-		arg_list = []
-		for count, (prod_t, gold_t) in enumerate(zip(clauses_prod_list, clauses_gold_list)):
-			arg_list.append([prod_t, gold_t, args, single, original_prod[count], original_gold[count], en_sense_dict, signature])
-
-		# Parallel processing here
-		if args.parallel == 1:  # no need for parallelization for p=1
-			all_results = []
-			for num_count, arguments in enumerate(arg_list):
-				all_results.append(get_matching_clauses(arguments))
-		else:
-			all_results = multiprocessing.Pool(args.parallel).map(get_matching_clauses, arg_list)
+	for run in range(args.runs):  # for experiments we want to more runs so we can average later
+		# The score cache saves the search results, so that we do not search identical DRS pairs twice
+		score_cache = Score_cache(args, signature, args.cache)
+		arg_list = ([prod_t, gold_t, args, single, orig_prod, orig_gold, en_sense_dict, signature, None] for prod_t, gold_t, orig_prod, orig_gold in pairs)
+		if pool is not None or args.restart_budget > 0:
+			arg_list = list(arg_list)
+
+		all_results = process_pairs(arg_list, score_cache, args, pool, run)
+		score_cache.close()
+		if args.prin and not no_print:
+			print('Score cache: {0} DRS pairs from the cache, {1} DRS pairs searched\n'.format(score_cache.hits, score_cache.added))
 
 		# If we find results, print them in a nice way
 		if all_results == ['skip']: #skip result
@@ -801,6 +1467,10 @@ def main(args):
 		else:
 			raise ValueError('No results found')
 
+	if pool is not None:
+		pool.close()
+		pool.join()
+
 	# If multiple runs, print averages
 	if res and args.runs > 1 and not args.stats:
 		print('Average scores over {0} runs:\n'.format(args.runs))
@@ -0,0 +1,211 @@
+'''Module with a Python API for Counter, to score DRSs in the same process (e.g. in a training loop) instead of running
+   counter.py for each evaluation. The DRSs are given in memory and the counts come back as NumPy arrays:
+
+	from counter_api import get_options, score_pairs
+	options = get_options(sig_file='clf_signature.yaml', ill='score', parallel=4)
+	scores = score_pairs(prod_drss, gold_drss, options)
+	print(scores.f_score(), scores.total())
+
+   Each DRS is either a string in clause format or a list of clauses (lists or tuples of strings). The options are the
+   options of counter.py, with the names of their argparse destinations. score_pairs keeps a Counter_scorer for each set
+   of options, so that the signature, the WordNet sense dict, the worker pool, the preprocessed gold DRSs and the search
+   results of DRS pairs we already scored are shared by all calls with the same options. Memory stays bounded in long
+   runs: we keep at most -keep_max preprocessed DRSs and -cache_max search results (use -cache to keep all of them).
+   The preprocessed DRSs are kept per process, so -keep_max is the same for all scorers that are open at the same time'''
+
+import atexit
+import json
+import multiprocessing
+from itertools import zip_longest
+
+import numpy as np
+
+from clf_parser import parse_block
+from clf_referee import get_signature
+from counter import DRS, check_search_options, create_arg_parser, get_chunks, get_matching_clauses, get_matching_clauses_worker, \
+					get_pair_cost, get_pair_rng, init_worker, parse_drs, set_keep_max
+from score_cache import Score_cache
+from utils_counter import compute_f
+
+# Scorers of score_pairs, keyed by their options
+scorers = {}
+
+# Scorers that are not closed yet, they share the preprocessed DRSs of this process
+open_scorers = []
+
+
+def check_options(args):
+	'''Check the options of a scorer and set the options of counter.py that do not apply when we only return counts'''
+	check_search_options(args)
+	if args.partial:
+		raise NotImplementedError('Partial matching currently does not work')
+	if args.restart_budget > 0:
+		raise NotImplementedError('-restart_budget is a budget for a whole file, it only works for counter.py')
+	check_keep_max(args)
+	if args.max_clauses > 0:
+		raise NotImplementedError('Skipping DRSs with -m does not work when scoring DRS pairs, the counts would not line up with the pairs')
+	args.f1, args.f2, args.systems, args.drs_ids = '', '', [], []
+	args.runs, args.baseline, args.ms, args.prin, args.no_mapping = 1, False, False, False, True
+	args.stats, args.ms_file, args.detailed_stats, args.codalab = '', '', 0, ''
+	# The gold DRSs are usually scored again and again, so we keep them after preprocessing
+	args.keep_gold = True
+	return args
+
+
+def check_keep_max(args):
+	'''The preprocessed DRSs and candidate pools are kept per process (see counter.preprocessed), so the open scorers
+	   can not have a different -keep_max'''
+	for scorer in open_scorers:
+		if scorer.args.keep_max != args.keep_max:
+			raise ValueError('keep_max {0} is not the keep_max {1} of an open scorer, the preprocessed DRSs are kept per process. '
+							 'Close the other scorers first (see close_scorers)'.format(args.keep_max, scorer.args.keep_max))
+
+
+def get_options(**options):
+	'''Return the options of a scorer: the defaults of counter.py, changed by options with the names of the argparse
+	   destinations, e.g. get_options(sig_file='clf_signature.yaml', restarts=10, search='exact')'''
+	args = create_arg_parser(with_files=False).parse_args([])
+	for name, value in options.items():
+		if not hasattr(args, name):
+			raise ValueError('Unknown option: {0}'.format(name))
+		setattr(args, name, value)
+	return check_options(args)
+
+
+class Pair_scores:
+	'''Counts of a list of DRS pairs: match, prod and gold are NumPy arrays with the number of matching clauses and the
+	   number of clauses of the produced and the gold DRS of each pair. budget_limited tells for each pair whether the
+	   search used up its time budget (-max_time), so that its match count might be too low'''
+	def __init__(self, match, prod, gold, budget_limited=None):
+		self.match = np.array(match, dtype=np.int64)
+		self.prod = np.array(prod, dtype=np.int64)
+		self.gold = np.array(gold, dtype=np.int64)
+		self.budget_limited = np.zeros(len(self.match), dtype=bool) if budget_limited is None else np.array(budget_limited, dtype=bool)
+
+	def __len__(self):
+		return len(self.match)
+
+	def precision(self):
+		'''Precision of each pair, 0 if the produced or the gold DRS is empty (just like compute_f)'''
+		return np.where((self.prod > 0) & (self.gold > 0), self.match / np.maximum(self.prod, 1), 0.0)
+
+	def recall(self):
+		'''Recall of each pair, 0 if the produced or the gold DRS is empty'''
+		return np.where((self.prod > 0) & (self.gold > 0), self.match / np.maximum(self.gold, 1), 0.0)
+
+	def f_score(self):
+		'''F-score of each pair, not rounded'''
+		precision, recall = self.precision(), self.recall()
+		return np.where(precision + recall > 0, 2 * precision * recall / np.maximum(precision + recall, 1e-12), 0.0)
+
+	def total(self, significant=4):
+		'''Precision, recall and F-score of all pairs together (micro-average), like the score of counter.py'''
+		return compute_f(int(self.match.sum()), int(self.prod.sum()), int(self.gold.sum()), significant, False)
+
+
+class Counter_scorer:
+	'''Scores DRS pairs with the options of args (see get_options), with a pool of workers if args.parallel > 1.
+	   The search results of the pairs are saved in a Score_cache, so a pair that we already scored is not searched
+	   again. Call close() when done, to stop the workers and to save the results if args.cache is an SQLite file'''
+	def __init__(self, args):
+		self.args = args
+		self.signature = get_signature(args.sig_file)
+		self.inv_boxes = DRS(self.signature).inv_boxes
+		# We keep the preprocessed gold DRSs, but not more than -keep_max of them
+		check_keep_max(args)
+		set_keep_max(args.keep_max)
+		open_scorers.append(self)
+		self.score_cache = Score_cache(args, self.signature, args.cache)
+		self.pool = None
+		self.en_sense_dict = None
+		if args.parallel > 1:
+			self.pool = multiprocessing.Pool(args.parallel, initializer=init_worker, initargs=(args, False))
+		else:
+			from wordnet_dict_en import en_sense_dict
+			self.en_sense_dict = en_sense_dict
+
+	def parse_pair(self, pair, num):
+		'''Return the normalized and original clauses of a (prod, gold) pair'''
+		if len(pair) != 2:
+			raise ValueError('DRS pair {0} does not contain two DRSs'.format(num))
+		parsed = []
+		for drs in pair:
+			lines = drs.split('\n') if isinstance(drs, str) else [' '.join(clause) for clause in drs]
+			parsed.append(parse_drs(parse_block(lines, num), self.signature, self.args.ill, self.args.include_ref, self.inv_boxes, warn=False))
+		return parsed[0][0], parsed[1][0], parsed[0][1], parsed[1][1]
+
+	def search_pairs(self, pairs, keys):
+		'''Return the search results of a list of (prod, gold, original_prod, original_gold) pairs. With -seed, the search
+		   of a pair is seeded with the seed and its key in the score cache, so that its result does not depend on the
+		   other pairs of the batch or on the worker that searches it. The random module is not seeded'''
+		if self.pool is None:
+			return [get_matching_clauses([prod_t, gold_t, self.args, False, orig_prod, orig_gold, self.en_sense_dict, self.signature, None],
+										 get_pair_rng(self.args, key))[11] for (prod_t, gold_t, orig_prod, orig_gold), key in zip(pairs, keys)]
+		# Schedule the most expensive pairs first, just like counter.py does
+		costs = [get_pair_cost(pair[0], pair[1]) for pair in pairs]
+		indices = sorted(range(len(pairs)), key=lambda idx: (-costs[idx], idx))
+		chunks = get_chunks([(idx, tuple(pairs[idx]) + (None, None, (keys[idx],))) for idx in indices], [costs[idx] for idx in indices], self.args.parallel)
+		results = {}
+		for chunk_results in self.pool.imap_unordered(get_matching_clauses_worker, chunks):
+			results.update((idx, result[11]) for idx, result in chunk_results)
+		return [results[idx] for idx in range(len(pairs))]
+
+	def count_pairs(self, pairs):
+		'''Return the (match, prod, gold, budget_limited) counts of a list of parsed pairs (see parse_pair). Only the pairs
+		   that are not in the score cache are searched, each of them once'''
+		keys = [self.score_cache.key(pair[0], pair[1]) for pair in pairs]
+		# The score cache only keeps -cache_max results in memory, so we keep the results of these pairs here
+		results, todo = {}, {}
+		for idx, key in enumerate(keys):
+			if key not in results and key not in todo:
+				result = self.score_cache.get(key)
+				if result is None:
+					todo[key] = idx
+				else:
+					results[key] = result
+		for key, result in zip(todo, self.search_pairs([pairs[idx] for idx in todo.values()], list(todo))):
+			self.score_cache.add(key, result)
+			results[key] = result
+		self.score_cache.hits += len(keys) - len(todo)
+		counts = []
+		for key in keys:
+			result = results[key]
+			counts.append((result['match_num'], result['prod_clauses'], result['gold_clauses'], result.get('budget_limited', 0)))
+		return counts
+
+	def score_pairs(self, prod_drss, gold_drss):
+		'''Score the DRSs of prod_drss against those of gold_drss (iterables of the same length), returns Pair_scores'''
+		pairs = []
+		for num, pair in enumerate(zip_longest(prod_drss, gold_drss), start=1):
+			if pair[0] is None or pair[1] is None:
+				raise ValueError('Number of DRSs not equal, DRS pair {0} does not contain two DRSs'.format(num))
+			pairs.append(self.parse_pair(pair, num))
+		counts = self.count_pairs(pairs)
+		return Pair_scores(*[[count[idx] for count in counts] for idx in range(4)])
+
+	def close(self):
+		if self in open_scorers:
+			open_scorers.remove(self)
+		self.score_cache.close()
+		if self.pool is not None:
+			self.pool.close()
+			self.pool.join()
+			self.pool = None
+
+
+def score_pairs(prod_iter, gold_iter, options=None):
+	'''Score the DRSs of prod_iter against those of gold_iter with options (see get_options, default options if None)
+	   and return Pair_scores. Calls with the same options share the same Counter_scorer'''
+	args = options if options is not None else get_options()
+	key = json.dumps(sorted(vars(args).items()), default=str)
+	if key not in scorers:
+		scorers[key] = Counter_scorer(args)
+	return scorers[key].score_pairs(prod_iter, gold_iter)
+
+
+@atexit.register
+def close_scorers():
+	'''Close the scorers of score_pairs, this is also done automatically when Python exits'''
+	for scorer in scorers.values():
+		scorer.close()
+	scorers.clear()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Scoring service for Counter: a long-running process that keeps the WordNet sense dict, the signature and the
+worker pool in memory, so that programs that score DRSs many times (e.g. a training loop) do not pay the startup
+costs of counter.py for every call. Requests of clients that arrive at the same time are sent to the workers together.
+The scoring itself is done by Counter_scorer of counter_api.py, so DRS pairs that were scored before are not searched again.
+
+Start the service on a Unix socket or on a localhost TCP port, with the same options as counter.py:
+
+	python counter_server.py -socket /tmp/counter.sock -g clf_signature.yaml -p 4
+	python counter_server.py -port 7654 -g clf_signature.yaml -p 4 -ill score
+
+The protocol is one JSON object per line. A request contains the DRS pairs to score, each DRS is either a string in
+clause format or a list of clauses (lists of strings):
+
+	{"pairs": [["b1 REF x1\nb1 dog \"n.01\" x1", [["b1", "REF", "x1"], ["b1", "cat", "\"n.01\"", "x1"]]]]}
+
+The response contains the counts and scores of each pair and of all pairs together (micro-average), or an error:
+
+	{"pairs": [{"match": 1, "prod": 1, "gold": 1, "precision": 1.0, "recall": 1.0, "f_score": 1.0, "budget_limited": 0}], "total": {...}}
+	{"error": "..."}
+
+Counter_client at the bottom of this file is a simple client to use the service from Python.
+'''
+
+import asyncio
+import json
+import os
+import socket
+
+from counter import create_arg_parser
+from counter_api import Counter_scorer, check_options
+from utils_counter import compute_f
+
+# Maximum length of a request line in bytes
+MAX_REQUEST = 1 << 30
+
+
+def build_arg_parser():
+	parser = create_arg_parser("Counter scoring service -- arguments", with_files=False)
+	parser.add_argument('-socket', default='',
+						help='Path of the Unix socket we listen on')
+	parser.add_argument('-port', type=int, default=0,
+						help='Localhost TCP port we listen on, if we do not use -socket')
+	parser.add_argument('-wait', type=float, default=10,
+						help='Milliseconds we wait for other requests before we score a batch (default 10)')
+	args = parser.parse_args()
+	if bool(args.socket) == bool(args.port):
+		raise ValueError('Specify either -socket or -port')
+	# The pairs are scored in a thread of the event loop, and forking a process with threads is not safe
+	if args.restart_parallel > 1:
+		raise NotImplementedError('-restart_parallel does not work in the scoring service, use -p instead')
+	# The service only returns scores, so the options of counter.py for files and output do not apply
+	return check_options(args)
+
+
+def get_pair_result(result, significant):
+	'''Counts and scores of a single DRS pair, or of all pairs together, given its (match, prod, gold, budget_limited)
+	   counts. For all pairs together budget_limited is the number of pairs that used up their time budget'''
+	precision, recall, f_score = compute_f(result[0], result[1], result[2], significant, False)
+	return {'match': result[0], 'prod': result[1], 'gold': result[2], 'precision': precision, 'recall': recall, 'f_score': f_score,
+			'budget_limited': result[3]}
+
+
+class Request_batcher:
+	'''Collects the DRS pairs of requests that arrive at about the same time and scores them as one batch, so that the
+	   workers are kept busy with the pairs of all clients'''
+	def __init__(self, scorer, wait):
+		self.scorer = scorer
+		self.wait = wait
+		self.pending = []
+		self.new_request = asyncio.Event()
+
+	async def score(self, pairs):
+		'''Return the results of the pairs of a single request, once their batch is done'''
+		future = asyncio.get_running_loop().create_future()
+		self.pending.append((pairs, future))
+		self.new_request.set()
+		return await future
+
+	async def run(self):
+		loop = asyncio.get_running_loop()
+		while True:
+			await self.new_request.wait()
+			# Wait a little for other requests, requests that arrive while we score a batch go in the next one
+			await asyncio.sleep(self.wait)
+			self.new_request.clear()
+			batch, self.pending = self.pending, []
+			pairs = [pair for request_pairs, _ in batch for pair in request_pairs]
+			try:
+				results = await loop.run_in_executor(None, self.scorer.count_pairs, pairs)
+			except Exception:
+				# Score the requests one by one, so that only the request that caused the error gets it
+				for request_pairs, future in batch:
+					try:
+						future.set_result(await loop.run_in_executor(None, self.scorer.count_pairs, request_pairs))
+					except Exception as e:
+						future.set_exception(e)
+				continue
+			start = 0
+			for request_pairs, future in batch:
+				future.set_result(results[start:start + len(request_pairs)])
+				start += len(request_pairs)
+
+
+async def handle_request(line, scorer, batcher):
+	'''Return the response to a single request line'''
+	try:
+		request = json.loads(line)
+		pairs = [scorer.parse_pair(pair, num) for num, pair in enumerate(request['pairs'], start=1)]
+		results = await batcher.score(pairs)
+	except Exception as e:
+		return {'error': '{0}: {1}'.format(type(e).__name__, e)}
+	total = [sum(result[idx] for result in results) for idx in range(4)]
+	return {'pairs': [get_pair_result(result, scorer.args.significant) for result in results],
+			'total': get_pair_result(total, scorer.args.significant)}
+
+
+async def serve(args):
+	scorer = Counter_scorer(args)
+	batcher = Request_batcher(scorer, args.wait / 1000.0)
+
+	async def handle_connection(reader, writer):
+		while True:
+			line = await reader.readline()
+			if not line:
+				break
+			response = await handle_request(line.decode('utf-8'), scorer, batcher)
+			writer.write(json.dumps(response).encode('utf-8') + b'\n')
+			await writer.drain()
+		writer.close()
+
+	if args.socket:
+		if os.path.exists(args.socket):
+			os.remove(args.socket)
+		server = await asyncio.start_unix_server(handle_connection, path=args.socket, limit=MAX_REQUEST)
+	else:
+		server = await asyncio.start_server(handle_connection, host='127.0.0.1', port=args.port, limit=MAX_REQUEST)
+	print('Counter scoring service listening on {0}'.format(args.socket or '127.0.0.1:{0}'.format(args.port)))
+	batch_task = asyncio.ensure_future(batcher.run())
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		batch_task.cancel()
+		scorer.close()
+		if args.socket and os.path.exists(args.socket):
+			os.remove(args.socket)
+
+
+class Counter_client:
+	'''Client of the scoring service, e.g. Counter_client(socket_path='/tmp/counter.sock') or Counter_client(port=7654)'''
+	def __init__(self, socket_path='', port=0, timeout=None):
+		if socket_path:
+			self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.sock.connect(socket_path)
+		else:
+			self.sock = socket.create_connection(('127.0.0.1', port))
+		self.sock.settimeout(timeout)
+		self.in_f = self.sock.makefile('rb')
+
+	def score(self, pairs):
+		'''Score a list of (prod, gold) DRS pairs, returns the response dict with the results of each pair and the total
+		   Raises a ValueError if the service could not score them'''
+		self.sock.sendall(json.dumps({'pairs': [list(pair) for pair in pairs]}).encode('utf-8') + b'\n')
+		response = json.loads(self.in_f.readline().decode('utf-8'))
+		if 'error' in response:
+			raise ValueError(response['error'])
+		return response
+
+	def close(self):
+		self.in_f.close()
+		self.sock.close()
+
+
+if __name__ == "__main__":
+	args = build_arg_parser()
+	try:
+		asyncio.run(serve(args))
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,164 @@
+'''Module with a compact binary format for pre-parsed DRS files, mainly meant for the gold files
+   The DRSs are saved after they are validated with the signature and normalized (-Of inversion and reordering of
+   inv_boxes), with their clauses as symbol IDs and their original lines. Redundant REF clauses are kept but marked,
+   so that we can still decide on -ic when loading. Loading only maps the file in memory and reads the symbol table,
+   the DRSs themselves are only decoded when we need them. The arrays are always written little-endian, with the
+   item size of each array in the header, so the files can be used on other machines as well
+
+   Convert a file with:     python drs_corpus.py ../data/pmb-4.0.0/gold/dev.txt -g clf_signature.yaml
+   This creates dev.txt.drsc, which can be used as -f1 or -f2 of counter.py'''
+
+import argparse
+import hashlib
+import json
+import mmap
+import sys
+from array import array
+
+try:
+	from sys import intern
+except ImportError:
+	intern = lambda symbol: symbol
+
+MAGIC = b'DRSCORPUS 1\n'
+# Arrays of the format, with their type and their number of items: a number in the header plus an extra offset
+SECTIONS = [('drs_start', 'q', 'num_drs', 1), ('clause_start', 'q', 'num_clauses', 1), ('tokens', 'i', 'num_tokens', 0),
+			('redundant', 'b', 'num_clauses', 0), ('line_start', 'q', 'num_clauses', 1)]
+BYTEORDER = 'little'
+
+
+def get_signature_key(signature):
+	'''Hash of the signature, since the validation of the DRSs depends on it'''
+	return hashlib.sha1(json.dumps(signature, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_item_sizes():
+	'''Item size of each array on this machine'''
+	return dict((name, array(typecode).itemsize) for name, typecode, _, _ in SECTIONS)
+
+
+def is_corpus_file(file_name):
+	'''Check if a file is in the binary corpus format'''
+	with open(file_name, 'rb') as in_f:
+		return in_f.read(len(MAGIC)) == MAGIC
+
+
+def write_corpus(out_file, drss, signature):
+	'''Write a binary corpus. drss is a list of (clauses, original, redundant, error) tuples: the normalized clauses
+	   of a DRS, their original lines, whether each clause is a redundant REF clause and the error message if the DRS
+	   is ill-formed (otherwise None)'''
+	arrays = dict((name, array(typecode)) for name, typecode, _, _ in SECTIONS)
+	symbols, symbol_ids, text, errors = [], {}, [], {}
+	arrays['drs_start'].append(0)
+	arrays['clause_start'].append(0)
+	arrays['line_start'].append(0)
+	for num, (clauses, original, redundant, error) in enumerate(drss):
+		for clause, line, is_redundant in zip(clauses, original, redundant):
+			for item in clause:
+				if item not in symbol_ids:
+					symbol_ids[item] = len(symbols)
+					symbols.append(item)
+				arrays['tokens'].append(symbol_ids[item])
+			arrays['clause_start'].append(len(arrays['tokens']))
+			arrays['redundant'].append(1 if is_redundant else 0)
+			line = line.encode('utf-8')
+			text.append(line)
+			arrays['line_start'].append(arrays['line_start'][-1] + len(line))
+		arrays['drs_start'].append(len(arrays['clause_start']) - 1)
+		if error is not None:
+			errors[num] = error
+	symbol_blob = '\n'.join(symbols).encode('utf-8')
+	header = {'num_drs': len(arrays['drs_start']) - 1, 'num_clauses': len(arrays['redundant']), 'num_tokens': len(arrays['tokens']),
+			  'symbol_bytes': len(symbol_blob), 'signature': get_signature_key(signature), 'errors': errors,
+			  'byteorder': BYTEORDER, 'item_sizes': get_item_sizes()}
+	with open(out_file, 'wb') as out_f:
+		out_f.write(MAGIC)
+		out_f.write(json.dumps(header).encode('utf-8') + b'\n')
+		for name, _, _, _ in SECTIONS:
+			if sys.byteorder != BYTEORDER:
+				arrays[name].byteswap()
+			arrays[name].tofile(out_f)
+		out_f.write(symbol_blob)
+		out_f.write(b''.join(text))
+
+
+class DRS_corpus:
+	'''Random access to the DRSs of a binary corpus file'''
+	def __init__(self, file_name, signature):
+		self.file_name = file_name
+		self.in_f = open(file_name, 'rb')
+		self.mm = mmap.mmap(self.in_f.fileno(), 0, access=mmap.ACCESS_READ)
+		header_end = self.mm.find(b'\n', len(MAGIC)) + 1
+		header = json.loads(self.mm[len(MAGIC):header_end].decode('utf-8'))
+		if header['signature'] != get_signature_key(signature):
+			raise ValueError('{0} was converted with a different signature, convert it again with drs_corpus.py'.format(file_name))
+		# The arrays can only be read with the byte order and item sizes they were written with
+		if header['byteorder'] != BYTEORDER or header['item_sizes'] != get_item_sizes():
+			raise ValueError('{0} was written with a different byte order or item sizes, convert it again with drs_corpus.py'.format(file_name))
+		self.errors = dict((int(num), error) for num, error in header['errors'].items())
+		pos = header_end
+		for name, typecode, size, extra in SECTIONS:
+			values = array(typecode)
+			num_bytes = (header[size] + extra) * values.itemsize
+			values.frombytes(self.mm[pos:pos + num_bytes])
+			if sys.byteorder != BYTEORDER:
+				values.byteswap()
+			setattr(self, name, values)
+			pos += num_bytes
+		self.symbols = [intern(symbol) for symbol in self.mm[pos:pos + header['symbol_bytes']].decode('utf-8').split('\n')]
+		self.text_start = pos + header['symbol_bytes']
+
+	def __len__(self):
+		return len(self.drs_start) - 1
+
+	def get(self, num):
+		'''Return the clauses (as tuples), the original lines, the redundant REF flags and the error (None if the DRS
+		   is valid) of DRS num (starting at 0)'''
+		if num < 0 or num >= len(self):
+			raise IndexError('DRS {0} does not exist, {1} contains {2} DRSs'.format(num + 1, self.file_name, len(self)))
+		clauses, original = [], []
+		for idx in range(self.drs_start[num], self.drs_start[num + 1]):
+			clauses.append(tuple(self.symbols[symbol_id] for symbol_id in self.tokens[self.clause_start[idx]:self.clause_start[idx + 1]]))
+			original.append(self.mm[self.text_start + self.line_start[idx]:self.text_start + self.line_start[idx + 1]].decode('utf-8'))
+		redundant = [bool(flag) for flag in self.redundant[self.drs_start[num]:self.drs_start[num + 1]]]
+		return clauses, original, redundant, self.errors.get(num)
+
+	def close(self):
+		self.mm.close()
+		self.in_f.close()
+
+
+def convert_file(file_name, out_file, signature):
+	'''Parse, validate and normalize all DRSs of a file and save them in the binary format'''
+	from clf_referee import check_clf
+	from clf_parser import read_clfs
+	from counter import DRS, normalize_clauses, var_occurs
+	inv_boxes = DRS(signature).inv_boxes
+	drss = []
+	for clf in read_clfs(file_name):
+		try:
+			check_clf(clf.clauses, signature, v=False)
+			error = None
+		except Exception as e:
+			error = str(e)
+		clauses, original = normalize_clauses([list(clause) for clause in clf.clauses], clf.original, inv_boxes, True)
+		redundant = [clause[1] == 'REF' and var_occurs(clauses, clause[2], clause[0], idx) for idx, clause in enumerate(clauses)]
+		drss.append((clauses, original, redundant, error))
+	write_corpus(out_file, drss, signature)
+	return len(drss)
+
+
+def build_arg_parser():
+	parser = argparse.ArgumentParser(description='Convert a file with DRSs in clause format to the binary corpus format')
+	parser.add_argument('file', help='File with DRSs in clause format')
+	parser.add_argument('-o', '--out', default='', help='Output file (default file + .drsc)')
+	parser.add_argument('-g', '--sig_file', default='', help='Path of the file that contains the signature of clausal forms')
+	return parser.parse_args()
+
+
+if __name__ == "__main__":
+	args = build_arg_parser()
+	from clf_referee import get_signature
+	out_file = args.out if args.out else args.file + '.drsc'
+	num_drs = convert_file(args.file, out_file, get_signature(args.sig_file))
+	print('Converted {0} DRSs to {1}'.format(num_drs, out_file))
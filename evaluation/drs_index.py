@@ -0,0 +1,123 @@
+'''Module with a byte-offset index for files with DRSs in clause format
+   DRSs are separated by empty lines, so finding DRS i normally needs a scan of the full file. The index saves where
+   each DRS starts and ends. It is kept in memory, and if we give an index directory it is also saved there, so that
+   it is only built once per file. A saved index is rebuilt when the size or modification time of the file changed.
+   With the index we can read any DRS directly from a memory-mapped file'''
+
+import hashlib
+import mmap
+import os
+from array import array
+
+# Indexes we already loaded in this process, keyed by the path of the file and get_file_key
+loaded_indexes = {}
+
+
+def get_file_key(file_name):
+	'''Size and modification time (in microseconds) of a file, to check if the index is still up to date'''
+	stat = os.stat(file_name)
+	return [stat.st_size, int(stat.st_mtime * 1000000)]
+
+
+def build_index(file_name):
+	'''Return the start and end byte offsets of all DRSs in a file. A DRS is a block of non-empty lines that
+	   contains at least one clause. Just like in clf_parser.read_clfs, blocks with only comments (e.g. the sentence ID)
+	   belong to the next DRS, so the DRS then starts at the first of these comments'''
+	starts, ends = array('q'), array('q')
+	pos, block_start, has_clause = 0, None, False
+	with open(file_name, 'rb') as in_f:
+		for line in in_f:
+			stripped = line.strip()
+			if not stripped:
+				if has_clause:
+					starts.append(block_start)
+					ends.append(pos)
+					block_start, has_clause = None, False
+			else:
+				if block_start is None:
+					block_start = pos
+				if not stripped.startswith(b'%'):
+					has_clause = True
+			pos += len(line)
+	if block_start is not None and has_clause:  # no newline at the end, still add the DRS
+		starts.append(block_start)
+		ends.append(pos)
+	return starts, ends
+
+
+def get_index_file(file_name, index_dir):
+	'''Name of the saved index of a file in index_dir: the name of the file with a hash of its full path, so that files
+	   with the same name in different directories get their own index'''
+	path_hash = hashlib.sha1(os.path.abspath(file_name).encode('utf-8')).hexdigest()[:16]
+	return os.path.join(index_dir, '{0}.{1}.idx'.format(os.path.basename(file_name), path_hash))
+
+
+def load_index(file_name, index_dir=''):
+	'''Return the start and end offsets of the DRSs in a file. With an index_dir, we read the index from there if it
+	   is still up to date, otherwise we build it and try to save it there, which is fine to fail (e.g. for read-only
+	   directories). Without index_dir nothing is written, the index is only kept in memory for this process'''
+	key = get_file_key(file_name)
+	loaded_key = (os.path.abspath(file_name), tuple(key))
+	if loaded_key in loaded_indexes:
+		return loaded_indexes[loaded_key]
+	idx_file = get_index_file(file_name, index_dir) if index_dir else ''
+	offsets = read_index(idx_file, key) if idx_file else None
+	if offsets is None:
+		offsets = build_index(file_name)
+		if idx_file:
+			save_index(idx_file, key, *offsets)
+	loaded_indexes[loaded_key] = offsets
+	return offsets
+
+
+def read_index(idx_file, key):
+	'''Return the start and end offsets of a saved index, or None if it does not exist or is not up to date'''
+	if os.path.isfile(idx_file):
+		header = array('q')
+		with open(idx_file, 'rb') as in_f:
+			try:
+				header.fromfile(in_f, 3)
+				if list(header[:2]) == key:
+					offsets = array('q')
+					offsets.fromfile(in_f, 2 * header[2])
+					return offsets[:header[2]], offsets[header[2]:]
+			except EOFError:
+				pass  # incomplete index, rebuild it
+	return None
+
+
+def save_index(idx_file, key, starts, ends):
+	'''Save an index, it is fine if that fails'''
+	try:
+		if not os.path.isdir(os.path.dirname(idx_file)):
+			os.makedirs(os.path.dirname(idx_file))
+		with open(idx_file, 'wb') as out_f:
+			array('q', key + [len(starts)]).tofile(out_f)
+			starts.tofile(out_f)
+			ends.tofile(out_f)
+	except (IOError, OSError):
+		pass
+
+
+class DRS_file:
+	'''Random access to the DRSs of a file, by memory-mapping the file and using the offset index (see load_index)'''
+	def __init__(self, file_name, index_dir=''):
+		self.file_name = file_name
+		self.starts, self.ends = load_index(file_name, index_dir)
+		self.in_f = open(file_name, 'rb')
+		# Empty files can not be memory-mapped, but then there are no DRSs to read anyway
+		self.mm = mmap.mmap(self.in_f.fileno(), 0, access=mmap.ACCESS_READ) if self.starts else None
+
+	def __len__(self):
+		return len(self.starts)
+
+	def get_lines(self, num):
+		'''Return the lines of DRS num (starting at 0), including its comments'''
+		if num < 0 or num >= len(self.starts):
+			raise IndexError('DRS {0} does not exist, {1} contains {2} DRSs'.format(num + 1, self.file_name, len(self.starts)))
+		return self.mm[self.starts[num]:self.ends[num]].decode('utf-8').rstrip('\n').split('\n')
+
+	def close(self):
+		if self.mm is not None:
+			self.mm.close()
+		self.in_f.close()
@@ -1,29 +1,502 @@
 '''Module that has the functions for the hill-climbing method for the clause matching'''
 
-import random, psutil, os
-
-class DRS_match:
-	'''Class to keep track of all the matching information'''
-	def __init__(self):
-		self.matched_clause_keys = {}
-		#we have to make sure that each produced and gold clause can only be (partially) matched once. We save that here and check
-		self.clause_dict_gold = {}
-		self.clause_dict_prod = {}
-		#Save all combinations of variables that match, so we can print matching clauses later
-		self.clause_pairs = {}
+import multiprocessing
+import random
+import time
+from array import array
+from collections import OrderedDict
+from branch_and_bound import branch_and_bound
+from local_search import simulated_annealing, tabu_search
+
+class DRS_pool:
+	'''Compiled version of the candidate pool (candidate_mappings + weight_dict) with flat, integer-indexed tables.
+	   A node pair (i, m) gets the index i * num_vars + m. For each node pair we save the keys of weight_dict as
+	   entries with a precomputed canonical clause key, the other node pairs that need to match and the clauses they match.
+	   The scratch lists are reused for every call of compute_match, so no dicts have to be created there'''
+	def __init__(self, candidate_mappings, weight_dict, num_vars, num_gold_clauses, num_prod_clauses):
+		self.num_vars = num_vars
+		num_pairs = len(candidate_mappings) * num_vars
+		# Sorted candidates per produced variable, and the other way around: which produced variables can map to a gold variable
+		self.candidates = [sorted(cands) for cands in candidate_mappings]
+		self.rev_candidates = [[] for _ in range(num_vars)]
+		for i, cands in enumerate(self.candidates):
+			for m in cands:
+				self.rev_candidates[m].append(i)
+
+		# Entries of weight_dict per node pair, in the order that compute_match has always processed them
+		self.entry_start = [0] * (num_pairs + 1)
+		self.entry_key = []              # canonical clause key of the entry, so that we only match a clause once
+		self.entry_req_start = [0]       # other node pairs that have to be in the mapping (req_prod[x] -> req_gold[x])
+		self.req_prod, self.req_gold = [], []
+		self.entry_clause_start = [0]    # gold and produced clause indices this entry can match
+		self.entry_gold, self.entry_prod = [], []
+		canonical_keys = {}
+
+		# Each possible clause match is also saved once with all node pairs it needs, for the incremental search
+		self.match_gold, self.match_prod, self.match_pairs = [], [], []
+		seen = {}
+
+		entries = [[] for _ in range(num_pairs)]
+		for node_pair in weight_dict:
+			for key in weight_dict[node_pair]:
+				entries[node_pair[0] * num_vars + node_pair[1]].append((node_pair, key))
+		for pair_idx in range(num_pairs):
+			for node_pair, key in entries[pair_idx]:
+				if isinstance(key, int):
+					# matching clauses resulting from roles_two_abs clauses, these keys are unique already
+					others = ()
+					canonical = (node_pair, key)
+				elif not any(isinstance(inst, tuple) for inst in key):
+					# key looks like this: (2,3)
+					others = (key,)
+					canonical = tuple(sorted((key, node_pair), key=lambda item: item[0]))
+				else:
+					# key looks like this: ((2,3), (3,4)) for clauses with 3 variables
+					others = key
+					canonical = tuple(sorted(key + (node_pair,), key=lambda item: item[0]))
+				self.entry_key.append(canonical_keys.setdefault(canonical, len(canonical_keys)))
+				for other in others:
+					self.req_prod.append(other[0])
+					self.req_gold.append(other[1])
+				self.entry_req_start.append(len(self.req_prod))
+				pairs = tuple(sorted(set((node_pair,) + others)))
+				for item in weight_dict[node_pair][key]:
+					self.entry_gold.append(item[2])
+					self.entry_prod.append(item[3])
+					if (item[2], item[3], pairs) not in seen:
+						seen[item[2], item[3], pairs] = len(self.match_pairs)
+						self.match_gold.append(item[2])
+						self.match_prod.append(item[3])
+						self.match_pairs.append([p[0] * num_vars + p[1] for p in pairs])
+				self.entry_clause_start.append(len(self.entry_gold))
+			self.entry_start[pair_idx + 1] = len(self.entry_key)
+
+		# Clause matches that are affected by setting a node pair
+		pair_matches = [[] for _ in range(num_pairs)]
+		for idx, pairs in enumerate(self.match_pairs):
+			for pair_idx in pairs:
+				pair_matches[pair_idx].append(idx)
+		self.pair_match_start = [0] * (num_pairs + 1)
+		self.pair_matches = []
+		for pair_idx in range(num_pairs):
+			self.pair_matches.extend(pair_matches[pair_idx])
+			self.pair_match_start[pair_idx + 1] = len(self.pair_matches)
+
+		# A produced clause can only match a single gold clause and vice versa. Matches of the same produced clause
+		# that need the exact same node pairs can be true at the same time (e.g. b1 NEQ x1 x2 matching both b2 NEQ x3 x4
+		# and b2 NEQ x4 x3), so we put those gold clauses in the same group. The number of matching clauses in a group
+		# is then the minimum of the number of gold and produced clauses that match in it
+		parent = {}
+		def find(g):
+			while parent.setdefault(g, g) != g:
+				g = parent[g]
+			return g
+		prod_pair_group, gold_pair_group = {}, {}
+		# If no two matches can share a gold or produced clause at the same time, the number of matching clauses
+		# is simply the number of clause matches that have all their node pairs in the mapping
+		self.linear = True
+		for (gold_idx, prod_idx, pairs) in seen:
+			if (prod_idx, pairs) in prod_pair_group:
+				parent[find(gold_idx)] = find(prod_pair_group[prod_idx, pairs])
+				self.linear = False
+			else:
+				prod_pair_group[prod_idx, pairs] = gold_idx
+			if gold_pair_group.setdefault((gold_idx, pairs), prod_idx) != prod_idx:
+				self.linear = False
+		groups = {}
+		self.match_group = [groups.setdefault(find(g), len(groups)) for g in self.match_gold]
+		self.num_groups = len(groups)
+
+		# Scratch lists for compute_match: an item is in use if it has the value of the current stamp
+		self.stamp = 0
+		self.gold_used = [0] * num_gold_clauses
+		self.prod_used = [0] * num_prod_clauses
+		self.key_used = [0] * len(canonical_keys)
+
+
+class DRS_search:
+	'''Class that keeps the current mapping, its inverse and the matching clauses up to date during hill-climbing.
+	   The gain of a move or swap is computed by only looking at the clauses that contain the changed variable pairs,
+	   instead of computing the full match again for each candidate mapping'''
+	def __init__(self, pool):
+		self.pool = pool
+		self.num_vars = pool.num_vars
+		self.candidates = pool.candidates
+		self.rev_candidates = pool.rev_candidates
+		self.set_mapping([-1] * len(pool.candidates))
+
+	def set_mapping(self, mapping):
+		'''Reset the search state to a new mapping'''
+		self.mapping = [-1] * len(self.candidates)
+		self.inverse = [-1] * self.num_vars
+		self.need = [len(pairs) for pairs in self.pool.match_pairs]
+		self.gold_count, self.prod_count = {}, {}
+		self.group_gold = [0] * self.pool.num_groups
+		self.group_prod = [0] * self.pool.num_groups
 		self.match_num = 0
-		self.mapping = [] #initialized empty but always set to the current mapping
-		self.weight_dict = {} #initialized empty but always set to the current weight_dict
+		for i, m in enumerate(mapping):
+			if m != -1:
+				self.set_pair(i, m)
+
+	def add_clause(self, idx):
+		'''Clause match idx now has all its node pairs in the mapping'''
+		group = self.pool.match_group[idx]
+		old = min(self.group_gold[group], self.group_prod[group])
+		gold_idx, prod_idx = self.pool.match_gold[idx], self.pool.match_prod[idx]
+		if not self.gold_count.get(gold_idx):
+			self.group_gold[group] += 1
+		if not self.prod_count.get(prod_idx):
+			self.group_prod[group] += 1
+		self.gold_count[gold_idx] = self.gold_count.get(gold_idx, 0) + 1
+		self.prod_count[prod_idx] = self.prod_count.get(prod_idx, 0) + 1
+		self.match_num += min(self.group_gold[group], self.group_prod[group]) - old
+
+	def remove_clause(self, idx):
+		'''Clause match idx lost one of its node pairs'''
+		group = self.pool.match_group[idx]
+		old = min(self.group_gold[group], self.group_prod[group])
+		gold_idx, prod_idx = self.pool.match_gold[idx], self.pool.match_prod[idx]
+		self.gold_count[gold_idx] -= 1
+		self.prod_count[prod_idx] -= 1
+		if not self.gold_count[gold_idx]:
+			self.group_gold[group] -= 1
+		if not self.prod_count[prod_idx]:
+			self.group_prod[group] -= 1
+		self.match_num += min(self.group_gold[group], self.group_prod[group]) - old
+
+	def set_pair(self, i, m):
+		'''Map produced variable i to gold variable m'''
+		self.mapping[i] = m
+		self.inverse[m] = i
+		pair_idx = i * self.num_vars + m
+		for idx in self.pool.pair_matches[self.pool.pair_match_start[pair_idx]:self.pool.pair_match_start[pair_idx + 1]]:
+			self.need[idx] -= 1
+			if self.need[idx] == 0:
+				self.add_clause(idx)
+
+	def unset_pair(self, i, m):
+		'''Remove the mapping of produced variable i to gold variable m'''
+		self.mapping[i] = -1
+		self.inverse[m] = -1
+		pair_idx = i * self.num_vars + m
+		for idx in self.pool.pair_matches[self.pool.pair_match_start[pair_idx]:self.pool.pair_match_start[pair_idx + 1]]:
+			if self.need[idx] == 0:
+				self.remove_clause(idx)
+			self.need[idx] += 1
+
+	def do_move(self, i, m_new):
+		'''Remap produced variable i to the unmatched gold variable m_new (-1 for no mapping)'''
+		if self.mapping[i] != -1:
+			self.unset_pair(i, self.mapping[i])
+		if m_new != -1:
+			self.set_pair(i, m_new)
+
+	def do_swap(self, i, j):
+		'''Swap the gold variables of produced variables i and j'''
+		m, m2 = self.mapping[i], self.mapping[j]
+		self.do_move(i, -1)
+		self.do_move(j, m)
+		self.do_move(i, m2)
+
+	def move_gain(self, i, m_new):
+		'''Gain of remapping i to m_new, leaves the state unchanged'''
+		old_num, m = self.match_num, self.mapping[i]
+		self.do_move(i, m_new)
+		gain = self.match_num - old_num
+		self.do_move(i, -1)
+		self.do_move(i, m)
+		return gain
+
+	def swap_gain(self, i, j):
+		'''Gain of swapping the gold variables of i and j, leaves the state unchanged'''
+		old_num = self.match_num
+		self.do_swap(i, j)
+		gain = self.match_num - old_num
+		self.do_swap(i, j)
+		return gain
+
+	def get_operations(self, nodes=None):
+		'''Yield the operations (use_swap, node1, node2) of the neighbourhood of the current mapping, first the moves and
+		   then the swaps. Only moves to unmatched candidate variables are considered, and only swaps in which at least
+		   one of the new node pairs is a candidate (otherwise there can be no gain). With nodes, we only yield the
+		   operations that change the gold variable of these produced variables. The hill-climbing, the simulated
+		   annealing and the tabu search (see local_search.py) all use this neighbourhood'''
+		mapping, inverse, candidates = self.mapping, self.inverse, self.candidates
+		all_nodes = nodes is None
+		nodes = range(len(mapping)) if all_nodes else nodes
+		## moves ##
+		for i in nodes:
+			for nm in candidates[i]:
+				if inverse[nm] == -1:
+					# (i, m) -> (i, nm)
+					yield (False, i, nm)
+
+		## swaps ##
+		for i in nodes:
+			# swap operation (i, m) (j, m2) -> (i, m2) (j, m), for all nodes only for j > i to avoid duplicate swaps
+			m, lowest = mapping[i], i if all_nodes else -1
+			partners = set(inverse[m2] for m2 in candidates[i] if inverse[m2] > lowest)
+			if m != -1:
+				partners.update(j for j in self.rev_candidates[m] if j > lowest)
+			partners.discard(i)
+			for j in sorted(partners):
+				yield (True, i, j)
+
+	def get_gain(self, operation):
+		'''Gain of a move or swap, leaves the state unchanged'''
+		use_swap, node1, node2 = operation
+		return self.swap_gain(node1, node2) if use_swap else self.move_gain(node1, node2)
+
+	def get_best_gain(self):
+		"""
+		Hill-climbing method to return the best gain swap/move can get, over the operations of get_operations
+		Returns:
+			the best gain we can get via swap/move operation, and the operation itself (use_swap, node1, node2)
+		"""
+		largest_gain = 0
+		best_op = None
+		for operation in self.get_operations():
+			gain = self.get_gain(operation)
+			if gain > largest_gain:
+				largest_gain = gain
+				best_op = operation
+		return largest_gain, best_op
+
+	def do_operation(self, operation):
+		'''Perform a move or swap as returned by get_best_gain'''
+		use_swap, node1, node2 = operation
+		if use_swap:
+			self.do_swap(node1, node2)
+		else:
+			self.do_move(node1, node2)
+
+
+class Mapping_memo:
+	'''Size-bounded memo of the match number per mapping, so that we don't have to calculate stuff twice.
+	   Mappings are saved as packed bytes instead of tuples of ints. If the byte budget is exceeded, the least
+	   recently used mappings are removed, instead of clearing everything at once'''
+	entry_overhead = 100 # estimate of the bytes needed per entry on top of the key itself
+
+	def __init__(self, max_bytes):
+		self.memo = OrderedDict()
+		self.max_bytes = max_bytes
+		self.num_bytes = 0
+		self.hits, self.misses, self.evictions = 0, 0, 0
+
+	def key(self, mapping):
+		'''Compact key for a mapping'''
+		return array('i', mapping).tobytes()
+
+	def get(self, key):
+		'''Return the saved match number of a mapping key, or None if we don't have it (anymore)'''
+		if key in self.memo:
+			self.hits += 1
+			# Move to the end, so that it is the most recently used item
+			match_num = self.memo.pop(key)
+			self.memo[key] = match_num
+			return match_num
+		self.misses += 1
+		return None
+
+	def add(self, key, match_num):
+		'''Save the match number of a mapping key, evict least recently used mappings if we are over budget'''
+		if key not in self.memo:
+			self.num_bytes += len(key) + self.entry_overhead
+		self.memo[key] = match_num
+		while self.num_bytes > self.max_bytes and self.memo:
+			old_key, _ = self.memo.popitem(last=False)
+			self.num_bytes -= len(old_key) + self.entry_overhead
+			self.evictions += 1
+
+	def stats(self):
+		'''Return list of [hits, misses, evictions]'''
+		return [self.hits, self.misses, self.evictions]
+
+
+class LRU_cache:
+	'''Dictionary with at most max_size items, like Mapping_memo the least recently used items are removed if it is full
+	   (max_size 0 means no maximum). Used for the preprocessed DRSs and candidate pools and for the score cache'''
+	def __init__(self, max_size=0):
+		self.items = OrderedDict()
+		self.max_size = max_size
+
+	def __contains__(self, key):
+		return key in self.items
+
+	def __len__(self):
+		return len(self.items)
+
+	def __getitem__(self, key):
+		# Move to the end, so that it is the most recently used item
+		value = self.items.pop(key)
+		self.items[key] = value
+		return value
+
+	def __setitem__(self, key, value):
+		self.items.pop(key, None)
+		self.items[key] = value
+		while self.max_size > 0 and len(self.items) > self.max_size:
+			self.items.popitem(last=False)
+
+
+def get_isomorphic_match(prod_drs, gold_drs):
+	'''Check if the DRSs are the same up to variable renaming, by comparing the hashes and clauses of their canonical form
+	   Returns the mapping and clause pairs of the perfect match if they are, otherwise None'''
+	if prod_drs.total_clauses != gold_drs.total_clauses or len(prod_drs.var_map) != len(gold_drs.var_map):
+		return None
+	# Clauses with three variables never match if a variable occurs twice (see add_node_pairs), so we have to search
+	if any(len(set([clause[0], clause[2], clause[3]])) < 3 for clause in prod_drs.op_three_vars + prod_drs.roles):
+		return None
+	prod_clauses, prod_hash, prod_names = prod_drs.get_canonical_form()
+	gold_clauses, gold_hash, gold_names = gold_drs.get_canonical_form()
+	if prod_hash != gold_hash or sorted(prod_clauses) != sorted(gold_clauses):
+		return None
+	# Clauses that get the same canonical form (e.g. b1 NEQ x1 x2 and b1 NEQ x2 x1) can not be matched one-to-one
+	gold_idx = dict((clause, idx) for idx, clause in enumerate(gold_clauses))
+	if len(gold_idx) != len(gold_clauses):
+		return None
+	clause_pairs = dict(((gold_idx[clause], prod_idx), 1) for prod_idx, clause in enumerate(prod_clauses))
+	gold_vars = dict((name, var) for var, name in gold_names.items())
+	mapping = [-1] * len(prod_drs.var_map)
+	for var, name in prod_names.items():
+		mapping[prod_drs.var_index[var]] = gold_drs.var_index[gold_vars[name]]
+	return mapping, clause_pairs
+
+
+class Search_deadline:
+	'''Time budget for the search of a single DRS pair (-max_time), remembers if we ran out of time'''
+	def __init__(self, seconds):
+		self.end = time.time() + seconds
+		self.passed = False
+
+	def check(self):
+		'''Return whether the time budget is used up'''
+		if not self.passed and time.time() > self.end:
+			self.passed = True
+		return self.passed
+
+
+def hill_climb(search, cur_mapping, match_num, total_clauses, deadline=None):
+	'''Do hill-climbing from cur_mapping until there is no gain for a new node mapping, or until the deadline
+	   Returns the final mapping and its number of matching clauses'''
+	search.set_mapping(cur_mapping)
+	while True:
+		if deadline is not None and deadline.check():
+			break
+		# get best gain
+		(gain, operation) = search.get_best_gain()
+
+		if match_num + gain > total_clauses:
+			print(search.mapping, operation, match_num + gain, total_clauses)
+			raise ValueError(
+				"More matches than there are produced clauses. If this ever occurs something is seriously wrong with the algorithm")
 
+		if gain <= 0:
+			# print 'No gain so break'
+			break
+		# otherwise update match_num and mapping
+		match_num += gain
+		search.do_operation(operation)
+	return search.mapping[:], match_num
+
+
+def do_restart(search, local_search, cur_mapping, match_num, upper_bound, total_clauses, args, deadline=None):
+	'''Search from the mapping of a single restart: first simulated annealing or tabu search with -search anneal or tabu
+	   to escape local optima, then hill-climbing finishes the mapping. Returns the final mapping and its match number
+	   The simulated annealing of a restart is seeded with its start mapping, so that its result is the same if a
+	   worker of -restart_parallel does the restart. It does not change the random state of the other restarts either'''
+	if args.search == 'anneal':
+		rng = random.Random(array('i', cur_mapping).tobytes())
+		cur_mapping, match_num = simulated_annealing(local_search, cur_mapping, upper_bound, args.anneal_start, args.anneal_end, args.anneal_steps, deadline, rng)
+	elif args.search == 'tabu':
+		cur_mapping, match_num = tabu_search(local_search, cur_mapping, upper_bound, args.tabu_tenure, args.tabu_iters, deadline)
+	# Do hill-climbing until there will be no gain for new node mapping
+	return hill_climb(search, cur_mapping, match_num, total_clauses, deadline)
+
+
+class Restart_workers:
+	"""
+	Worker processes that do the random restarts of a single large DRS pair (-restart_parallel). The workers are forked,
+	so they share the candidate pool and the search objects read-only, and take the restarts in order from a shared
+	counter. get_best_match asks for the results in restart order with get, so it stops at the same restart as when it
+	does them one by one (upper bound, -patience, -patience_seen, time budget), and then calls stop. The result of a
+	restart does not depend on the worker that does it (see do_restart). The workers also stop by themselves after a
+	restart that reached the upper bound, through the shared stop_idx
+	Arguments:
+		search, local_search: DRS_search objects for the hill-climbing and for -search anneal or tabu
+		restarts: list of [mapping, match_num] to start from
+		first_idx: restart number of the first of these restarts in get_best_match
+		done_mappings: dict with the local optima we already found
+		upper_bound, total_clauses, args, deadline: as in get_best_match
+		workers: number of worker processes
+	"""
+	def __init__(self, search, local_search, restarts, first_idx, done_mappings, upper_bound, total_clauses, args, deadline, workers):
+		context = multiprocessing.get_context('fork')
+		next_idx = context.Value('i', 0)
+		# Lowest restart after which we do not need any restarts
+		self.stop_idx = context.Value('i', len(restarts))
+		self.queue = context.Queue()
+		self.first_idx = first_idx
+		self.results = {}
+
+		def work():
+			try:
+				while True:
+					with next_idx.get_lock():
+						idx = next_idx.value
+						next_idx.value += 1
+					if idx > self.stop_idx.value or idx >= len(restarts) or (first_idx + idx > 0 and deadline is not None and deadline.check()):
+						break
+					cur_mapping, match_num = restarts[idx]
+					if tuple(cur_mapping) in done_mappings:
+						match_num = done_mappings[tuple(cur_mapping)]
+					else:
+						cur_mapping, match_num = do_restart(search, local_search, cur_mapping, match_num, upper_bound, total_clauses, args, deadline)
+					passed = deadline is not None and deadline.passed
+					if not passed:
+						done_mappings[tuple(cur_mapping)] = match_num
+					if match_num >= upper_bound:
+						with self.stop_idx.get_lock():
+							self.stop_idx.value = min(self.stop_idx.value, idx)
+					self.queue.put((first_idx + idx, (cur_mapping, match_num, passed)))
+			except Exception as e:
+				self.queue.put(e)
+			finally:
+				self.queue.put(None)
+
+		# Daemon processes, so that they do not outlive this process if the search fails
+		self.processes = [context.Process(target=work, daemon=True) for _ in range(min(workers, len(restarts)))]
+		for process in self.processes:
+			process.start()
+		self.running = len(self.processes)
+
+	def get(self, idx):
+		'''Wait for the result of restart idx: (final mapping, match number, whether the time budget was used up)
+		   None if it is not one of our restarts, or if the workers skipped it because the time budget was used up'''
+		if idx < self.first_idx:
+			return None
+		while idx not in self.results and self.running:
+			item = self.queue.get()
+			if item is None:
+				self.running -= 1
+			elif isinstance(item, Exception):
+				self.stop()
+				raise item
+			else:
+				self.results[item[0]] = item[1]
+		return self.results.pop(idx, None)
 
-def get_memory_usage():
-	'''return the memory usage in MB'''
-	process = psutil.Process(os.getpid())
-	mem = process.memory_info()[0] / float(1000000)
-	return mem
+	def stop(self):
+		'''Stop the workers, the restarts they are still doing are not needed anymore'''
+		with self.stop_idx.get_lock():
+			self.stop_idx.value = -1
+		for process in self.processes:
+			process.terminate()
+			process.join()
+		self.running = 0
 
 
-def get_best_match(prod_drs, gold_drs, args, single):
+def get_best_match(prod_drs, gold_drs, args, single, pool_cache=None, restart_workers=1, rng=random):
 	"""
 	Get the highest clause match number between two sets of clauses via hill-climbing.
 	Arguments:
@@ -31,118 +504,238 @@ def get_best_match(prod_drs, gold_drs, args, single):
 		gold_drs: Object with all information of the gold DRS
 		args: command line argparse arguments
 		single: whether this is the only DRS we do
+		pool_cache: dict in which we keep the candidate pool of each DRS pair, so that we only compute it once if we
+					search the same pair again (e.g. for -runs). None means we do not keep them
+		restart_workers: number of processes for the random restarts of this DRS pair (-restart_parallel), the result
+						 is the same as with a single process
+		rng: random number generator for the smart and random mappings we start from (default the random module)
 	Returns:
 		best_match: the node mapping that results in the highest clause matching number
 		best_match_num: the highest clause matching number
+		found_idx: the restart at which we found the best mapping
+		smart_fscores: the number of matching clauses for the smart mappings
+		clause_pairs: dict with the (gold_idx, prod_idx) pairs of the matching clauses
+		search_stats: [memo hits, memo misses, memo evictions, whether we took the fast path for isomorphic DRSs,
+					   whether the search ran out of its time budget (-max_time) before it was done,
+					   number of restarts we did, whether we stopped the restarts early (-patience, -patience_seen),
+					   upper bound on the number of matching clauses (best_match_num if we know it is optimal)]
 
 	"""
 
+	# If the DRSs are the same up to variable renaming we have a perfect match without searching
+	# This is only possible if they have the same clause labels (the clauses with each variable replaced by its type)
+	prod_labels, gold_labels = prod_drs.get_clause_labels(), gold_drs.get_clause_labels()
+	isomorphic_match = get_isomorphic_match(prod_drs, gold_drs) if prod_labels == gold_labels else None
+	if isomorphic_match:
+		best_mapping, clause_pairs = isomorphic_match
+		smart_fscores = [prod_drs.total_clauses] if args.smart == 'conc' else []
+		return best_mapping, prod_drs.total_clauses, 0, smart_fscores, clause_pairs, [0, 0, 0, 1, 0, 0, 0, prod_drs.total_clauses]
+
+	# Cheap upper bound on the number of matching clauses: each clause can only match a clause with the same label
+	# If no clause can match at all, we do not have to search
+	upper_bound = sum((prod_labels & gold_labels).values())
+	if upper_bound == 0:
+		smart_fscores = [0] if args.smart == 'conc' else []
+		return [-1] * len(prod_drs.var_map), 0, 0, smart_fscores, {}, [0, 0, 0, 0, 0, 0, 0, 0]
+
+	# With a time budget, we return the best mapping so far when it is used up. It includes computing the pool
+	deadline = Search_deadline(args.max_time) if args.max_time > 0 else None
+
 	# Compute candidate pool - all possible node match candidates.
 	# In the hill-climbing, we only consider candidate in this pool to save computing time.
 	# weight_dict is a dictionary that maps a pair of node
-	(candidate_mappings, weight_dict) = compute_pool(prod_drs, gold_drs, args)
-	#for w in weight_dict:
-		#print w
-		#for x in weight_dict[w]:
-			#print x, weight_dict[w][x]
-		#print '\n'
+	if pool_cache is not None and (prod_drs, gold_drs) in pool_cache:
+		candidate_mappings, pool = pool_cache[(prod_drs, gold_drs)]
+	else:
+		(candidate_mappings, weight_dict) = compute_pool(prod_drs, gold_drs, args)
+		# Compile the pool to flat tables, after this we do not need weight_dict anymore
+		pool = DRS_pool(candidate_mappings, weight_dict, len(gold_drs.var_map), gold_drs.total_clauses, prod_drs.total_clauses)
+		del weight_dict
+		if pool_cache is not None:
+			pool_cache[(prod_drs, gold_drs)] = (candidate_mappings, pool)
 	# Save mapping and number of matches so that we don't have to calculate stuff twice
-	match_clause_dict = {}
+	match_clause_dict = Mapping_memo(args.mem_limit * 1000000)
 
 	# Set intitial values
 	best_match_num = 0
 	best_mapping = [-1] * len(prod_drs.var_map)
 	found_idx = 0
 
+	# Find the optimal mapping with branch-and-bound, if the produced DRS does not have too many variables
+	# If the search takes too long, we keep the best mapping so far and continue with the hill-climbing
+	if args.search == 'exact' and (args.exact_max_vars <= 0 or len(prod_drs.var_map) <= args.exact_max_vars):
+		best_mapping, best_match_num, smart_fscores, optimal = get_exact_match(prod_drs, gold_drs, candidate_mappings, pool, upper_bound, args, single, deadline)
+		if optimal:
+			_, clause_pairs = compute_match(best_mapping, pool, None, final=True)
+			return best_mapping, best_match_num, found_idx, smart_fscores, clause_pairs, match_clause_dict.stats() + [0, 0, 0, 0, best_match_num]
+
 	# Find smart mappings first, if specified
 	if args.smart == 'conc':
-		smart_conc = smart_concept_mapping(candidate_mappings, prod_drs.concepts, gold_drs.concepts)
-		matches, match_clause_dict = compute_match(smart_conc, weight_dict, match_clause_dict)
+		smart_conc = smart_concept_mapping(candidate_mappings, prod_drs, gold_drs, rng=rng)
+		matches, match_clause_dict = compute_match(smart_conc, pool, match_clause_dict)
 		smart_mappings = [[smart_conc, matches]]
 		smart_fscores = [0]
 	else:
 		smart_mappings = []
 		smart_fscores  = []
 
-	# Then add random mappings
-	mapping_order = smart_mappings + get_mapping_list(candidate_mappings, weight_dict, args.restarts - len(smart_fscores), match_clause_dict)
-	#mapping_order = [[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]]
+	def get_restarts(num_restarts):
+		random_maps = get_mapping_list(candidate_mappings, pool, num_restarts, match_clause_dict, rng)
+		# With a time budget we might not do all restarts, so start with the mappings that already match the most clauses
+		if deadline is not None:
+			random_maps.sort(key=lambda map_cur: -map_cur[1])
+		return random_maps
+
 	# Set initial values
 	done_mappings = {}
+	# The search object keeps track of the current mapping and matches, so we can compute gains incrementally
+	# The NumPy engine computes all gains at once, but only works if we can simply count the satisfied clause matches
+	if args.engine == 'numpy' and pool.linear:
+		from hill_climbing_numpy import DRS_search_numpy
+		search = DRS_search_numpy(pool)
+	else:
+		search = DRS_search(pool)
+	# Simulated annealing and tabu search need the gains of single operations, which only the Python engine has
+	if args.search in ['anneal', 'tabu']:
+		local_search = search if isinstance(search, DRS_search) else DRS_search(pool)
+	else:
+		local_search = None
+
+	# With -restart_parallel, worker processes do the random restarts of a large DRS pair. The loop below waits for
+	# their results in restart order, so that we stop at the same restart as when we do them one by one
+	workers = []
+
+	def add_restarts(num_restarts):
+		random_maps = get_restarts(num_restarts)
+		if restart_workers > 1 and len(random_maps) > 1:
+			workers.append(Restart_workers(search, local_search, random_maps, len(mapping_order), done_mappings, upper_bound,
+										   prod_drs.total_clauses, args, deadline, restart_workers))
+		mapping_order.extend(random_maps)
+
+	# Then add random mappings, but only after the smart mappings, since we do not need them if we reach the upper bound
+	mapping_order = smart_mappings[:]
+	if not smart_mappings:
+		add_restarts(args.restarts)
+	#mapping_order = [[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]]
+	# For early stopping we count the restarts in a row without a better mapping, and the restarts in a row that end
+	# in a local optimum we already found (done_mappings contains the local optima we found)
+	num_restarts, no_gain, seen_optima, early_stop = 0, 0, 0, 0
 	# Loop over the mappings to find the best score
-	for i, map_cur in enumerate(mapping_order):  # number of restarts is number of mappings
-		cur_mapping = map_cur[0]
-		match_num = map_cur[1]
-		num_vars = len(gold_drs.var_map)
-
-		if tuple(cur_mapping) in done_mappings:
-			match_num = done_mappings[tuple(cur_mapping)]
-		else:
-			# Do hill-climbing until there will be no gain for new node mapping
-			while True:
-				# get best gain
-				(gain, new_mapping, match_clause_dict) = get_best_gain(cur_mapping, candidate_mappings, weight_dict, num_vars, match_clause_dict)
-
-				if match_num + gain > prod_drs.total_clauses:
-					print(new_mapping, match_num + gain, prod_drs.total_clauses)
-					raise ValueError(
-						"More matches than there are produced clauses. If this ever occurs something is seriously wrong with the algorithm")
-
-				if gain <= 0:
-					# print 'No gain so break'
-					break
-				# otherwise update match_num and mapping
-				match_num += gain
-				cur_mapping = new_mapping[:]
-
-			# Save mappings we already did
-			done_mappings[tuple(cur_mapping)] = match_num
-
-			# Update our best match number so far
-			if match_num > best_match_num:
-				best_mapping = cur_mapping[:]
-				best_match_num = match_num
-				found_idx = i
-
-			# Check if we exceed maximum memory, if so, clear clause_dict
-			# (saves us from getting memory issues with high number of
-			# restarts)
-			if get_memory_usage() > args.mem_limit:
-				match_clause_dict.clear()
-
-		# If we have matched as much we can (precision 1.0), we might as well
-		# stop instead of doing all other restarts - but always do smart mappings
-		if match_num == prod_drs.total_clauses and i > len(smart_fscores) - 1:
-			if args.prin and single:
-				print('Best match already found, stop restarts at restart {0}'.format(i))
-			if i < len(smart_fscores):
+	try:
+		for i, map_cur in enumerate(mapping_order):  # number of restarts is number of mappings
+			# Always do the first restart, hill_climb stops by itself if there is no time left
+			if i > 0 and deadline is not None and deadline.check():
+				if args.prin and single:
+					print('Time budget of {0} seconds used up, stop restarts at restart {1}'.format(args.max_time, i))
+				break
+			num_restarts += 1
+			cur_mapping = map_cur[0]
+			match_num = map_cur[1]
+			improved = i == 0
+
+			if tuple(cur_mapping) in done_mappings:
+				match_num = done_mappings[tuple(cur_mapping)]
+				seen_optimum = True
+			else:
+				result = workers[-1].get(i) if workers else None
+				if result is not None:
+					# A worker did this restart
+					cur_mapping, match_num, passed = result
+					if passed:
+						deadline.passed = True
+				else:
+					cur_mapping, match_num = do_restart(search, local_search, cur_mapping, match_num, upper_bound, prod_drs.total_clauses, args, deadline)
+				seen_optimum = tuple(cur_mapping) in done_mappings
+
+				# Save mappings we already did, unless we did not finish the hill-climbing
+				if deadline is None or not deadline.passed:
+					done_mappings[tuple(cur_mapping)] = match_num
+
+				# Update our best match number so far
+				if match_num > best_match_num:
+					best_mapping = cur_mapping[:]
+					best_match_num = match_num
+					found_idx = i
+					improved = True
+
+			# If we have matched as much we can (the upper bound, at most precision 1.0), we might as well
+			# stop instead of doing all other restarts - but always do smart mappings
+			if match_num >= upper_bound and i >= len(smart_fscores) - 1:
+				if args.prin and single:
+					print('Best match already found (upper bound of {0} matching clauses), stop restarts at restart {1}'.format(upper_bound, i))
+				if i < len(smart_fscores):
+					smart_fscores[i] = match_num
+				break
+
+			# Add smart F-scores
+			if i < len(smart_fscores):  # are we still adding smart F-scores?
 				smart_fscores[i] = match_num
-			break
-
-		# Add smart F-scores
-		if i < len(smart_fscores):  # are we still adding smart F-scores?
-			smart_fscores[i] = match_num
 
-	_, clause_pairs = compute_match(best_mapping, weight_dict, {}, final=True)
-
-	# Clear matches out of memory
-	match_clause_dict.clear()
+			# Stop early if the restarts do not find better mappings anymore, but always do the smart mappings
+			no_gain = 0 if improved else no_gain + 1
+			seen_optima = seen_optima + 1 if seen_optimum else 0
+			if i >= len(smart_fscores) - 1 and ((args.patience > 0 and no_gain >= args.patience) or
+												(args.patience_seen > 0 and seen_optima >= args.patience_seen)):
+				if args.prin and single:
+					print('No better mapping in the last {0} restarts, {1} of them ended in a local optimum we already found, stop restarts at restart {2}'.format(
+						no_gain, seen_optima, i))
+				early_stop = 1
+				break
+			if i == len(smart_mappings) - 1:
+				add_restarts(args.restarts - len(smart_fscores))
+	finally:
+		# Stop the workers, also when we stopped the restarts early
+		for cur_workers in workers:
+			cur_workers.stop()
+
+	_, clause_pairs = compute_match(best_mapping, pool, None, final=True)
 	if len(set([x for x in best_mapping if x != -1])) != len([x for x in best_mapping if x != -1]):
 		raise ValueError("Variable maps to two other variables, not allowed, and should never happen -- {0}".format(best_mapping))
-	return best_mapping, best_match_num, found_idx, smart_fscores, clause_pairs,
+	# The search was only cut short if we did not reach the upper bound
+	budget_limited = 1 if deadline is not None and deadline.passed and best_match_num < upper_bound else 0
+	return best_mapping, best_match_num, found_idx, smart_fscores, clause_pairs, match_clause_dict.stats() + [0, budget_limited, num_restarts, early_stop, upper_bound]
 
 
-def add_random_mapping(result, matched_dict, candidate_mapping):
+def get_exact_match(prod_drs, gold_drs, candidate_mappings, pool, upper_bound, args, single, deadline=None):
+	"""
+	Get the highest clause match number between two sets of clauses via branch-and-bound (-search exact).
+	We first hill-climb from the (non-random) smart concept mapping, so the search starts with a good lower bound
+	Returns:
+		best_mapping: the node mapping that results in the highest clause matching number we found
+		best_match_num: the highest clause matching number we found
+		smart_fscores: number of matching clauses for the smart mapping (after hill-climbing)
+		optimal: whether the search finished within -exact_max_nodes and the time budget, so that best_mapping is optimal
+	"""
+	search = DRS_search(pool)
+	if args.smart == 'conc':
+		start_mapping = smart_concept_mapping(candidate_mappings, prod_drs, gold_drs, fill_random=False)
+	else:
+		start_mapping = [-1] * len(prod_drs.var_map)
+	match_num, _ = compute_match(start_mapping, pool, None, final=True)
+	start_mapping, match_num = hill_climb(search, start_mapping, match_num, prod_drs.total_clauses, deadline)
+	smart_fscores = [match_num] if args.smart == 'conc' else []
+	# No need to search if hill-climbing already reached the upper bound of the clause labels
+	if match_num >= upper_bound:
+		return start_mapping, match_num, smart_fscores, True
+	best_mapping, best_match_num, optimal, nodes = branch_and_bound(search, start_mapping, match_num, args.exact_max_nodes, deadline)
+	if args.prin and single:
+		stopped = ', stopped at -max_time' if deadline is not None and deadline.passed else ', stopped at -exact_max_nodes'
+		print('Branch-and-bound visited {0} nodes: {1} matching clauses after hill-climbing, {2} after branch-and-bound{3}'.format(
+			nodes, match_num, best_match_num, '' if optimal else stopped))
+	return best_mapping, best_match_num, smart_fscores, optimal
+
+
+def add_random_mapping(result, matched_dict, candidate_mapping, rng=random):
 	'''If mapping is still -1 after adding a smart mapping, randomly fill in the blanks'''
 	# First shuffle the way we loop over result, so that we increase the randomness of the mappings
 	indices = list(range(len(result)))
-	random.shuffle(indices)
+	rng.shuffle(indices)
 	for idx in indices:
 		if result[idx] == -1:  # no mapping yet
 			candidates = list(candidate_mapping[idx])
 			while len(candidates) > 0:
 				# get a random node index from candidates
-				rid = random.randint(0, len(candidates) - 1)
+				rid = rng.randint(0, len(candidates) - 1)
 				if candidates[rid] in matched_dict:
 					candidates.pop(rid)
 				else:
@@ -152,48 +745,50 @@ def add_random_mapping(result, matched_dict, candidate_mapping):
 	return result
 
 
-def smart_concept_mapping(candidate_mapping, concepts1, concepts2):
+def smart_concept_mapping(candidate_mapping, prod_drs, gold_drs, fill_random=True, rng=random):
 	"""
 	Initialize mapping based on the concept mapping (smart initialization)
 	Arguments:
 		candidate_mapping: candidate node match list
-		concepts1/2: list of concepts clauses: var1 concept "sense" var2
+		prod_drs/gold_drs: the DRSs, with their concept clauses: var1 concept "sense" var2
+		fill_random: whether we randomly map the variables that did not get a concept mapping
+		rng: random number generator for the random mappings (default the random module)
 	Returns:
 		smart initial mapping between two DRSs based on concepts
 	"""
 	matched_dict = {}
 	result = [-1] * len(candidate_mapping)
-	for conc1 in concepts1:
-		for conc2 in concepts2:
-			# Check if concept and sense matches
-			if conc1[1] == conc2[1] and conc1[2] == conc2[2]:
-				# If so, check if variables can match
-				var11, var12, var21, var22 = int(conc1[0][1:]), int(
-					conc1[3][1:]), int(conc2[0][1:]), int(conc2[3][1:])
-				if var21 in candidate_mapping[var11] and var22 in candidate_mapping[var12]:
-					# Match here, so add mapping if we didn't do so before
-					if result[var11] == -1 and var21 not in matched_dict:
-						result[var11] = var21
-						matched_dict[var21] = 1
-					if result[var12] == -1 and var22 not in matched_dict:
-						result[var12] = var22
-						matched_dict[var22] = 1		
+	# Only look at the concept clauses with the same concept and sense
+	for i, j in get_candidate_pairs(prod_drs.concepts, gold_drs.concepts, prod_drs, gold_drs, [1, 2], []):
+		conc1, conc2 = prod_drs.concepts[i], gold_drs.concepts[j]
+		# Check if the variables can match
+		var11, var12 = prod_drs.var_index[conc1[0]], prod_drs.var_index[conc1[3]]
+		var21, var22 = gold_drs.var_index[conc2[0]], gold_drs.var_index[conc2[3]]
+		if var21 in candidate_mapping[var11] and var22 in candidate_mapping[var12]:
+			# Match here, so add mapping if we didn't do so before
+			if result[var11] == -1 and var21 not in matched_dict:
+				result[var11] = var21
+				matched_dict[var21] = 1
+			if result[var12] == -1 and var22 not in matched_dict:
+				result[var12] = var22
+				matched_dict[var22] = 1		
 
 	# Randomly fill in the blanks for variables that did not have a smart concept mapping
-	result = add_random_mapping(result, matched_dict, candidate_mapping)
+	if fill_random:
+		result = add_random_mapping(result, matched_dict, candidate_mapping, rng)
 	return result
 
 
-def get_mapping_list(candidate_mappings, weight_dict, total_restarts, match_clause_dict):
+def get_mapping_list(candidate_mappings, pool, total_restarts, match_clause_dict, rng=random):
 	'''Function that returns a mapping list, each item being [mapping, match_num] '''
 
 	if total_restarts <= 0:  # nothing to do here, we do more smart mappings than restarts anyway
 		return []
-	random_maps = get_random_set(candidate_mappings, weight_dict, total_restarts, match_clause_dict)  # get set of random mappings here
+	random_maps = get_random_set(candidate_mappings, pool, total_restarts, match_clause_dict, rng)  # get set of random mappings here
 	return random_maps
 
 
-def get_random_set(candidate_mappings, weight_dict, map_ceil, match_clause_dict):
+def get_random_set(candidate_mappings, pool, map_ceil, match_clause_dict, rng=random):
 	'''Function that returns a set of random mappings based on candidate_mappings'''
 
 	random_maps = []
@@ -201,8 +796,8 @@ def get_random_set(candidate_mappings, weight_dict, map_ceil, match_clause_dict)
 
 	# only do random mappings we haven't done before, but if we have 50 duplicates in a row, we are probably done with all mappings
 	while len(random_maps) < map_ceil and count_duplicate <= 50:
-		cur_mapping = add_random_mapping([-1 for x in candidate_mappings], {}, candidate_mappings)
-		match_num, match_clause_dict = compute_match(cur_mapping, weight_dict, match_clause_dict)
+		cur_mapping = add_random_mapping([-1 for x in candidate_mappings], {}, candidate_mappings, rng)
+		match_num, match_clause_dict = compute_match(cur_mapping, pool, match_clause_dict)
 		if [cur_mapping, match_num] not in random_maps and len(set([x for x in cur_mapping if x != -1])) == len([x for x in cur_mapping if x != -1]):
 			random_maps.append([cur_mapping, match_num])
 			count_duplicate = 0
@@ -216,6 +811,31 @@ def normalize(item):
 	return item
 
 
+def get_clause_key(clause, drs, edge_numbers, var_numbers):
+	'''The items that have to be the same for two clauses to fully match: the edges (operator/role/concept and
+	   constants) and the types of the variables'''
+	return tuple([normalize(clause[idx]) for idx in edge_numbers] + [drs.type_vars[clause[idx]] for idx in var_numbers])
+
+
+def get_candidate_pairs(prod_clauses, gold_clauses, prod_drs, gold_drs, edge_numbers, var_numbers, partial=False):
+	'''Yield the (prod_idx, gold_idx) pairs of clauses that can match, in the same order as a loop over all pairs
+	   We put the gold clauses in buckets by their key, so that every produced clause only looks at the gold clauses it
+	   can fully match. Partial matching can match any two clauses, so then we still yield all pairs'''
+	if not prod_clauses or not gold_clauses:
+		return
+	if partial:
+		for i in range(len(prod_clauses)):
+			for j in range(len(gold_clauses)):
+				yield i, j
+		return
+	buckets = {}
+	for j, clause in enumerate(gold_clauses):
+		buckets.setdefault(get_clause_key(clause, gold_drs, edge_numbers, var_numbers), []).append(j)
+	for i, clause in enumerate(prod_clauses):
+		for j in buckets.get(get_clause_key(clause, prod_drs, edge_numbers, var_numbers), []):
+			yield i, j
+
+
 def add_node_pairs(node_pair1, node_pair2, node_pair3, weight_dict, weight_score, no_match, gold_clause_idx, prod_clause_idx):
 	'''Add possible node pairs to weight dict for node pair1'''
 
@@ -243,12 +863,12 @@ def add_candidate_mapping_three_vars(prod_clauses, gold_clauses, prod_drs, gold_
 	edge_match = 0
 
 	# Set values to make things a bit clearer
-	node1_index_drs1 = int(prod_clauses[i][index1][len(prod_drs.prefix):])
-	node1_index_drs2 = int(gold_clauses[j][index1][len(gold_drs.prefix):])
-	node2_index_drs1 = int(prod_clauses[i][index2][len(prod_drs.prefix):])
-	node2_index_drs2 = int(gold_clauses[j][index2][len(gold_drs.prefix):])
-	node3_index_drs1 = int(prod_clauses[i][index3][len(prod_drs.prefix):])
-	node3_index_drs2 = int(gold_clauses[j][index3][len(gold_drs.prefix):])
+	node1_index_drs1 = prod_drs.var_index[prod_clauses[i][index1]]
+	node1_index_drs2 = gold_drs.var_index[gold_clauses[j][index1]]
+	node2_index_drs1 = prod_drs.var_index[prod_clauses[i][index2]]
+	node2_index_drs2 = gold_drs.var_index[gold_clauses[j][index2]]
+	node3_index_drs1 = prod_drs.var_index[prod_clauses[i][index3]]
+	node3_index_drs2 = gold_drs.var_index[gold_clauses[j][index3]]
 
 	node_pair1 = (node1_index_drs1, node1_index_drs2)
 	node_pair2 = (node2_index_drs1, node2_index_drs2)
@@ -438,80 +1058,75 @@ def map_two_vars_edges(clauses_prod, clauses_gold, prod_drs, gold_drs, edge_numb
 	'''Function that updates weight_dict and candidate mappings for clauses with 2 variable and 1 or 2 edges
 	   clause looks like: (var1, edge, var2) or (var1, edge, var2, "constant") or (var1, edge, "constant", var2)'''
 
-	# Make things a bit more readable
-	prefix1 = prod_drs.prefix
-	prefix2 = gold_drs.prefix
-
-	# Try different mappings
-	for i in range(0, len(clauses_prod)):
-		for j in range(0, len(clauses_gold)):
-			# Set values to make things a bit easier
-			node1_index_drs1 = int(clauses_prod[i][var_index1][len(prefix1):])
-			node1_index_drs2 = int(clauses_gold[j][var_index1][len(prefix2):])
-			node2_index_drs1 = int(clauses_prod[i][var_index2][len(prefix1):])
-			node2_index_drs2 = int(clauses_gold[j][var_index2][len(prefix2):])
-			
-			# Set other params
-			allowed_var1, allowed_var2, same_edge_type = False, False, False
-			edge_match, const_match = 0, 0  # default is no match
-
-			# First check if nodes are even allowed to match, based on the type
-			# of the variables (e.g. b1 can never match to x1)
-			if prod_drs.type_vars[clauses_prod[i][var_index1]] == gold_drs.type_vars[clauses_gold[j][var_index1]]:
-				allowed_var1 = True
-			if prod_drs.type_vars[clauses_prod[i][var_index2]] == gold_drs.type_vars[clauses_gold[j][var_index2]]:
-				allowed_var2 = True
-
-			# Then do the (partial) matching
-			if not args.partial:
-				# If there is more than 1 edge number, it should match, else it is allowed anyway
-				if len(edge_numbers) > 1 and not normalize(clauses_prod[i][edge_numbers[1]]) == normalize(clauses_gold[j][edge_numbers[1]]):
-					allowed_edge = False
-				else:
-					allowed_edge = True
-
-				# We do not do partial matching, normal case -- everything should match
-				if allowed_var1 and allowed_var2 and allowed_edge and normalize(clauses_prod[i][edge_numbers[0]]) == normalize(clauses_gold[j][edge_numbers[0]]):
-					weight_score = 1    # clause matches for 1
-					no_match = ''       # since we do not partial matching no_match is empty
-					candidate_mapping, weight_dict = add_candidate_mapping(candidate_mapping, weight_dict, weight_score, node1_index_drs1, node1_index_drs2,
-																			node2_index_drs1, node2_index_drs2, no_match, j + add_to_index, i + add_to_index2, args)
+	# Try the mappings of the clauses that can match
+	for i, j in get_candidate_pairs(clauses_prod, clauses_gold, prod_drs, gold_drs, edge_numbers, [var_index1, var_index2], args.partial):
+		# Set values to make things a bit easier
+		node1_index_drs1 = prod_drs.var_index[clauses_prod[i][var_index1]]
+		node1_index_drs2 = gold_drs.var_index[clauses_gold[j][var_index1]]
+		node2_index_drs1 = prod_drs.var_index[clauses_prod[i][var_index2]]
+		node2_index_drs2 = gold_drs.var_index[clauses_gold[j][var_index2]]
+		
+		# Set other params
+		allowed_var1, allowed_var2, same_edge_type = False, False, False
+		edge_match, const_match = 0, 0  # default is no match
+
+		# First check if nodes are even allowed to match, based on the type
+		# of the variables (e.g. b1 can never match to x1)
+		if prod_drs.type_vars[clauses_prod[i][var_index1]] == gold_drs.type_vars[clauses_gold[j][var_index1]]:
+			allowed_var1 = True
+		if prod_drs.type_vars[clauses_prod[i][var_index2]] == gold_drs.type_vars[clauses_gold[j][var_index2]]:
+			allowed_var2 = True
+
+		# Then do the (partial) matching
+		if not args.partial:
+			# If there is more than 1 edge number, it should match, else it is allowed anyway
+			if len(edge_numbers) > 1 and not normalize(clauses_prod[i][edge_numbers[1]]) == normalize(clauses_gold[j][edge_numbers[1]]):
+				allowed_edge = False
 			else:
-				# Do partial matching
-				# Check if edge is of the same type (e.g. both concepts, both roles, both operators)
-				if same_edge_type_check(clauses_prod[i][edge_numbers[0]], clauses_gold[j][edge_numbers[0]]):
-					same_edge_type = True
-					# Clause of the same type can always partially match, but
-					# we have to check if they share the same concept/role, if
-					# they do we add a higher value
-					if normalize(clauses_prod[i][edge_numbers[0]]) == normalize(clauses_gold[j][edge_numbers[0]]):
-						edge_match = 1 / float(len(clauses_prod[0]))  # edge match results in an increase of 0.25 or 0.33
-
-				if len(edge_numbers) > 1:  # also a constant
-					if normalize(clauses_prod[i][edge_numbers[1]]) == normalize(clauses_gold[j][edge_numbers[1]]):
-						const_match = 1 / float(len(clauses_prod[0]))  # const match results in an increase of 0.25 or 0.33
-
-				# Actually update the weight dictionary here
-				if allowed_var1 and same_edge_type:  # add for single variable match
-
-					# Add that other node pair can not match if we do this
-					# single partial matching
-					no_match = ((int(clauses_prod[i][var_index2][1:]), int(clauses_gold[j][var_index2][1:])),)
-					weight_score = 1 / float(len(clauses_prod[0])) + edge_match + const_match
-					candidate_mapping, weight_dict = add_single_var_mapping(int(clauses_prod[i][var_index1][1:]), int(clauses_gold[j][var_index1][1:]), candidate_mapping, weight_dict, weight_score, no_match, j + add_to_index, i + add_to_index2)
-
-				if allowed_var2 and same_edge_type:  # add for single variable match
-					# Add that var1 can not match if we do this single partial matching
-					no_match = ((int(clauses_prod[i][var_index1][1:]), int(clauses_gold[j][var_index1][1:])),)
-					weight_score = 1 / float(len(clauses_prod[0])) + edge_match + const_match
-					candidate_mapping, weight_dict = add_single_var_mapping(int(clauses_prod[i][var_index2][1:]), int(clauses_gold[j][var_index2][1:]), candidate_mapping, weight_dict, weight_score, no_match, j + add_to_index, i + add_to_index2)
-
-				# Add for two variables that have to match  - no match is empty
-				# since we only have two variables here
-				if allowed_var1 and allowed_var1 and same_edge_type:
-					no_match = ''
-					weight_score = 2 / float(len(clauses_prod[0])) + edge_match + const_match
-					candidate_mapping, weight_dict = add_candidate_mapping(candidate_mapping, weight_dict, weight_score, node1_index_drs1, node1_index_drs2, node2_index_drs1, node2_index_drs2, no_match, j + add_to_index, i + add_to_index2, args)
+				allowed_edge = True
+
+			# We do not do partial matching, normal case -- everything should match
+			if allowed_var1 and allowed_var2 and allowed_edge and normalize(clauses_prod[i][edge_numbers[0]]) == normalize(clauses_gold[j][edge_numbers[0]]):
+				weight_score = 1    # clause matches for 1
+				no_match = ''       # since we do not partial matching no_match is empty
+				candidate_mapping, weight_dict = add_candidate_mapping(candidate_mapping, weight_dict, weight_score, node1_index_drs1, node1_index_drs2,
+																		node2_index_drs1, node2_index_drs2, no_match, j + add_to_index, i + add_to_index2, args)
+		else:
+			# Do partial matching
+			# Check if edge is of the same type (e.g. both concepts, both roles, both operators)
+			if same_edge_type_check(clauses_prod[i][edge_numbers[0]], clauses_gold[j][edge_numbers[0]]):
+				same_edge_type = True
+				# Clause of the same type can always partially match, but
+				# we have to check if they share the same concept/role, if
+				# they do we add a higher value
+				if normalize(clauses_prod[i][edge_numbers[0]]) == normalize(clauses_gold[j][edge_numbers[0]]):
+					edge_match = 1 / float(len(clauses_prod[0]))  # edge match results in an increase of 0.25 or 0.33
+
+			if len(edge_numbers) > 1:  # also a constant
+				if normalize(clauses_prod[i][edge_numbers[1]]) == normalize(clauses_gold[j][edge_numbers[1]]):
+					const_match = 1 / float(len(clauses_prod[0]))  # const match results in an increase of 0.25 or 0.33
+
+			# Actually update the weight dictionary here
+			if allowed_var1 and same_edge_type:  # add for single variable match
+
+				# Add that other node pair can not match if we do this
+				# single partial matching
+				no_match = ((prod_drs.var_index[clauses_prod[i][var_index2]], gold_drs.var_index[clauses_gold[j][var_index2]]),)
+				weight_score = 1 / float(len(clauses_prod[0])) + edge_match + const_match
+				candidate_mapping, weight_dict = add_single_var_mapping(prod_drs.var_index[clauses_prod[i][var_index1]], gold_drs.var_index[clauses_gold[j][var_index1]], candidate_mapping, weight_dict, weight_score, no_match, j + add_to_index, i + add_to_index2)
+
+			if allowed_var2 and same_edge_type:  # add for single variable match
+				# Add that var1 can not match if we do this single partial matching
+				no_match = ((prod_drs.var_index[clauses_prod[i][var_index1]], gold_drs.var_index[clauses_gold[j][var_index1]]),)
+				weight_score = 1 / float(len(clauses_prod[0])) + edge_match + const_match
+				candidate_mapping, weight_dict = add_single_var_mapping(prod_drs.var_index[clauses_prod[i][var_index2]], gold_drs.var_index[clauses_gold[j][var_index2]], candidate_mapping, weight_dict, weight_score, no_match, j + add_to_index, i + add_to_index2)
+
+			# Add for two variables that have to match  - no match is empty
+			# since we only have two variables here
+			if allowed_var1 and allowed_var1 and same_edge_type:
+				no_match = ''
+				weight_score = 2 / float(len(clauses_prod[0])) + edge_match + const_match
+				candidate_mapping, weight_dict = add_candidate_mapping(candidate_mapping, weight_dict, weight_score, node1_index_drs1, node1_index_drs2, node2_index_drs1, node2_index_drs2, no_match, j + add_to_index, i + add_to_index2, args)
 
 	return candidate_mapping, weight_dict
 
@@ -520,43 +1135,42 @@ def add_mapping_role_two_abs(prod_drs, gold_drs, weight_dict, candidate_mapping,
 	'''Add a candidate mapping for a role clause with two constant items
 	   Clause looks like: b1 Role "item1" "item2" '''
 	minus_count = -1
-	for i in range(0, len(prod_drs.roles_two_abs)):
-		for j in range(0, len(gold_drs.roles_two_abs)): 
-			var_index = 0 
-			if not args.partial:
-				# Check if all the other values match (Role, "item1", "item2")
-				if normalize(prod_drs.roles_two_abs[i][1]) == normalize(gold_drs.roles_two_abs[j][1]) and normalize(prod_drs.roles_two_abs[i][2]) == normalize(gold_drs.roles_two_abs[j][2]) and normalize(prod_drs.roles_two_abs[i][3]) == normalize(gold_drs.roles_two_abs[j][3]):
-					# We have a match here, add mapping and weights
-					node1_index = int(prod_drs.roles_two_abs[i][var_index][len(prod_drs.prefix):])
-					node2_index = int(gold_drs.roles_two_abs[j][var_index][len(gold_drs.prefix):])
-					candidate_mapping[node1_index].add(node2_index)
-					node_pair = (node1_index, node2_index)
-					# use a minus count as key in weight_dict for roles_two_abs
-					if node_pair not in weight_dict:
-						weight_dict[node_pair] = {}
-					weight_dict[node_pair][minus_count] = [[1, '', add_to_index_gold + j, add_to_index_prod + i]]
-					minus_count -= 1
-			# Do partial matching here
-			else:
-				partial_value = 1 / len(prod_drs.roles_two_abs[0]) 
-				total_match = partial_value
-				# Update partial matching score if one of the absolute values match
-				if normalize(prod_drs.roles_two_abs[i][1]) == normalize(gold_drs.roles_two_abs[j][1]):
-					total_match += partial_value
-				if normalize(prod_drs.roles_two_abs[i][2]) == normalize(gold_drs.roles_two_abs[j][2]):  
-					total_match += partial_value
-				if  normalize(prod_drs.roles_two_abs[i][3]) == normalize(gold_drs.roles_two_abs[j][3]): 
-					total_match += partial_value
+	for i, j in get_candidate_pairs(prod_drs.roles_two_abs, gold_drs.roles_two_abs, prod_drs, gold_drs, [1, 2, 3], [], args.partial):
+		var_index = 0 
+		if not args.partial:
+			# Check if all the other values match (Role, "item1", "item2")
+			if normalize(prod_drs.roles_two_abs[i][1]) == normalize(gold_drs.roles_two_abs[j][1]) and normalize(prod_drs.roles_two_abs[i][2]) == normalize(gold_drs.roles_two_abs[j][2]) and normalize(prod_drs.roles_two_abs[i][3]) == normalize(gold_drs.roles_two_abs[j][3]):
 				# We have a match here, add mapping and weights
-				node1_index = int(prod_drs.roles_two_abs[i][var_index][len(prod_drs.prefix):])
-				node2_index = int(gold_drs.roles_two_abs[j][var_index][len(gold_drs.prefix):])
+				node1_index = prod_drs.var_index[prod_drs.roles_two_abs[i][var_index]]
+				node2_index = gold_drs.var_index[gold_drs.roles_two_abs[j][var_index]]
 				candidate_mapping[node1_index].add(node2_index)
 				node_pair = (node1_index, node2_index)
-				# Update weight dictionary here
+				# use a minus count as key in weight_dict for roles_two_abs
 				if node_pair not in weight_dict:
 					weight_dict[node_pair] = {}
-				weight_dict[node_pair][minus_count] = [total_match, '', add_to_index_gold + j, add_to_index_prod + i]
+				weight_dict[node_pair][minus_count] = [[1, '', add_to_index_gold + j, add_to_index_prod + i]]
 				minus_count -= 1
+		# Do partial matching here
+		else:
+			partial_value = 1 / len(prod_drs.roles_two_abs[0]) 
+			total_match = partial_value
+			# Update partial matching score if one of the absolute values match
+			if normalize(prod_drs.roles_two_abs[i][1]) == normalize(gold_drs.roles_two_abs[j][1]):
+				total_match += partial_value
+			if normalize(prod_drs.roles_two_abs[i][2]) == normalize(gold_drs.roles_two_abs[j][2]):  
+				total_match += partial_value
+			if  normalize(prod_drs.roles_two_abs[i][3]) == normalize(gold_drs.roles_two_abs[j][3]): 
+				total_match += partial_value
+			# We have a match here, add mapping and weights
+			node1_index = prod_drs.var_index[prod_drs.roles_two_abs[i][var_index]]
+			node2_index = gold_drs.var_index[gold_drs.roles_two_abs[j][var_index]]
+			candidate_mapping[node1_index].add(node2_index)
+			node_pair = (node1_index, node2_index)
+			# Update weight dictionary here
+			if node_pair not in weight_dict:
+				weight_dict[node_pair] = {}
+			weight_dict[node_pair][minus_count] = [total_match, '', add_to_index_gold + j, add_to_index_prod + i]
+			minus_count -= 1
 	return candidate_mapping, weight_dict           
 
 
@@ -599,9 +1213,8 @@ def compute_pool(prod_drs, gold_drs, args):
 	candidate_mapping, weight_dict = map_two_vars_edges(prod_drs.op_two_vars_abs2, gold_drs.op_two_vars_abs2, prod_drs, gold_drs, [1, 3], candidate_mapping, weight_dict, 0, 2, len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1),  len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1), args)
 
 	# Clause looks like (var1, OPR, var2, var3)
-	for i in range(0, len(prod_drs.op_three_vars)):
-		for j in range(0, len(gold_drs.op_three_vars)):
-			candidate_mapping, weight_dict = add_candidate_mapping_three_vars(prod_drs.op_three_vars, gold_drs.op_three_vars, prod_drs, gold_drs, candidate_mapping, weight_dict, i, j,  len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1) + len(gold_drs.op_two_vars_abs2),  len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1) + len(prod_drs.op_two_vars_abs2), args)
+	for i, j in get_candidate_pairs(prod_drs.op_three_vars, gold_drs.op_three_vars, prod_drs, gold_drs, [1], [0, 2, 3], args.partial):
+		candidate_mapping, weight_dict = add_candidate_mapping_three_vars(prod_drs.op_three_vars, gold_drs.op_three_vars, prod_drs, gold_drs, candidate_mapping, weight_dict, i, j,  len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1) + len(gold_drs.op_two_vars_abs2),  len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1) + len(prod_drs.op_two_vars_abs2), args)
 
 	# Clause looks like (var1, Role, "item1", "item2")
 	candidate_mapping, weight_dict = add_mapping_role_two_abs(prod_drs, gold_drs, weight_dict, candidate_mapping, len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1) + len(gold_drs.op_two_vars_abs2) + len(gold_drs.op_three_vars), len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1) + len(prod_drs.op_two_vars_abs2) + len(prod_drs.op_three_vars), args)
@@ -612,9 +1225,8 @@ def compute_pool(prod_drs, gold_drs, args):
 	# Clause looks like (var1, Role, var2, "item")
 	candidate_mapping, weight_dict = map_two_vars_edges(prod_drs.roles_abs2, gold_drs.roles_abs2, prod_drs, gold_drs, [1, 3], candidate_mapping, weight_dict, 0, 2, len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1) + len(gold_drs.op_two_vars_abs2) + len(gold_drs.op_three_vars) + len(gold_drs.roles_two_abs) + len(gold_drs.roles_abs1),  len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1) + len(prod_drs.op_two_vars_abs2) + len(prod_drs.op_three_vars) + len(prod_drs.roles_two_abs) + len(prod_drs.roles_abs1), args)
 	# Clause looks like (var1, Role, var2, var3)
-	for i in range(0, len(prod_drs.roles)):
-		for j in range(0, len(gold_drs.roles)):
-			candidate_mapping, weight_dict = add_candidate_mapping_three_vars(prod_drs.roles, gold_drs.roles, prod_drs, gold_drs, candidate_mapping, weight_dict, i, j, len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1) + len(gold_drs.op_two_vars_abs2) + len(gold_drs.roles_two_abs) + len(gold_drs.roles_abs1) + len(gold_drs.roles_abs2) + len(gold_drs.op_three_vars),  len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1) + len(prod_drs.op_two_vars_abs2) + len(prod_drs.roles_two_abs) + len(prod_drs.roles_abs1) + len(prod_drs.roles_abs2) + len(prod_drs.op_three_vars), args)
+	for i, j in get_candidate_pairs(prod_drs.roles, gold_drs.roles, prod_drs, gold_drs, [1], [0, 2, 3], args.partial):
+		candidate_mapping, weight_dict = add_candidate_mapping_three_vars(prod_drs.roles, gold_drs.roles, prod_drs, gold_drs, candidate_mapping, weight_dict, i, j, len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1) + len(gold_drs.op_two_vars_abs2) + len(gold_drs.roles_two_abs) + len(gold_drs.roles_abs1) + len(gold_drs.roles_abs2) + len(gold_drs.op_three_vars),  len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1) + len(prod_drs.op_two_vars_abs2) + len(prod_drs.roles_two_abs) + len(prod_drs.roles_abs1) + len(prod_drs.roles_abs2) + len(prod_drs.op_three_vars), args)
 
 	# Clause looks like (var1, concept, "sns", var2)
 	candidate_mapping, weight_dict = map_two_vars_edges(prod_drs.concepts, gold_drs.concepts, prod_drs, gold_drs, [1, 2], candidate_mapping, weight_dict, 0, 3, len(gold_drs.op_two_vars) + len(gold_drs.op_two_vars_abs1) + len(gold_drs.op_two_vars_abs2) + len(gold_drs.roles_two_abs) + len(gold_drs.roles_abs1) + len(gold_drs.roles_abs2) + len(gold_drs.op_three_vars) + len(gold_drs.roles),  len(prod_drs.op_two_vars) + len(prod_drs.op_two_vars_abs1) + len(prod_drs.op_two_vars_abs2) + len(prod_drs.roles_two_abs) + len(prod_drs.roles_abs1) + len(prod_drs.roles_abs2) + len(prod_drs.op_three_vars) + len(prod_drs.roles), args)
@@ -622,99 +1234,9 @@ def compute_pool(prod_drs, gold_drs, args):
 
 
 
-def get_best_gain(mapping, candidate_mappings, weight_dict, num_vars, match_clause_dict):
-	"""
-	Hill-climbing method to return the best gain swap/move can get
-	Arguments:
-	mapping: current node mapping
-	candidate_mappings: the candidates mapping list
-	weight_dict: the weight dictionary
-	num_vars: the number of the nodes in DRG 2
-	Returns:
-	the best gain we can get via swap/move operation
+def compute_match(mapping, pool, match_clause_dict, final=False):
 	"""
-	
-	largest_gain = 0
-	# True: using swap; False: using move
-	use_swap = False
-	use_move = False
-	# the node to be moved/swapped
-	node1 = None
-	# store the other node affected. In swap, this other node is the node swapping with node1. In move, this other
-	# node is the node node1 will move to.
-	node2 = None
-	# unmatched nodes in DRG 2
-	unmatched = set(range(0, num_vars))
-	# exclude nodes in current mapping
-	# get unmatched nodes
-	for nid in mapping:
-		if nid in unmatched:
-			unmatched.remove(nid)
-
-	matches, match_clause_dict = compute_match(mapping, weight_dict, match_clause_dict)
-	old_match_num = matches  #the number of matches we have for our current mapping
-
-	## compute move gain ##
-
-	for i, nid in enumerate(mapping):
-		# current node i in DRG 1 maps to node nid in DRG 2
-		for nm in unmatched:
-			if nm in candidate_mappings[i]:
-				# remap i to another unmatched node (move)
-				# (i, m) -> (i, nm)
-				new_mapping = mapping[:]
-				new_mapping[i] = nm
-				## Check if the mapping does not result in a double mapping
-				if len(set([x for x in new_mapping if x != -1])) == len([x for x in new_mapping if x != -1]):
-					matches, match_clause_dict = compute_match(new_mapping, weight_dict, match_clause_dict)
-					new_match_num = matches
-					mv_gain = new_match_num - old_match_num
-
-					if mv_gain > largest_gain: #new best gain
-						largest_gain = mv_gain
-						node1 = i
-						node2 = nm
-						use_move = True
-
-	## compute swap gain ##
-
-	for i, m in enumerate(mapping):
-		for j in range(i+1, len(mapping)):
-			m2 = mapping[j]
-			# swap operation (i, m) (j, m2) -> (i, m2) (j, m)
-			# j starts from i+1, to avoid duplicate swap
-
-			new_mapping = mapping[:]
-			new_mapping[i] = m2
-			new_mapping[j] = m
-			## Check if the mapping does not result in a double mapping
-			if len(set([x for x in new_mapping if x != -1])) == len([x for x in new_mapping if x != -1]):
-				matches, match_clause_dict = compute_match(new_mapping, weight_dict, match_clause_dict)
-				new_match_num = matches
-				sw_gain = new_match_num - old_match_num
-
-				if sw_gain > largest_gain: #new best swap gain
-					largest_gain = sw_gain
-					node1, node2 = i, j
-					use_swap = True
-
-	# generate a new mapping based on swap/move
-
-	cur_mapping = mapping[:]
-	if node1 is not None:
-		if use_swap:
-			temp = cur_mapping[node1]
-			cur_mapping[node1] = cur_mapping[node2]
-			cur_mapping[node2] = temp
-		elif use_move:
-			cur_mapping[node1] = node2
-
-	return largest_gain, cur_mapping, match_clause_dict
-
-
-def compute_match(mapping, weight_dict, match_clause_dict, final=False):
-	"""
-	Given a node mapping, compute match number based on weight_dict.
+	Given a node mapping, compute match number based on the compiled pool.
 	Args:
 	mappings: a list of node index in DRG 2. The ith element (value j) means node i in DRG 1 maps to node j in DRG 2.
 	Returns:
@@ -722,137 +1244,50 @@ def compute_match(mapping, weight_dict, match_clause_dict, final=False):
 	Complexity: O(m*n) , m is the node number of DRG 1, n is the node number of DRG 2
 
 	"""
-	if tuple(mapping) in match_clause_dict:
-		return match_clause_dict[tuple(mapping)], match_clause_dict
-	
-	# Initialize class to save all information in
-	drs_match = DRS_match()
-	drs_match.mapping = mapping
-	drs_match.weight_dict = weight_dict
+	if not final:
+		memo_key = match_clause_dict.key(mapping)
+		match_num = match_clause_dict.get(memo_key)
+		if match_num is not None:
+			return match_num, match_clause_dict
+
+	# Each gold and produced clause can only match once, we keep track of that in the scratch lists of the pool
+	pool.stamp += 1
+	stamp = pool.stamp
+	gold_used, prod_used, key_used = pool.gold_used, pool.prod_used, pool.key_used
+	num_vars = pool.num_vars
+	clause_pairs = {}
+	match_num = 0
 
-	for i, m in enumerate(drs_match.mapping):
+	for i, m in enumerate(mapping):
 		if m == -1:
 			# no node maps to this node
 			continue
 		# node i in DRG 1 maps to node m in DRG 2
-		current_node_pair = (i, m)
-		if current_node_pair not in drs_match.weight_dict:
-			continue
-		for key in drs_match.weight_dict[current_node_pair]:
-			drs_match = compute_match_for_key(key, current_node_pair, drs_match) #return number of matches here
+		pair_idx = i * num_vars + m
+		for entry in range(pool.entry_start[pair_idx], pool.entry_start[pair_idx + 1]):
+			# already matched, don't do again - e.g. if we matched (0,0),(1,1) we don't want to also match (1,1), (0,0)
+			if key_used[pool.entry_key[entry]] == stamp:
+				continue
+			# check if the other nodes of the clause also match
+			matches = True
+			for req in range(pool.entry_req_start[entry], pool.entry_req_start[entry + 1]):
+				if mapping[pool.req_prod[req]] != pool.req_gold[req]:
+					matches = False
+					break
+			if matches:
+				key_used[pool.entry_key[entry]] = stamp
+				for idx in range(pool.entry_clause_start[entry], pool.entry_clause_start[entry + 1]):
+					gold_idx, prod_idx = pool.entry_gold[idx], pool.entry_prod[idx]
+					if gold_used[gold_idx] != stamp and prod_used[prod_idx] != stamp:
+						gold_used[gold_idx] = stamp
+						prod_used[prod_idx] = stamp
+						match_num += 1
+						if final:
+							clause_pairs[gold_idx, prod_idx] = 1
 
-	# update match_clause_dict
-	match_clause_dict[tuple(mapping)] = drs_match.match_num
 	if final:
-		return drs_match.match_num, drs_match.clause_pairs
-	else:
-		return drs_match.match_num, match_clause_dict
-
-
-def check_dict_for_adding(drs_match, item):
-	'''Only add value to our score if it is a better match for this clause
-	   Each gold clause can only (partially) match once'''
-
-	if item[2] in drs_match.clause_dict_gold and item[3] in drs_match.clause_dict_prod:
-		#we already have a match for this gold clause AND produced clause, only add if this is a better match in total (and substract previous score)
-		total_gain = (item[0] - drs_match.clause_dict_gold[item[2]]) + (item[0] - drs_match.clause_dict_prod[item[3]])
-		if total_gain > 0:
-			drs_match.clause_dict_gold[item[2]] = item[0]
-			drs_match.clause_dict_prod[item[3]] = item[0]
-			## Remove and add the items from our clause pairs so that we can easily find the matching parts later
-			drs_match.clause_pairs[item[2], item[3]] = 1
-			drs_match.match_num += (float(total_gain) / 2) #divide by 2 otherwise we add double
-		else: #not an improvement, do nothing
-			pass
-	elif item[2] in drs_match.clause_dict_gold:
-		#only gold item is already in our dict, so check if adding this clause instead gains us something
-		if item[0] > drs_match.clause_dict_gold[item[2]]:
-			drs_match.match_num += (item[0] - drs_match.clause_dict_gold[item[2]])
-			drs_match.clause_dict_gold[item[2]] = item[0] #keep track of new value
-			## Remove previous gold item from clause pairs (if there) and add new one
-			to_delete = []
-			for key in drs_match.clause_pairs:
-				if key[0] == drs_match.clause_dict_gold[item[2]]:
-					to_delete.append(key)
-			for t in to_delete:
-				del drs_match.clause_pairs[t]
-
-
-			drs_match.clause_pairs[item[2], item[3]] = 1
-		else:
-			#this gold clause has already matched and this match is not an improvement, so we do nothing
-			pass
-
-	elif item[3] in drs_match.clause_dict_prod:
-		#only prod clause is already matched, check if adding this clause instead gains us something
-		if item[0] > drs_match.clause_dict_prod[item[3]]:
-			drs_match.match_num += (item[0] - drs_match.clause_dict_prod[item[3]])
-			drs_match.clause_dict_prod[item[3]] = item[0] #keep track of new value
-
-			## Remove previous gold item from clause pairs (if there) and add new one
-			to_delete = []
-			for key in drs_match.clause_pairs:
-				if key[1] == drs_match.clause_dict_prod[item[3]]:
-					to_delete.append(key)
-			for t in to_delete:
-				del drs_match.clause_pairs[t]
-			#clause_pairs[clause_dict_gold[item[2]],clause_dict_prod[item[3]]] = 1
-			drs_match.clause_pairs[item[2], item[3]] = 1
-		else:
-			pass
+		return match_num, clause_pairs
 	else:
-		#this clause hasn't matched yet, just add score and save
-		drs_match.match_num += item[0]
-		drs_match.clause_dict_gold[item[2]] = item[0]
-		drs_match.clause_dict_prod[item[3]] = item[0]
-		drs_match.clause_pairs[item[2], item[3]] = 1
-	return drs_match
-
-
-def get_matches(current_node_pair, key, drs_match):
-	'''Add specific number, but make sure to only to do that if we are allowed to match (given no match)
-	   clause_dict_gold contains all gold clauses (by index) that already had a (partial) match
-	   Have to keep track of this to not match gold clauses for more than 1'''
-
-	for item in drs_match.weight_dict[current_node_pair][key]: #item looks like this [score, tuple of node pairs, gold_clause_idx, prod_clause_idx] e.g. [0.75, ((2,4), (3,5)), 4, 6]
-		if item[1]:                                  #sometimes no_match is empty, then just add
-			add = True
-			for tup in item[1]:                      #tuple of tuples
-				if drs_match.mapping[tup[0]] == tup[1]:        #variable matches while it should not match to add score
-					add = False
-			if add:
-				drs_match = check_dict_for_adding(drs_match, item) #only add if this is a better match
-		else:
-			drs_match = check_dict_for_adding(drs_match, item)
-	return drs_match
-
-
-def compute_match_for_key(key, current_node_pair, drs_match):
-	'''Compute the matches based on the key'''
-	#start with 0 and add when we find matches
-	if isinstance(key, int) and key < 0:
-		# matching clauses resulting from roles_two_abs clauses
-		drs_match = get_matches(current_node_pair, key, drs_match)
-
-	elif not any(isinstance(inst, tuple) for inst in key):  #not a list of tuple but just a tuple
-		# key looks like this: (2,3)
-		sorted_t = (key,) + (current_node_pair,)
-		sorted_tuple = tuple(sorted(sorted_t, key=lambda item: item[0]))
-
-		if sorted_tuple in drs_match.matched_clause_keys: #already matched, don't do again - e.g. if we matched (0,0),(1,1) we don't want to also match (1,1), (0,0), because they match the same clause
-			pass
-		elif drs_match.mapping[key[0]] == key[1]:        #variable matches, check how much we want to add
-			drs_match = get_matches(current_node_pair, key, drs_match)
-			drs_match.matched_clause_keys[sorted_tuple] = 1
-	else:
-		#tuple of tuples here for tuples with 3 variables
-		#key looks like this: ((2,3), (3,4), (4,7))
-		sorted_t = key + (current_node_pair,)
-		sorted_tuple = tuple(sorted(sorted_t, key=lambda item: item[0]))
-		if sorted_tuple in drs_match.matched_clause_keys:   #already matched, don't do again - e.g. if we matched (0,0),(1,1),(2,2) we don't want to also match (1,1), (0,0),(2,2), because they match the same clause
-			pass
-		else:
-			if drs_match.mapping[key[0][0]] == key[0][1] and drs_match.mapping[key[1][0]] == key[1][1]: #both nodes also match
-				drs_match = get_matches(current_node_pair, key, drs_match)
-				drs_match.matched_clause_keys[sorted_tuple] = 1
-	return drs_match
+		# update match_clause_dict
+		match_clause_dict.add(memo_key, match_num)
+		return match_num, match_clause_dict
@@ -0,0 +1,125 @@
+'''Module with a NumPy version of the hill-climbing search (-engine numpy)
+   Instead of trying each move and swap separately, the gain of all legal moves and swaps is computed at once'''
+
+import numpy as np
+
+
+class DRS_search_numpy:
+	'''Same interface as DRS_search in hill_climbing.py, but computes the gains in a vectorized way.
+	   The clause matches of the pool are encoded as arrays of slots: each slot is a node pair (prod_var, gold_var)
+	   that a clause match needs. Only works for pools in which the number of matching clauses is the number of
+	   clause matches that are satisfied (pool.linear), which is true for almost all DRS pairs'''
+	def __init__(self, pool):
+		self.pool = pool
+		self.num_vars = pool.num_vars
+		self.num_prod_vars = len(pool.candidates)
+		slot_match, slot_prod, slot_gold, slot_pos = [], [], [], []
+		num_matches = 0
+		for pairs in pool.match_pairs:
+			prod_vars = [pair_idx // self.num_vars for pair_idx in pairs]
+			gold_vars = [pair_idx % self.num_vars for pair_idx in pairs]
+			# Matches that need a variable to map to two variables can never be satisfied, skip them
+			if len(set(prod_vars)) != len(prod_vars) or len(set(gold_vars)) != len(gold_vars):
+				continue
+			for pos in range(len(pairs)):
+				slot_match.append(num_matches)
+				slot_prod.append(prod_vars[pos])
+				slot_gold.append(gold_vars[pos])
+				slot_pos.append(pos)
+			num_matches += 1
+		self.num_matches = num_matches
+		self.slot_match = np.array(slot_match, dtype=np.int64)
+		self.slot_prod = np.array(slot_prod, dtype=np.int64)
+		self.slot_gold = np.array(slot_gold, dtype=np.int64)
+		self.match_size = np.bincount(self.slot_match, minlength=num_matches)
+		# Index of the node pair in the flattened (num_prod_vars, num_vars + 1) gain matrix, the last column means no mapping
+		self.slot_flat = self.slot_prod * (self.num_vars + 1) + self.slot_gold
+
+		# All pairs of slots (s1, s2) of the same clause match, and the remaining third slot (-1 if there is none)
+		pair1, pair2, pair3 = [], [], []
+		slot_idx = 0
+		for size in self.match_size:
+			slots = list(range(slot_idx, slot_idx + size))
+			for a in range(size):
+				for b in range(a + 1, size):
+					pair1.append(slots[a])
+					pair2.append(slots[b])
+					rest = [s for s in slots if s not in [slots[a], slots[b]]]
+					pair3.append(rest[0] if rest else -1)
+			slot_idx += size
+		self.pair1 = np.array(pair1, dtype=np.int64)
+		self.pair2 = np.array(pair2, dtype=np.int64)
+		self.pair3 = np.array(pair3, dtype=np.int64)
+		low = np.minimum(self.slot_prod[self.pair1], self.slot_prod[self.pair2])
+		high = np.maximum(self.slot_prod[self.pair1], self.slot_prod[self.pair2])
+		self.pair_flat = low * self.num_prod_vars + high
+
+		# Moves are only allowed to candidates, swaps only for i < j
+		self.candidate_mask = np.zeros((self.num_prod_vars, self.num_vars), dtype=bool)
+		for i, cands in enumerate(pool.candidates):
+			self.candidate_mask[i, cands] = True
+		self.upper = np.triu(np.ones((self.num_prod_vars, self.num_prod_vars), dtype=bool), k=1)
+		self.set_mapping([-1] * self.num_prod_vars)
+
+	def set_mapping(self, mapping):
+		'''Reset the search state to a new mapping'''
+		self.mapping = list(mapping)
+		self.update_state()
+
+	def update_state(self):
+		'''Compute which slots and clause matches are satisfied for the current mapping'''
+		self.map_array = np.array(self.mapping, dtype=np.int64)
+		self.slot_sat = self.map_array[self.slot_prod] == self.slot_gold
+		self.unsat = self.match_size - np.bincount(self.slot_match, weights=self.slot_sat, minlength=self.num_matches).astype(np.int64)
+		self.match_sat = self.unsat == 0
+		self.match_num = int(self.match_sat.sum())
+
+	def get_best_gain(self):
+		'''Return the best gain swap/move can get, and the operation itself (use_swap, node1, node2)
+		   Ties are broken in the same way as DRS_search.get_best_gain, so both engines give the same results'''
+		n, num_vars = self.num_prod_vars, self.num_vars
+		if n == 0 or self.num_matches == 0:
+			return 0, None
+		# Clause matches that become satisfied by setting the node pair of a slot, given that all other slots stay satisfied
+		others_ok = (self.unsat[self.slot_match] - ~self.slot_sat) == 0
+		add = np.bincount(self.slot_flat, weights=others_ok, minlength=n * (num_vars + 1)).astype(np.int64).reshape(n, num_vars + 1)
+		# Satisfied clause matches we lose by changing the mapping of a produced variable
+		loss = np.bincount(self.slot_prod, weights=self.match_sat[self.slot_match], minlength=n).astype(np.int64)
+
+		## compute move gain ##
+		free = np.ones(num_vars, dtype=bool)
+		free[self.map_array[self.map_array != -1]] = False
+		move_gain = add[:, :num_vars] - loss[:, None]
+		move_gain[~(self.candidate_mask & free[None, :])] = -1
+		move_idx = int(np.argmax(move_gain))
+		largest_gain = int(move_gain.flat[move_idx])
+		best_op = (False, move_idx // num_vars, move_idx % num_vars) if largest_gain > 0 else None
+		largest_gain = max(largest_gain, 0)
+
+		## compute swap gain ##
+		# swap operation (i, m) (j, m2) -> (i, m2) (j, m): gain of i moving to m2 and j moving to m, corrected
+		# for clause matches that contain both i and j
+		mapped = np.where(self.map_array == -1, num_vars, self.map_array)
+		cross = add[:, mapped]
+		prod1, prod2 = self.slot_prod[self.pair1], self.slot_prod[self.pair2]
+		third_sat = np.where(self.pair3 >= 0, self.slot_sat[self.pair3], True)
+		both_new = (mapped[prod2] == self.slot_gold[self.pair1]) & (mapped[prod1] == self.slot_gold[self.pair2]) & third_sat
+		both_old = self.match_sat[self.slot_match[self.pair1]]
+		both = np.bincount(self.pair_flat, weights=both_new.astype(np.int64) + both_old, minlength=n * n).astype(np.int64).reshape(n, n)
+		both = both + both.T
+		swap_gain = cross + cross.T + both - loss[:, None] - loss[None, :]
+		swap_gain[~self.upper] = -1
+		swap_idx = int(np.argmax(swap_gain))
+		if swap_gain.flat[swap_idx] > largest_gain:
+			largest_gain = int(swap_gain.flat[swap_idx])
+			best_op = (True, swap_idx // n, swap_idx % n)
+		return largest_gain, best_op
+
+	def do_operation(self, operation):
+		'''Perform a move or swap as returned by get_best_gain'''
+		use_swap, node1, node2 = operation
+		if use_swap:
+			self.mapping[node1], self.mapping[node2] = self.mapping[node2], self.mapping[node1]
+		else:
+			self.mapping[node1] = node2
+		self.update_state()
@@ -0,0 +1,106 @@
+'''Module with local search strategies that can escape the local optima of the hill-climbing (-search anneal and
+   -search tabu). They use the move/swap neighbourhood of DRS_search.get_operations and compute the gains of the
+   operations incrementally with the same DRS_search object, so they work on the pool of compute_pool'''
+
+import math
+import random
+
+# Default number of simulated annealing steps per produced variable. Each step only computes the gain of one operation,
+# so this is less work than the hill-climbing of a restart, which computes the gains of all operations in each iteration
+ANNEAL_STEPS_PER_VAR = 200
+
+
+def get_random_operation(search, rng=random):
+	'''Return a random operation of the neighbourhood (see DRS_search.get_operations) that changes the gold variable
+	   of a random produced variable, None if there is no such operation'''
+	operations = list(search.get_operations([rng.randrange(len(search.mapping))]))
+	return rng.choice(operations) if operations else None
+
+
+def simulated_annealing(search, mapping, upper_bound, start_temp, end_temp, steps, deadline=None, rng=random):
+	"""
+	Simulated annealing from mapping: each step we try a random operation, which we always do if it does not lose
+	matching clauses and otherwise with probability exp(gain / temperature). The temperature cools down geometrically
+	from start_temp to end_temp
+	Arguments:
+		search: DRS_search object of the DRS pair
+		mapping: mapping we start from
+		upper_bound: we stop if we reach this number of matching clauses
+		start_temp, end_temp: temperature of the first and of the last step
+		steps: number of steps, 0 means ANNEAL_STEPS_PER_VAR steps per produced variable
+		deadline: Search_deadline of the time budget of the DRS pair (None means no budget)
+		rng: random number generator for the operations and for accepting them (default the random module)
+	Returns:
+		the best mapping we found and its number of matching clauses
+	"""
+	search.set_mapping(mapping)
+	best_mapping, best_match_num = search.mapping[:], search.match_num
+	num_pairs = sum(len(cands) for cands in search.candidates)
+	if not num_pairs:
+		return best_mapping, best_match_num
+	steps = steps or ANNEAL_STEPS_PER_VAR * len(search.mapping)
+	temperature = start_temp
+	cooling = (float(end_temp) / start_temp) ** (1.0 / steps)
+	for step in range(steps):
+		if best_match_num >= upper_bound or (deadline is not None and step % 64 == 0 and deadline.check()):
+			break
+		operation = get_random_operation(search, rng)
+		if operation is None:
+			continue
+		gain = search.get_gain(operation)
+		if gain >= 0 or rng.random() < math.exp(gain / temperature):
+			search.do_operation(operation)
+			if search.match_num > best_match_num:
+				best_mapping, best_match_num = search.mapping[:], search.match_num
+		temperature *= cooling
+	return best_mapping, best_match_num
+
+
+def tabu_search(search, mapping, upper_bound, tenure, max_no_gain, deadline=None):
+	"""
+	Tabu search from mapping: each iteration we do the best operation of the neighbourhood, also if it loses matching
+	clauses. Operations that give a produced variable a gold variable it had in the last tenure iterations are tabu,
+	unless they give a better mapping than the best so far
+	Arguments:
+		search: DRS_search object of the DRS pair
+		mapping: mapping we start from
+		upper_bound: we stop if we reach this number of matching clauses
+		tenure: number of iterations an old node pair stays tabu
+		max_no_gain: we stop after this many iterations without a better mapping than the best so far
+		deadline: Search_deadline of the time budget of the DRS pair (None means no budget)
+	Returns:
+		the best mapping we found and its number of matching clauses
+	"""
+	search.set_mapping(mapping)
+	best_mapping, best_match_num = search.mapping[:], search.match_num
+	tabu = {}  # (produced variable, gold variable) -> last iteration in which the node pair is tabu
+	iteration, no_gain = 0, 0
+	while no_gain < max_no_gain and best_match_num < upper_bound:
+		if deadline is not None and deadline.check():
+			break
+		iteration += 1
+		best_op, best_gain = None, None
+		for operation in search.get_operations():
+			gain = search.get_gain(operation)
+			if best_gain is not None and gain <= best_gain:
+				continue
+			use_swap, node1, node2 = operation
+			new_pairs = [(node1, search.mapping[node2]), (node2, search.mapping[node1])] if use_swap else [(node1, node2)]
+			# Aspiration: a tabu operation is still allowed if it gives the best mapping so far
+			if any(tabu.get(pair, 0) >= iteration for pair in new_pairs) and search.match_num + gain <= best_match_num:
+				continue
+			best_op, best_gain = operation, gain
+		if best_op is None:
+			break
+		use_swap, node1, node2 = best_op
+		old_pairs = [(node1, search.mapping[node1]), (node2, search.mapping[node2])] if use_swap else [(node1, search.mapping[node1])]
+		search.do_operation(best_op)
+		for pair in old_pairs:
+			if pair[1] != -1:
+				tabu[pair] = iteration + tenure
+		if search.match_num > best_match_num:
+			best_mapping, best_match_num = search.mapping[:], search.match_num
+			no_gain = 0
+		else:
+			no_gain += 1
+	return best_mapping, best_match_num
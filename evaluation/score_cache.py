@@ -0,0 +1,68 @@
+'''Module with a cache for the results of the search for the best mapping of DRS pairs (-cache)
+   The results are saved in an SQLite database, keyed by a hash of the clauses of the DRS pair and the options that
+   influence the score, so that if we re-evaluate a new checkpoint we only have to search the pairs that changed'''
+
+import hashlib
+import json
+import sqlite3
+
+from hill_climbing import LRU_cache
+
+
+class Score_cache:
+	'''Cache of search results for DRS pairs. The last args.cache_max results are saved in memory, so that identical DRS
+	   pairs in the same run are usually only searched once, and all results in an SQLite database if we specified a file.
+	   Results that were removed from memory are then read back from the database'''
+	def __init__(self, args, signature, file_name=''):
+		# Options that influence the best mapping, the other options only change the output
+		options = [args.restarts, args.smart, args.search, args.exact_max_vars, args.exact_max_nodes, args.partial,
+				args.include_ref, args.default_sense, args.default_role, args.default_concept, signature]
+		# Only add the options for the time budget, early stopping and the restart budget if we use them, so that the
+		# keys stay the same otherwise
+		if args.max_time > 0 or args.patience > 0 or args.patience_seen > 0 or args.restart_budget > 0:
+			options += [args.max_time, args.patience, args.patience_seen, args.restart_budget]
+		if args.search in ['anneal', 'tabu']:
+			options += [args.anneal_start, args.anneal_end, args.anneal_steps, args.tabu_tenure, args.tabu_iters]
+		self.options = json.dumps(options, sort_keys=True)
+		self.results = LRU_cache(args.cache_max)
+		self.hits, self.added = 0, 0
+		self.conn = None
+		if file_name:
+			# The scoring service uses the cache from another thread than the one that created it, never at the same time
+			self.conn = sqlite3.connect(file_name, check_same_thread=False)
+			self.conn.execute('CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, result TEXT)')
+
+	def key(self, prod_clauses, gold_clauses):
+		'''Hash of the clauses of the DRS pair and the options'''
+		return hashlib.sha1((self.options + json.dumps([prod_clauses, gold_clauses])).encode('utf-8')).hexdigest()
+
+	def get(self, key):
+		'''Return the saved search result of a key, or None if we did not see it yet'''
+		if key in self.results:
+			return self.results[key]
+		if self.conn:
+			row = self.conn.execute('SELECT result FROM scores WHERE key = ?', (key,)).fetchone()
+			if row:
+				self.results[key] = json.loads(row[0])
+				return self.results[key]
+		return None
+
+	def add(self, key, result):
+		'''Save the search result of a key'''
+		self.results[key] = result
+		self.added += 1
+		if self.conn:
+			self.conn.execute('INSERT OR REPLACE INTO scores VALUES (?, ?)', (key, json.dumps(result)))
+
+	def replace(self, key, result):
+		'''Replace the search result of a key, e.g. by a better one after the extra restarts of -restart_budget'''
+		self.results[key] = result
+		if self.conn:
+			self.conn.execute('INSERT OR REPLACE INTO scores VALUES (?, ?)', (key, json.dumps(result)))
+
+	def close(self):
+		'''Write the new results to the database'''
+		if self.conn:
+			self.conn.commit()
+			self.conn.close()
+			self.conn = None
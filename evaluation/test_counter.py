@@ -0,0 +1,46 @@
+'''Tests for counter.py on a part of the PMB data: with -seed the scores of the DRS pairs do not depend on -p'''
+
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from clf_parser import read_clfs
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(EVAL_DIR), 'data', 'pmb-2.1.0')
+NUM_DRSS = 60
+
+
+@pytest.fixture(scope='module')
+def drs_files(tmpdir_factory):
+	'''The first DRSs of the Boxer output and of the gold DRSs of the PMB dev set'''
+	tmpdir = tmpdir_factory.mktemp('drss')
+	files = []
+	for name, file_name in [('prod', 'boxer_parse_dev.txt'), ('gold', os.path.join('gold', 'dev.txt'))]:
+		clfs = list(read_clfs(os.path.join(DATA_DIR, file_name)))[:NUM_DRSS]
+		files.append(str(tmpdir.join(name + '.txt')))
+		with io.open(files[-1], 'w', encoding='utf-8') as out_f:
+			out_f.write(u''.join(u'\n'.join(clf.original) + u'\n\n' for clf in clfs))
+	return files
+
+
+def run_counter(drs_files, tmpdir, *options):
+	'''Run counter.py and return the (match, prod, gold) counts of each DRS pair'''
+	pytest.importorskip('wordnet_dict_en')
+	ms_file = str(tmpdir.join('scores.txt'))
+	env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+	subprocess.check_call([sys.executable, 'counter.py', '-f1', drs_files[0], '-f2', drs_files[1], '-g', 'clf_signature.yaml',
+						   '-ill', 'score', '-r', '2', '-ms_file', ms_file, '-al'] + list(options),
+						  cwd=EVAL_DIR, env=env, stdout=subprocess.DEVNULL)
+	with open(ms_file) as in_f:
+		return in_f.read().split('\n')
+
+
+def test_seed_same_scores_with_workers(drs_files, tmpdir):
+	parallel_scores = run_counter(drs_files, tmpdir, '-seed', '3', '-p', '2')
+	assert len(parallel_scores) == NUM_DRSS + 1
+	assert run_counter(drs_files, tmpdir, '-seed', '3', '-p', '2') == parallel_scores
+	assert run_counter(drs_files, tmpdir, '-seed', '3') == parallel_scores
@@ -0,0 +1,56 @@
+'''Tests for the scoring API of counter_api.py: with -seed the scores of the DRS pairs do not depend on -p, the
+   random module of the caller is left alone and open scorers can not have a different -keep_max'''
+
+import os
+import random
+
+import pytest
+
+from clf_parser import read_clfs
+from counter_api import Counter_scorer, get_options
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(EVAL_DIR), 'data', 'pmb-2.1.0')
+NUM_DRSS = 40
+
+
+def read_drss(file_name):
+	return ['\n'.join(clf.original) for clf in list(read_clfs(os.path.join(DATA_DIR, file_name)))[:NUM_DRSS]]
+
+
+def get_scores(parallel, seed=3):
+	scorer = Counter_scorer(get_options(sig_file=os.path.join(EVAL_DIR, 'clf_signature.yaml'), ill='score', restarts=2, seed=seed, parallel=parallel))
+	try:
+		scores = scorer.score_pairs(read_drss('boxer_parse_dev.txt'), read_drss(os.path.join('gold', 'dev.txt')))
+	finally:
+		scorer.close()
+	return scores.match.tolist()
+
+
+def test_seed_same_scores_with_workers():
+	pytest.importorskip('wordnet_dict_en')
+	scores = get_scores(1)
+	assert len(scores) == NUM_DRSS
+	assert get_scores(1) == scores
+	assert get_scores(2) == scores
+
+
+def test_seed_leaves_random_module_alone():
+	pytest.importorskip('wordnet_dict_en')
+	random.seed(12)
+	expected = random.random()
+	random.seed(12)
+	get_scores(1)
+	assert random.random() == expected
+
+
+def test_other_keep_max_refused():
+	pytest.importorskip('wordnet_dict_en')
+	scorer = Counter_scorer(get_options(sig_file=os.path.join(EVAL_DIR, 'clf_signature.yaml'), keep_max=10))
+	try:
+		with pytest.raises(ValueError, match='keep_max'):
+			get_options(keep_max=20)
+		assert get_options(keep_max=10).keep_max == 10
+	finally:
+		scorer.close()
+	assert get_options(keep_max=20).keep_max == 20
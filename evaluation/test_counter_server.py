@@ -0,0 +1,135 @@
+'''Tests for the scoring service of counter_server.py: Request_batcher with a fake scorer, and the service itself on a
+   temporary Unix socket, used through Counter_client'''
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from counter_server import Counter_client, Request_batcher
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DOG = 'b1 REF x1\nb1 dog "n.01" x1'
+CAT = [['b1', 'REF', 'x1'], ['b1', 'cat', '"n.01"', 'x1']]
+DOG_BARKS = 'b1 REF x1\nb1 dog "n.01" x1\nb1 REF e1\nb1 bark "v.01" e1\nb1 Agent e1 x1'
+
+
+class Fake_scorer:
+	'''Scorer that counts the characters of the pairs and remembers the batches it got, it fails on pairs with "bad"'''
+	def __init__(self):
+		self.batches = []
+
+	def count_pairs(self, pairs):
+		self.batches.append(list(pairs))
+		if 'bad' in pairs:
+			raise ValueError('bad pair')
+		return [(len(pair), len(pair), len(pair), 0) for pair in pairs]
+
+
+def run_batcher(scorer, requests, wait=0.05):
+	'''Send the requests (lists of pairs) to a Request_batcher at the same time, return the results or exceptions'''
+	async def run():
+		batcher = Request_batcher(scorer, wait)
+		batch_task = asyncio.ensure_future(batcher.run())
+		try:
+			return await asyncio.gather(*[batcher.score(pairs) for pairs in requests], return_exceptions=True)
+		finally:
+			batch_task.cancel()
+	return asyncio.run(run())
+
+
+def test_batcher_batches_concurrent_requests():
+	scorer = Fake_scorer()
+	results = run_batcher(scorer, [['a'], ['bb', 'ccc'], ['dddd']])
+	assert scorer.batches == [['a', 'bb', 'ccc', 'dddd']]
+	assert results == [[(1, 1, 1, 0)], [(2, 2, 2, 0), (3, 3, 3, 0)], [(4, 4, 4, 0)]]
+
+
+def test_batcher_error_only_for_failing_request():
+	scorer = Fake_scorer()
+	results = run_batcher(scorer, [['a'], ['bad', 'bb'], ['ccc']])
+	# The batch fails, then the requests are scored one by one
+	assert scorer.batches == [['a', 'bad', 'bb', 'ccc'], ['a'], ['bad', 'bb'], ['ccc']]
+	assert results[0] == [(1, 1, 1, 0)]
+	assert isinstance(results[1], ValueError)
+	assert results[2] == [(3, 3, 3, 0)]
+
+
+@pytest.fixture(scope='module')
+def socket_path(tmpdir_factory):
+	'''Start the service on a temporary Unix socket, it needs the WordNet sense dict of counter.py'''
+	pytest.importorskip('wordnet_dict_en')
+	path = str(tmpdir_factory.mktemp('server').join('counter.sock'))
+	env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+	service = subprocess.Popen([sys.executable, 'counter_server.py', '-socket', path, '-g', 'clf_signature.yaml', '-ill', 'score',
+								'-wait', '200'], cwd=EVAL_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	try:
+		for _ in range(600):
+			if os.path.exists(path) or service.poll() is not None:
+				break
+			time.sleep(0.1)
+		if not os.path.exists(path):
+			pytest.fail('Scoring service did not start: {0}'.format(service.communicate()[0]))
+		yield path
+	finally:
+		service.terminate()
+		service.wait()
+
+
+def test_round_trip(socket_path):
+	client = Counter_client(socket_path=socket_path, timeout=60)
+	try:
+		response = client.score([(DOG, DOG), (DOG, CAT), (DOG_BARKS, DOG)])
+	finally:
+		client.close()
+	pairs = response['pairs']
+	assert [(pair['match'], pair['prod'], pair['gold']) for pair in pairs] == [(1, 1, 1), (0, 1, 1), (1, 3, 1)]
+	assert pairs[0]['f_score'] == 1.0 and pairs[1]['f_score'] == 0.0
+	assert [response['total'][name] for name in ['match', 'prod', 'gold', 'budget_limited']] == [2, 5, 3, 0]
+
+
+def test_malformed_request_in_batch(socket_path):
+	'''Requests that arrive together are batched, a malformed one gets an error without breaking the others'''
+	requests = [[(DOG, DOG)], 'not json', [(DOG, CAT, DOG)], [(DOG_BARKS, DOG), (DOG, DOG)]]
+	responses = [None] * len(requests)
+	start = threading.Barrier(len(requests))
+
+	def send(idx):
+		client = Counter_client(socket_path=socket_path, timeout=60)
+		try:
+			start.wait()
+			if requests[idx] == 'not json':
+				client.sock.sendall(b'{"pairs": [\n')
+				responses[idx] = ValueError(json.loads(client.in_f.readline().decode('utf-8'))['error'])
+			else:
+				responses[idx] = client.score(requests[idx])
+		except ValueError as e:
+			responses[idx] = e
+		finally:
+			client.close()
+
+	threads = [threading.Thread(target=send, args=(idx,)) for idx in range(len(requests))]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert [pair['match'] for pair in responses[0]['pairs']] == [1]
+	assert isinstance(responses[1], ValueError) and 'JSONDecodeError' in str(responses[1])
+	assert isinstance(responses[2], ValueError) and 'does not contain two DRSs' in str(responses[2])
+	assert [pair['match'] for pair in responses[3]['pairs']] == [1, 1]
+
+
+def test_connection_usable_after_error(socket_path):
+	client = Counter_client(socket_path=socket_path, timeout=60)
+	try:
+		with pytest.raises(ValueError):
+			client.score([(DOG,)])
+		assert client.score([(CAT, CAT)])['total']['f_score'] == 1.0
+	finally:
+		client.close()
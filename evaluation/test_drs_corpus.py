@@ -0,0 +1,58 @@
+'''Tests for the binary corpus format of drs_corpus.py: the arrays are little-endian on every machine and files
+   without their byte order and item sizes in the header are refused'''
+
+import json
+import os
+import struct
+
+import pytest
+
+from drs_corpus import MAGIC, DRS_corpus, write_corpus
+
+SIGNATURE = {'REF': {'arity': 1}}
+DRSS = [([('b1', 'REF', 'x1'), ('b1', 'dog', '"n.01"', 'x1')], ['b1 REF x1', 'b1 dog "n.01" x1'], [False, False], None),
+		([('b2', 'REF', 'x1')], ['b2 REF x1 % ill-formed'], [False], 'no box condition')]
+
+
+def write_file(tmpdir, name='drs.drsc'):
+	file_name = os.path.join(str(tmpdir), name)
+	write_corpus(file_name, DRSS, SIGNATURE)
+	return file_name
+
+
+def read_file(file_name):
+	corpus = DRS_corpus(file_name, SIGNATURE)
+	try:
+		return [corpus.get(num) for num in range(len(corpus))]
+	finally:
+		corpus.close()
+
+
+def test_same_drss(tmpdir):
+	assert read_file(write_file(tmpdir)) == [(list(clauses), original, redundant, error) for clauses, original, redundant, error in DRSS]
+
+
+def test_little_endian(tmpdir):
+	'''The arrays are little-endian whatever the byte order of the machine, starting with the DRS starts'''
+	with open(write_file(tmpdir), 'rb') as in_f:
+		data = in_f.read()
+	header_end = data.index(b'\n', len(MAGIC)) + 1
+	assert data[header_end:header_end + 24] == struct.pack('<3q', 0, 2, 3)
+
+
+@pytest.mark.parametrize('key', ['byteorder', 'item_sizes'])
+def test_other_layout_refused(tmpdir, key):
+	'''Files written with another byte order or other item sizes have to be converted again'''
+	file_name = write_file(tmpdir)
+	with open(file_name, 'rb') as in_f:
+		data = in_f.read()
+	header_end = data.index(b'\n', len(MAGIC)) + 1
+	header = json.loads(data[len(MAGIC):header_end].decode('utf-8'))
+	if key == 'byteorder':
+		header[key] = 'big'
+	else:
+		header[key] = dict((name, 2 * size) for name, size in header[key].items())
+	with open(file_name, 'wb') as out_f:
+		out_f.write(MAGIC + json.dumps(header).encode('utf-8') + b'\n' + data[header_end:])
+	with pytest.raises(ValueError, match='convert it again'):
+		DRS_corpus(file_name, SIGNATURE)
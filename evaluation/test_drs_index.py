@@ -0,0 +1,79 @@
+'''Tests for the byte-offset index of drs_index.py: the indexed DRSs should be the same as those of clf_parser.read_clfs'''
+
+import io
+import os
+
+from clf_parser import parse_block, read_clfs
+from drs_index import DRS_file, get_index_file, load_index, loaded_indexes
+
+DRS_LINES = ['% Sentence: 12',
+			 '% Raw sent: A dog barks.',
+			 '',
+			 'b1 REF x1          % A [0...1]',
+			 'b1 dog "n.01" x1   % dog [2...5]',
+			 '',
+			 '%%% Comment-only block in the middle',
+			 '',
+			 '',
+			 'b2 REF e1          % barks [6...11]',
+			 'b2 bark "v.01" e1  % barks [6...11]',
+			 '',
+			 '% Sentence: 13',
+			 'b3 REF x2',
+			 '',
+			 '% Trailing comments without clauses',
+			 '']
+
+
+def write_drs_file(tmpdir, lines, name='drs.txt'):
+	file_name = os.path.join(str(tmpdir), name)
+	with io.open(file_name, 'w', encoding='utf-8') as out_f:
+		out_f.write('\n'.join(lines))
+	return file_name
+
+
+def get_indexed_clfs(file_name, index_dir=''):
+	drs_file = DRS_file(file_name, index_dir)
+	try:
+		return [parse_block(drs_file.get_lines(num), num + 1) for num in range(len(drs_file))]
+	finally:
+		drs_file.close()
+
+
+def check_same_clfs(file_name, index_dir=''):
+	expected, indexed = list(read_clfs(file_name)), get_indexed_clfs(file_name, index_dir)
+	assert len(indexed) == len(expected)
+	for clf, exp in zip(indexed, expected):
+		assert (clf.clauses, clf.original, clf.raw, clf.sent_id, clf.num) == (exp.clauses, exp.original, exp.raw, exp.sent_id, exp.num)
+	return indexed
+
+
+def test_comment_only_blocks(tmpdir):
+	'''Blocks with only comments belong to the next DRS, so it keeps its sentence ID and raw text'''
+	clfs = check_same_clfs(write_drs_file(tmpdir, DRS_LINES))
+	assert [clf.sent_id for clf in clfs] == [12, None, 13]
+	assert clfs[0].raw == 'A dog barks.'
+	assert clfs[1].raw == 'Comment-only block in the middle'
+
+
+def test_no_newline_at_end(tmpdir):
+	clfs = check_same_clfs(write_drs_file(tmpdir, DRS_LINES[:-3]))
+	assert len(clfs) == 3
+
+
+def test_index_not_saved(tmpdir):
+	'''Without an index directory, nothing is written next to the DRS file'''
+	file_name = write_drs_file(tmpdir, DRS_LINES)
+	load_index(file_name)
+	assert os.listdir(str(tmpdir)) == ['drs.txt']
+
+
+def test_saved_index(tmpdir):
+	'''The index is saved in the index directory, the next process reads it from there and gets the same offsets'''
+	file_name = write_drs_file(tmpdir, DRS_LINES)
+	index_dir = os.path.join(str(tmpdir), 'indexes')
+	offsets = load_index(file_name, index_dir)
+	assert os.listdir(index_dir) == [os.path.basename(get_index_file(file_name, index_dir))]
+	loaded_indexes.clear()
+	assert load_index(file_name, index_dir) == offsets
+	check_same_clfs(file_name, index_dir)
@@ -0,0 +1,42 @@
+'''Tests for the score cache of score_cache.py: at most -cache_max results in memory, the rest is read back from SQLite'''
+
+import os
+
+from counter_api import get_options
+from score_cache import Score_cache
+
+
+def get_result(num):
+	return {'match_num': num, 'prod_clauses': num, 'gold_clauses': num}
+
+
+def fill_cache(score_cache, num_pairs):
+	keys = [score_cache.key([['b1', 'REF', 'x{0}'.format(num)]], []) for num in range(num_pairs)]
+	for num, key in enumerate(keys):
+		score_cache.add(key, get_result(num))
+	return keys
+
+
+def test_memory_limit():
+	score_cache = Score_cache(get_options(cache_max=2), {})
+	keys = fill_cache(score_cache, 3)
+	assert len(score_cache.results) == 2
+	assert score_cache.get(keys[0]) is None
+	assert score_cache.get(keys[2]) == get_result(2)
+	# keys[1] is now the least recently used result
+	score_cache.add(keys[0], get_result(0))
+	assert score_cache.get(keys[1]) is None
+	assert score_cache.get(keys[2]) == get_result(2)
+
+
+def test_evicted_results_from_sqlite(tmpdir):
+	file_name = os.path.join(str(tmpdir), 'scores.db')
+	score_cache = Score_cache(get_options(cache_max=2), {}, file_name)
+	keys = fill_cache(score_cache, 5)
+	assert len(score_cache.results) == 2
+	assert [score_cache.get(key) for key in keys] == [get_result(num) for num in range(5)]
+	score_cache.close()
+	# A new cache reads all of them from the file
+	score_cache = Score_cache(get_options(cache_max=2), {}, file_name)
+	assert [score_cache.get(key) for key in keys] == [get_result(num) for num in range(5)]
+	score_cache.close()
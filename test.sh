@@ -12,6 +12,15 @@ python clf_referee.py ../data/$REL/gold/dev.txt
 python counter.py -f1 ../data/$REL/gold/dev.txt -f2 ../data/$REL/gold/dev.txt -g clf_signature.yaml
 # More restarts, no smart initialization
 python counter.py -f1 ../data/$REL/gold/dev.txt -f2 ../data/$REL/gold/dev.txt -r 20 -s no -g clf_signature.yaml
+# NumPy engine for the hill-climbing, with a fixed seed (same results as the default python engine)
+python counter.py -f1 ../data/$REL/gold/dev.txt -f2 ../data/$REL/gold/dev.txt -engine numpy -seed 1 -g clf_signature.yaml
+# Exact search for the optimal mapping with branch-and-bound
+python counter.py -f1 ../data/$REL/gold/dev.txt -f2 ../data/$REL/gold/dev.txt -search exact -g clf_signature.yaml
+# Pre-parsed binary gold file, saves parsing and validating it each time
+python drs_corpus.py ../data/$REL/gold/dev.txt -g clf_signature.yaml -o /tmp/dev.txt.drsc
+python counter.py -f1 ../data/$REL/gold/dev.txt -f2 /tmp/dev.txt.drsc -g clf_signature.yaml
+# Several systems against the same gold file, prints a table with the scores of each system
+python counter.py -f1 ../data/$REL/gold/dev.txt ../data/$REL/gold/dev.txt -f2 ../data/$REL/gold/dev.txt -g clf_signature.yaml
 # 4 parallel threads
 python counter.py -f1 ../data/$REL/gold/dev.txt -f2 ../data/$REL/gold/dev.txt -p 4 -s no -g clf_signature.yaml
 # Print specific output